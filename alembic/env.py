@@ -23,7 +23,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database import Base
+from database import Base, SQLALCHEMY_DATABASE_URL
 # ⚠️ Importa explícitamente todos los modelos que quieres que Alembic reconozca
 from models import (
     Proveedor,
@@ -32,11 +32,17 @@ from models import (
     Fondo,
     Financiador,
     FacturaDB,
-    OfertaFinanciamiento
+    OfertaFinanciamiento,
+    ArchivoIngerido,
+    SincronizacionSII
 )
 
 target_metadata = Base.metadata
 
+# 🔗 Usa la misma URL que la aplicación (DATABASE_URL) en vez de la fija del .ini
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
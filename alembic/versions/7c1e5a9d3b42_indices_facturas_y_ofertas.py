@@ -0,0 +1,60 @@
+"""Indices para facturas y ofertas + unicidad (rut_emisor, rut_receptor, folio)
+
+Revision ID: 7c1e5a9d3b42
+Revises: 4911252ef21b
+Create Date: 2026-10-17 10:12:31.204118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5a9d3b42'
+down_revision: Union[str, Sequence[str], None] = '4911252ef21b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ⚠️ La restricción única falla si ya hay facturas repetidas: avisar con un mensaje claro
+    duplicadas = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM facturas "
+        "GROUP BY rut_emisor, rut_receptor, folio HAVING COUNT(*) > 1) AS d"
+    )).scalar()
+    if duplicadas:
+        raise RuntimeError(
+            f"Hay {duplicadas} combinaciones (rut_emisor, rut_receptor, folio) repetidas en facturas; "
+            "depúrelas antes de aplicar esta migración."
+        )
+
+    # Marketplace: estado_dte + financiador_adjudicado (disponibles / mías / otras)
+    op.create_index('ix_facturas_estado_adjudicado', 'facturas', ['estado_dte', 'financiador_adjudicado'], unique=False)
+    # Pagador: rut_receptor + estado_dte (pendientes / gestionadas)
+    op.create_index('ix_facturas_receptor_estado', 'facturas', ['rut_receptor', 'estado_dte'], unique=False)
+    # Rutas por folio y listado del proveedor
+    op.create_index(op.f('ix_facturas_folio'), 'facturas', ['folio'], unique=False)
+    op.create_index(op.f('ix_facturas_proveedor_id'), 'facturas', ['proveedor_id'], unique=False)
+    # Ofertas por factura y por financiador
+    op.create_index(op.f('ix_ofertas_financiamiento_factura_id'), 'ofertas_financiamiento', ['factura_id'], unique=False)
+    op.create_index(op.f('ix_ofertas_financiamiento_financiador_id'), 'ofertas_financiamiento', ['financiador_id'], unique=False)
+
+    # batch_alter_table: SQLite no soporta ALTER TABLE ADD CONSTRAINT (recrea la tabla)
+    with op.batch_alter_table('facturas') as batch_op:
+        batch_op.create_unique_constraint('uq_facturas_emisor_receptor_folio', ['rut_emisor', 'rut_receptor', 'folio'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('facturas') as batch_op:
+        batch_op.drop_constraint('uq_facturas_emisor_receptor_folio', type_='unique')
+
+    op.drop_index(op.f('ix_ofertas_financiamiento_financiador_id'), table_name='ofertas_financiamiento')
+    op.drop_index(op.f('ix_ofertas_financiamiento_factura_id'), table_name='ofertas_financiamiento')
+    op.drop_index(op.f('ix_facturas_proveedor_id'), table_name='facturas')
+    op.drop_index(op.f('ix_facturas_folio'), table_name='facturas')
+    op.drop_index('ix_facturas_receptor_estado', table_name='facturas')
+    op.drop_index('ix_facturas_estado_adjudicado', table_name='facturas')
@@ -0,0 +1,59 @@
+"""financiador_adjudicado como FK entera con índice propio
+
+Revision ID: a83f0d6c21e7
+Revises: 7c1e5a9d3b42
+Create Date: 2026-10-17 11:40:05.918254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83f0d6c21e7'
+down_revision: Union[str, Sequence[str], None] = '7c1e5a9d3b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    columna = next(
+        c for c in sa.inspect(bind).get_columns('facturas') if c['name'] == 'financiador_adjudicado'
+    )
+
+    # Valores guardados como texto ('5', '') por el código antiguo → entero o NULL
+    if bind.dialect.name == 'sqlite':
+        op.execute(
+            "UPDATE facturas SET financiador_adjudicado = NULL "
+            "WHERE typeof(financiador_adjudicado) = 'text' AND trim(financiador_adjudicado) = ''"
+        )
+        op.execute(
+            "UPDATE facturas SET financiador_adjudicado = CAST(financiador_adjudicado AS INTEGER) "
+            "WHERE typeof(financiador_adjudicado) = 'text'"
+        )
+    elif not isinstance(columna['type'], sa.Integer):
+        # Esquemas antiguos en PostgreSQL con la columna como VARCHAR
+        op.execute("UPDATE facturas SET financiador_adjudicado = NULL WHERE trim(financiador_adjudicado) = ''")
+        op.alter_column(
+            'facturas', 'financiador_adjudicado',
+            type_=sa.Integer(),
+            postgresql_using='financiador_adjudicado::integer',
+        )
+
+    # Adjudicaciones que apuntan a financiadores inexistentes rompen la FK
+    op.execute(
+        "UPDATE facturas SET financiador_adjudicado = NULL "
+        "WHERE financiador_adjudicado IS NOT NULL "
+        "AND financiador_adjudicado NOT IN (SELECT id FROM financiadores)"
+    )
+
+    op.create_index(op.f('ix_facturas_financiador_adjudicado'), 'facturas', ['financiador_adjudicado'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_facturas_financiador_adjudicado'), table_name='facturas')
@@ -0,0 +1,81 @@
+"""estado_dte como código SMALLINT (ver estados.py)
+
+Revision ID: d52b8e1f0c94
+Revises: a83f0d6c21e7
+Create Date: 2026-10-17 13:05:47.310529
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52b8e1f0c94'
+down_revision: Union[str, Sequence[str], None] = 'a83f0d6c21e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia congelada de EstadoDTE (estados.py) al momento de esta migración
+CODIGOS = {
+    'Cargada': 1,
+    'Confirmación solicitada al pagador': 2,
+    'Confirmada por pagador': 3,
+    'Rechazada por pagador': 4,
+    'Vencimiento rechazado por proveedor': 5,
+    'Enviado a confirming': 6,
+    'Confirming solicitado': 7,
+    'Confirming adjudicado': 8,
+}
+
+
+def _case(columna, pares):
+    whens = " ".join(f"WHEN {columna} = :k{i} THEN :v{i}" for i in range(len(pares)))
+    params = {}
+    for i, (k, v) in enumerate(pares):
+        params[f"k{i}"], params[f"v{i}"] = k, v
+    return f"CASE {whens} END", params
+
+
+def _recrear_indices() -> None:
+    op.create_index('ix_facturas_estado_adjudicado', 'facturas', ['estado_dte', 'financiador_adjudicado'], unique=False)
+    op.create_index('ix_facturas_receptor_estado', 'facturas', ['rut_receptor', 'estado_dte'], unique=False)
+
+
+def _borrar_indices() -> None:
+    op.drop_index('ix_facturas_receptor_estado', table_name='facturas')
+    op.drop_index('ix_facturas_estado_adjudicado', table_name='facturas')
+
+
+def _reemplazar_columna(tipo, pares) -> None:
+    """estado_dte → columna nueva del `tipo` dado, traduciendo valores con `pares`."""
+    _borrar_indices()
+    op.add_column('facturas', sa.Column('estado_dte_nuevo', tipo, nullable=True))
+    expresion, params = _case('estado_dte', pares)
+    op.get_bind().execute(sa.text(f"UPDATE facturas SET estado_dte_nuevo = {expresion}"), params)
+    # batch_alter_table: SQLite no soporta DROP/RENAME COLUMN en todas las versiones
+    with op.batch_alter_table('facturas') as batch_op:
+        batch_op.drop_column('estado_dte')
+        batch_op.alter_column('estado_dte_nuevo', new_column_name='estado_dte')
+    _recrear_indices()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ⚠️ Un estado desconocido quedaría en NULL: mejor detenerse con un mensaje claro
+    desconocidos = [fila[0] for fila in op.get_bind().execute(
+        sa.text("SELECT DISTINCT estado_dte FROM facturas WHERE estado_dte IS NOT NULL")
+    ) if fila[0] not in CODIGOS]
+    if desconocidos:
+        raise RuntimeError(
+            f"Estados de factura sin código en estados.py: {desconocidos}; "
+            "agréguelos a EstadoDTE y a esta migración antes de aplicarla."
+        )
+
+    _reemplazar_columna(sa.SmallInteger(), list(CODIGOS.items()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _reemplazar_columna(sa.String(), [(v, k) for k, v in CODIGOS.items()])
@@ -0,0 +1,43 @@
+"""archivos_ingeridos: hash SHA-256 de cada archivo ya ingerido por proveedor
+
+Revision ID: e6a4c1f27b90
+Revises: d52b8e1f0c94
+Create Date: 2026-10-17 15:20:11.482907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a4c1f27b90'
+down_revision: Union[str, Sequence[str], None] = 'd52b8e1f0c94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'archivos_ingeridos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('proveedor_id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('nombre', sa.String(), nullable=False),
+        sa.Column('tipo', sa.String(), nullable=False),
+        sa.Column('tamano', sa.Integer(), nullable=False),
+        sa.Column('ingerido', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['proveedor_id'], ['proveedores.id']),
+        sa.PrimaryKeyConstraint('id'),
+        # La búsqueda es siempre por (proveedor_id, sha256): la restricción única es el índice
+        sa.UniqueConstraint('proveedor_id', 'sha256', name='uq_archivos_ingeridos_proveedor_sha256'),
+    )
+    op.create_index(op.f('ix_archivos_ingeridos_id'), 'archivos_ingeridos', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_archivos_ingeridos_id'), table_name='archivos_ingeridos')
+    op.drop_table('archivos_ingeridos')
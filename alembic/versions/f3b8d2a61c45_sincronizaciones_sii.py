@@ -0,0 +1,46 @@
+"""sincronizaciones_sii: marca de agua por proveedor y periodo de la sincronización con el SII
+
+Revision ID: f3b8d2a61c45
+Revises: e6a4c1f27b90
+Create Date: 2026-10-17 18:05:42.913604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d2a61c45'
+down_revision: Union[str, Sequence[str], None] = 'e6a4c1f27b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sincronizaciones_sii',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('proveedor_id', sa.Integer(), nullable=False),
+        sa.Column('rut', sa.String(), nullable=False),
+        sa.Column('periodo', sa.String(length=7), nullable=False),
+        sa.Column('estado', sa.String(), nullable=False),
+        sa.Column('documentos', sa.Integer(), nullable=True),
+        sa.Column('nuevas', sa.Integer(), nullable=False),
+        sa.Column('cerrado', sa.Boolean(), nullable=False),
+        sa.Column('sincronizado', sa.DateTime(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['proveedor_id'], ['proveedores.id']),
+        sa.PrimaryKeyConstraint('id'),
+        # Las marcas se leen siempre por proveedor: la restricción única es el índice
+        sa.UniqueConstraint('proveedor_id', 'periodo', name='uq_sincronizaciones_sii_proveedor_periodo'),
+    )
+    op.create_index(op.f('ix_sincronizaciones_sii_id'), 'sincronizaciones_sii', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sincronizaciones_sii_id'), table_name='sincronizaciones_sii')
+    op.drop_table('sincronizaciones_sii')
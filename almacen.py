@@ -0,0 +1,74 @@
+# almacen.py
+# Almacén por contenido de los archivos subidos: cada archivo queda una sola vez en
+# ALMACEN_DIR/ab/cd/<sha256>, sin importar cuántas veces ni con qué nombre se suba.
+# Los dos primeros pares de caracteres del hash reparten los archivos en 65.536 carpetas,
+# para que ninguna crezca sin límite como pasaba con uploads/.
+#
+#   ruta_tmp, sha = copiar_a_temporal(flujo, ".zip")   # o un archivo ya armado en disco
+#   ruta = guardar(ruta_tmp, sha)                      # mueve al almacén (o descarta si ya estaba)
+#
+# Qué archivos ya se ingirieron lo dice la tabla archivos_ingeridos (models.ArchivoIngerido).
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ALMACEN_DIR = os.getenv("ALMACEN_DIR", os.path.join("uploads", "objetos"))
+_BLOQUE = 1024 * 1024
+
+
+def ruta_objeto(sha256: str) -> str:
+    return os.path.join(ALMACEN_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def _carpeta_temporal() -> str:
+    # Dentro del almacén: así guardar() es un rename en el mismo sistema de archivos
+    carpeta = os.path.join(ALMACEN_DIR, "tmp")
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def temporal(sufijo: str = "") -> str:
+    """Ruta de un archivo vacío para armar ahí un objeto antes de guardarlo."""
+    fd, ruta = tempfile.mkstemp(prefix="subida_", suffix=sufijo, dir=_carpeta_temporal())
+    os.close(fd)
+    return ruta
+
+
+def copiar_a_temporal(flujo: BinaryIO, sufijo: str = "") -> Tuple[str, str]:
+    """Copia el flujo a un temporal calculando el sha256 en la misma pasada."""
+    hash_ = hashlib.sha256()
+    ruta = temporal(sufijo)
+    with open(ruta, "wb") as destino:
+        for bloque in iter(lambda: flujo.read(_BLOQUE), b""):
+            hash_.update(bloque)
+            destino.write(bloque)
+    return ruta, hash_.hexdigest()
+
+
+def sha256_archivo(ruta: str) -> str:
+    hash_ = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(_BLOQUE), b""):
+            hash_.update(bloque)
+    return hash_.hexdigest()
+
+
+def guardar(ruta_temporal: str, sha256: str) -> str:
+    """Mueve el archivo a su lugar en el almacén y devuelve esa ruta. Si el contenido ya
+    estaba guardado, el temporal se borra y se devuelve el existente."""
+    destino = ruta_objeto(sha256)
+    if os.path.exists(destino):
+        os.remove(ruta_temporal)
+        return destino
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    try:
+        os.replace(ruta_temporal, destino)   # atómico: dos subidas iguales a la vez dejan un solo archivo
+    except OSError:
+        shutil.move(ruta_temporal, destino)  # viene de otro sistema de archivos (SUBIDAS_DIR en otro disco)
+    return destino
@@ -0,0 +1 @@
+# Benchmarks y verificaciones de rendimiento (se ejecutan con `python -m benchmarks.<modulo>`)
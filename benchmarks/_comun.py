@@ -0,0 +1,121 @@
+# benchmarks/_comun.py
+# Utilidades compartidas por los benchmarks: datos mínimos, sesiones y percentiles.
+import os
+import sys
+import statistics
+import tempfile
+from datetime import date, timedelta
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if RAIZ not in sys.path:
+    sys.path.append(RAIZ)
+
+CLAVE_BENCH = "bench123"
+RUT_PROVEEDOR = "76262370-6"
+RUT_PAGADOR = "76123456-7"
+
+
+def configurar_entorno(url: str, **variables):
+    """Fija DATABASE_URL (y otras variables) ANTES de importar database/main."""
+    os.environ["DATABASE_URL"] = url
+    # Los archivos subidos durante la medición no van al almacén real (uploads/)
+    os.environ.setdefault("ALMACEN_DIR", tempfile.mkdtemp(prefix="treds_almacen_"))
+    os.environ.setdefault("SUBIDAS_DIR", tempfile.mkdtemp(prefix="treds_subidas_"))
+    for clave, valor in variables.items():
+        os.environ[clave] = str(valor)
+    os.chdir(RAIZ)  # templates/, static/ y uploads/ son rutas relativas
+
+
+def percentiles(muestras):
+    if not muestras:
+        return {"n": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordenadas = sorted(muestras)
+
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(round(q * (len(ordenadas) - 1))))]
+
+    return {
+        "n": len(ordenadas),
+        "media": statistics.fmean(ordenadas),
+        "p50": p(0.50),
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "max": ordenadas[-1],
+    }
+
+
+def formatear_ms(stats):
+    return (
+        f"n={stats['n']:>6}  p50={stats['p50'] * 1000:8.2f}ms  "
+        f"p95={stats['p95'] * 1000:8.2f}ms  p99={stats['p99'] * 1000:8.2f}ms  "
+        f"max={stats['max'] * 1000:8.2f}ms"
+    )
+
+
+def sembrar_basico(db, n_facturas=500):
+    """Crea un fondo, un financiador admin con costo de fondos al día, un proveedor,
+    un pagador y `n_facturas` repartidas entre los estados del marketplace."""
+    from models import Fondo, Financiador, Proveedor, Pagador, FacturaDB
+    from estados import EstadoDTE
+    from utils import pwd_context
+
+    clave_hash = pwd_context.hash(CLAVE_BENCH)
+    fondo = Fondo(nombre="Fondo Bench", descripcion="benchmark", activo=True)
+    db.add(fondo)
+    db.flush()
+
+    financiador = Financiador(
+        nombre="Financiador Bench", usuario="fin_bench", clave_hash=clave_hash,
+        fondo_id=fondo.id, es_admin=True,
+        costo_fondos_mensual=1.0, fecha_costo_fondos=date.today(),
+    )
+    proveedor = Proveedor(nombre="Proveedor Bench", rut=RUT_PROVEEDOR, usuario="prov_bench", clave_hash=clave_hash)
+    pagador = Pagador(nombre="Pagador Bench", rut=RUT_PAGADOR, usuario="pag_bench", clave_hash=clave_hash)
+    db.add_all([financiador, proveedor, pagador])
+    db.flush()
+
+    estados = [EstadoDTE.CARGADA, EstadoDTE.CONFIRMACION_SOLICITADA, EstadoDTE.CONFIRMADA,
+               EstadoDTE.CONFIRMING_SOLICITADO, EstadoDTE.CONFIRMING_ADJUDICADO]
+    hoy = date.today()
+    for i in range(n_facturas):
+        estado = estados[i % len(estados)]
+        db.add(FacturaDB(
+            rut_emisor=RUT_PROVEEDOR[:-2],
+            rut_receptor=RUT_PAGADOR,
+            tipo_dte="33",
+            folio=100000 + i,
+            monto=1_000_000 + i,
+            estado_dte=estado,
+            razon_social_emisor="Proveedor Bench",
+            razon_social_receptor="Pagador Bench",
+            fecha_emision=hoy,
+            fecha_vencimiento=hoy + timedelta(days=60),
+            fecha_vencimiento_original=hoy + timedelta(days=60),
+            confirming_solicitado=estado in (EstadoDTE.CONFIRMING_SOLICITADO, EstadoDTE.CONFIRMING_ADJUDICADO),
+            origen_confirmacion="Proveedor",
+            financiador_adjudicado=financiador.id if estado == EstadoDTE.CONFIRMING_ADJUDICADO else None,
+            proveedor_id=proveedor.id,
+        ))
+    db.commit()
+    return {"proveedor_id": proveedor.id, "financiador_id": financiador.id, "pagador_id": pagador.id}
+
+
+def xml_factura(folio, rut_emisor=RUT_PROVEEDOR, rut_receptor=RUT_PAGADOR):
+    from parseo_dte import RegistroDTE, escribir_dte
+
+    hoy = date.today()
+    return escribir_dte(RegistroDTE(
+        folio=folio, rut_emisor=rut_emisor, rut_receptor=rut_receptor, tipo_dte="33",
+        monto=1_000_000 + folio, razon_social_emisor="Proveedor Bench", razon_social_receptor="Pagador Bench",
+        fecha_emision=hoy, fecha_vencimiento=hoy + timedelta(days=60),
+    ))
+
+
+def cookie_sesion(cliente, rol, usuario):
+    """Hace login una vez y devuelve la cookie de sesión para reutilizarla entre hilos."""
+    respuesta = cliente.post(
+        f"/{rol}/login", data={"usuario": usuario, "clave": CLAVE_BENCH}, follow_redirects=False
+    )
+    if respuesta.status_code != 303:
+        raise RuntimeError(f"Login {rol} falló ({respuesta.status_code})")
+    return cliente.cookies.get("session")
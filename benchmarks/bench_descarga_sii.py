@@ -0,0 +1,157 @@
+# benchmarks/bench_descarga_sii.py
+# Throughput de la descarga del detalle SII contra un servidor local que imita el
+# facadeService (getDetalleVenta) con latencia fija y una fracción de 503 con Retry-After:
+#   • secuencial: ClienteSII, una consulta (RUT, periodo, tipo) tras otra, como detalle_dte.py
+#   • descarga_sii: httpx asíncrono con distintos límites de concurrencia, y con límite por host
+# Reporta consultas/s, documentos/s y cuántas respuestas fueron 503 (reintentadas). El servidor
+# corre en otro proceso para no competir por el GIL con el cliente.
+#
+#   python -m benchmarks.bench_descarga_sii --ruts 5 --periodos 6 --latencia 0.05 --errores 0.02
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks._comun import RAIZ
+
+
+# ─── Servidor de reemplazo ──────────────────────────────────────────────────
+def servidor(documentos, latencia, errores):
+    """Responde getDetalleVenta con `documentos` registros por tipo. Imprime el puerto y,
+    por cada línea que llega por stdin, los conteos desde la anterior."""
+    conteo = {"consultas": 0, "503": 0}
+    lock = threading.Lock()
+    rnd = random.Random(7)
+    respuestas = {}
+
+    def cuerpo(tipo, periodo):
+        if (tipo, periodo) not in respuestas:
+            anho, mes = periodo[:4], periodo[4:]
+            respuestas[(tipo, periodo)] = json.dumps({"data": [
+                {"detTipoDoc": int(tipo), "detRutDoc": 76123456, "detDvDoc": "7", "detRznSoc": "Pagador Bench",
+                 "detNroDoc": i + 1, "detFchDoc": f"{1 + i % 28:02d}/{mes}/{anho}", "detMntTotal": 1000 + i,
+                 "detFormaPagoLeyenda": "Crédito"} for i in range(documentos)],
+                "respEstado": {"codRespuesta": 0}}).encode()
+        return respuestas[(tipo, periodo)]
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, como el SII
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            datos = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["data"]
+            time.sleep(latencia)
+            with lock:
+                conteo["consultas"] += 1
+                fallar = rnd.random() < errores
+                conteo["503"] += fallar
+            if fallar:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            respuesta = cuerpo(datos["codTipoDoc"], datos["ptributario"])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(respuesta)))
+            self.end_headers()
+            self.wfile.write(respuesta)
+
+    ThreadingHTTPServer.daemon_threads = True
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    httpd.request_queue_size = 256
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    print(httpd.server_address[1], flush=True)
+    for linea in sys.stdin:   # "conteo" → imprime y reinicia
+        with lock:
+            print(json.dumps(conteo), flush=True)
+            conteo.update(consultas=0, **{"503": 0})
+
+
+# ─── Clientes ───────────────────────────────────────────────────────────────
+def secuencial(url, entradas, tipos, carpeta):
+    from cliente_sii import ClienteSII, cookies_como_dict
+
+    cliente = ClienteSII(url_base=url, backoff=0)
+    documentos = 0
+    for entrada in entradas:
+        with open(os.path.join(carpeta, f"detalle_{entrada.rut}_{entrada.periodo}.jsonl"), "w",
+                  encoding="utf-8") as archivo:
+            for tipo in tipos:
+                registros = cliente.detalle_venta(entrada.rut, entrada.dv, entrada.periodo,
+                                                  cookies_como_dict(entrada.cookies), "token", tipo)
+                archivo.write("".join(json.dumps(d, ensure_ascii=False) + "\n" for d in registros))
+                documentos += len(registros)
+    cliente.cerrar()
+    return documentos, 0
+
+
+def asincrono(url, entradas, tipos, carpeta, concurrencia, rps):
+    import descarga_sii
+
+    resultados = descarga_sii.descargar(entradas, carpeta=carpeta, tipos=tipos, url_base=url,
+                                        concurrencia=concurrencia, rps=rps, backoff=0.05,
+                                        token=lambda entrada: "token")
+    return sum(r.documentos for r in resultados), sum(1 for r in resultados if r.error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga SII: secuencial vs asíncrona contra un servidor local")
+    parser.add_argument("--ruts", type=int, default=5)
+    parser.add_argument("--periodos", type=int, default=6)
+    parser.add_argument("--documentos", type=int, default=200, help="registros por tipo y periodo")
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por consulta en el servidor")
+    parser.add_argument("--errores", type=float, default=0.02, help="fracción de respuestas 503")
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.servidor:
+        return servidor(args.documentos, args.latencia, args.errores)
+
+    from descarga_sii import TIPOS_DTE, Entrada
+
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_descarga_sii", "--servidor", "--documentos", str(args.documentos),
+         "--latencia", str(args.latencia), "--errores", str(args.errores)],
+        cwd=RAIZ, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        url = f"http://127.0.0.1:{proceso.stdout.readline().strip()}"
+        cookies = [{"name": "CSESSIONID", "value": "bench", "domain": ".sii.cl"}]
+        entradas = [Entrada(str(76000000 + r), "0", f"2025-{m:02d}", cookies)
+                    for r in range(args.ruts) for m in range(1, args.periodos + 1)]
+        consultas = len(entradas) * len(TIPOS_DTE)
+        print(f"▶ {len(entradas)} periodos × {len(TIPOS_DTE)} tipos = {consultas} consultas, "
+              f"{args.documentos} docs c/u, latencia {args.latencia * 1000:.0f} ms, {args.errores:.0%} de 503")
+
+        escenarios = [("secuencial (ClienteSII)", lambda c: secuencial(url, entradas, TIPOS_DTE, c))]
+        for concurrencia in (4, 16, 32):
+            escenarios.append((f"async concurrencia={concurrencia}",
+                               lambda c, n=concurrencia: asincrono(url, entradas, TIPOS_DTE, c, n, 0)))
+        escenarios.append(("async concurrencia=32 rps=50",
+                           lambda c: asincrono(url, entradas, TIPOS_DTE, c, 32, 50)))
+        for nombre, funcion in escenarios:
+            carpeta = tempfile.mkdtemp(prefix="treds_descarga_")
+            inicio = time.perf_counter()
+            documentos, fallidos = funcion(carpeta)
+            duracion = time.perf_counter() - inicio
+            proceso.stdin.write("conteo\n")
+            proceso.stdin.flush()
+            servidor_conteo = json.loads(proceso.stdout.readline())
+            print(f"   {nombre:<30} {duracion:7.2f}s  {consultas / duracion:>8,.1f} consultas/s  "
+                  f"{documentos / duracion:>10,.0f} docs/s  503 reintentados={servidor_conteo['503']:<4} "
+                  f"periodos fallidos={fallidos}")
+    finally:
+        proceso.stdin.close()
+        proceso.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/bench_estados.py
+# estado_dte como texto (esquema antiguo) vs código SMALLINT (estados.py):
+#   • tamaño del archivo e índices que incluyen estado_dte
+#   • mediana de las consultas del pagador y del marketplace
+#   • confirmar M facturas: una por una (ORM) vs transicionar_lote (un UPDATE)
+#
+#   python -m benchmarks.bench_estados --facturas 500000 --lote 2000
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks._comun import RUT_PROVEEDOR
+
+from sqlalchemy import MetaData, String, column, select, table
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, crear_engine
+from estados import EstadoDTE, transicionar, transicionar_lote
+from models import FacturaDB
+
+LOTE_INSERT = 20_000
+PAGADORES = [f"7{i:07d}-{i % 10}" for i in range(200)]
+
+
+def crear_esquema(engine, texto):
+    if not texto:
+        Base.metadata.create_all(bind=engine)
+        return
+    # Misma tabla con estado_dte VARCHAR, como antes de estados.py
+    metadata = MetaData()
+    for tabla in Base.metadata.sorted_tables:
+        tabla.to_metadata(metadata)
+    metadata.tables[FacturaDB.__tablename__].c.estado_dte.type = String()
+    metadata.create_all(bind=engine)
+
+
+def poblar(engine, texto, n_facturas):
+    crear_esquema(engine, texto)
+    rnd = random.Random(42)
+    estados = list(EstadoDTE)
+    hoy = date.today()
+    tabla = Base.metadata.tables[FacturaDB.__tablename__]
+    with engine.begin() as conn:
+        filas = []
+        for folio in range(1, n_facturas + 1):
+            estado = rnd.choice(estados)
+            filas.append({
+                "rut_emisor": RUT_PROVEEDOR, "rut_receptor": rnd.choice(PAGADORES), "tipo_dte": "33",
+                "folio": folio, "monto": rnd.randint(100_000, 50_000_000),
+                # Esquema antiguo: se inserta el texto tal cual, sin pasar por EstadoDTEColumna
+                "estado_dte": estado.value if texto else estado.codigo,
+                "fecha_emision": hoy, "fecha_vencimiento": hoy + timedelta(days=rnd.randint(30, 120)),
+            })
+            if len(filas) == LOTE_INSERT:
+                conn.exec_driver_sql(*_insert_crudo(tabla, filas))
+                filas = []
+        if filas:
+            conn.exec_driver_sql(*_insert_crudo(tabla, filas))
+        conn.exec_driver_sql("ANALYZE")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def _insert_crudo(tabla, filas):
+    columnas = list(filas[0])
+    sql = (f"INSERT INTO {tabla.name} ({', '.join(columnas)}) "
+           f"VALUES ({', '.join('?' for _ in columnas)})")
+    return sql, [tuple(f[c] for c in columnas) for f in filas]
+
+
+def consultas(texto):
+    """Mismas consultas que los routers; en el esquema antiguo se compara el texto."""
+    def valor(estado):
+        return estado.value if texto else estado.codigo
+
+    # Tabla "liviana" sin tipos: el valor se envía tal cual, sin pasar por EstadoDTEColumna
+    tabla = table(FacturaDB.__tablename__, column("id"), column("rut_receptor"),
+                  column("estado_dte"), column("financiador_adjudicado"))
+    return {
+        "pagador: pendientes": lambda rut: select(tabla.c.id).where(
+            tabla.c.rut_receptor == rut,
+            tabla.c.estado_dte == valor(EstadoDTE.CONFIRMACION_SOLICITADA)),
+        "marketplace: disponibles": lambda _rut: select(tabla.c.id).where(
+            tabla.c.estado_dte == valor(EstadoDTE.CONFIRMING_SOLICITADO),
+            tabla.c.financiador_adjudicado.is_(None)),
+    }
+
+
+def tamanos(conn):
+    pagina = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    total = conn.exec_driver_sql("PRAGMA page_count").scalar() * pagina
+    try:
+        indices = dict(conn.exec_driver_sql(
+            "SELECT name, SUM(pgsize) FROM dbstat "
+            "WHERE name IN ('ix_facturas_estado_adjudicado', 'ix_facturas_receptor_estado') GROUP BY name"
+        ).all())
+    except Exception:
+        indices = {}  # SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB
+    return total, indices
+
+
+def medir_consultas(engine, texto, repeticiones):
+    resultado = {}
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA cache_size=-65536")
+        for nombre, sentencia in consultas(texto).items():
+            tiempos = []
+            for i in range(repeticiones):
+                inicio = time.perf_counter()
+                conn.execute(sentencia(PAGADORES[i % len(PAGADORES)])).all()
+                tiempos.append(time.perf_counter() - inicio)
+            resultado[nombre] = statistics.median(tiempos)
+    return resultado
+
+
+def medir_transiciones(engine, n_lote):
+    """Confirma n_lote facturas pendientes: una por una vs transicionar_lote."""
+    Sesion = sessionmaker(bind=engine)
+    with Sesion() as db:
+        folios = db.scalars(select(FacturaDB.folio)
+                            .where(FacturaDB.estado_dte == EstadoDTE.CONFIRMACION_SOLICITADA)
+                            .limit(2 * n_lote)).all()
+    uno_a_uno, lote = folios[:n_lote], folios[n_lote:]
+
+    with Sesion() as db:
+        inicio = time.perf_counter()
+        for folio in uno_a_uno:
+            factura = db.scalars(select(FacturaDB).where(FacturaDB.folio == folio)).first()
+            transicionar(factura, EstadoDTE.CONFIRMADA)
+        db.commit()
+        t_uno = time.perf_counter() - inicio
+
+    with Sesion() as db:
+        inicio = time.perf_counter()
+        cambiadas = transicionar_lote(db, EstadoDTE.CONFIRMADA, FacturaDB.folio.in_(lote))
+        db.commit()
+        t_lote = time.perf_counter() - inicio
+    return len(uno_a_uno), t_uno, cambiadas, t_lote
+
+
+def main():
+    parser = argparse.ArgumentParser(description="estado_dte: texto vs código SMALLINT")
+    parser.add_argument("--facturas", type=int, default=500_000)
+    parser.add_argument("--lote", type=int, default=2000, help="facturas a confirmar en la prueba de transiciones")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="treds_bench_")
+    for nombre, texto in (("texto (VARCHAR)", True), ("código (SMALLINT)", False)):
+        ruta = os.path.join(directorio, f"estados_{'texto' if texto else 'codigo'}.db")
+        engine = crear_engine(f"sqlite:///{ruta}", modo_produccion=True)
+        inicio = time.perf_counter()
+        poblar(engine, texto, args.facturas)
+        print(f"▶ {nombre}: {args.facturas:,} facturas pobladas en {time.perf_counter() - inicio:.1f}s")
+
+        with engine.connect() as conn:
+            total, indices = tamanos(conn)
+        print(f"   archivo: {total / 2**20:8.1f} MiB")
+        for indice, bytes_ in sorted(indices.items()):
+            print(f"   {indice:<32} {bytes_ / 2**20:8.1f} MiB")
+
+        for consulta, mediana in medir_consultas(engine, texto, args.repeticiones).items():
+            print(f"   {consulta:<32} mediana={mediana * 1000:8.2f}ms")
+
+        if not texto:
+            n_uno, t_uno, n_lote, t_lote = medir_transiciones(engine, args.lote)
+            print(f"   {f'confirmar {n_uno:,} una por una':<32} {t_uno * 1000:9.1f}ms")
+            print(f"   {f'confirmar {n_lote:,} con transicionar_lote':<32} {t_lote * 1000:9.1f}ms")
+        engine.dispose()
+        print()
+
+
+if __name__ == "__main__":
+    main()
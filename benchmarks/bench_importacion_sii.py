@@ -0,0 +1,132 @@
+# benchmarks/bench_importacion_sii.py
+# Lectura y validación de un detalle del SII de N registros (200k por defecto):
+#   • legado: json.load del archivo entero + datetime.strptime por fecha y por fila
+#   • importacion_sii en streaming: raw_decode por bloques, ijson (si está) y JSON Lines,
+#     con las fechas cacheadas
+# Reporta registros/s y el pico de memoria de Python (tracemalloc, en una segunda pasada
+# para no sumar su costo al tiempo). Al final, importar() completo contra SQLite por etapa.
+#
+#   python -m benchmarks.bench_importacion_sii --registros 200000
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks._comun import RUT_PAGADOR, RUT_PROVEEDOR, configurar_entorno, sembrar_basico
+
+RUT_BASE = RUT_PROVEEDOR.replace("-", "")[:-1]
+
+
+def generar(carpeta, registros):
+    rnd = random.Random(7)
+    inicio = date(2025, 7, 1)
+    detalle = []
+    for i in range(registros):
+        emision = inicio + timedelta(days=rnd.randrange(31))
+        detalle.append({
+            "detTipoDoc": 33, "detRutDoc": int(RUT_PAGADOR[:-2]), "detDvDoc": RUT_PAGADOR[-1],
+            "detRznSoc": "Pagador Bench", "detNroDoc": 1 + i, "detFchDoc": f"{emision:%d/%m/%Y}",
+            "detFecRecepcion": f"{emision:%d/%m/%Y} {rnd.randrange(24):02d}:{rnd.randrange(60):02d}:00",
+            "detMntTotal": rnd.randint(100_000, 50_000_000), "detMntNeto": 0, "detMntIVA": 0,
+            "detFormaPagoLeyenda": "Contado" if i % 50 == 0 else "Crédito",
+        })
+    arreglo = os.path.join(carpeta, "detalle.json")
+    with open(arreglo, "w", encoding="utf-8") as f:
+        json.dump(detalle, f, indent=2, ensure_ascii=False)   # como lo guarda detalle_dte.py
+    lineas = os.path.join(carpeta, "detalle.jsonl")
+    with open(lineas, "w", encoding="utf-8") as f:
+        for d in detalle:
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+    return arreglo, lineas
+
+
+def legado(ruta, proveedor):
+    """Lo que hacía importar_facturas_sii antes de importacion_sii."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+    filas = []
+    for d in datos:
+        if d.get("detFormaPagoLeyenda", "").strip().lower() == "contado":
+            continue
+        filas.append(dict(
+            folio=int(d["detNroDoc"]), rut_receptor=f"{d['detRutDoc']}{d['detDvDoc']}", monto=int(d["detMntTotal"]),
+            fecha_emision=datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
+            fecha_vencimiento=datetime.strptime(d["detFecRecepcion"], "%d/%m/%Y %H:%M:%S").date()
+                if d.get("detFecRecepcion") else datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
+            fecha_vencimiento_original=datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
+        ))
+    return len(filas)
+
+
+def streaming(ruta, proveedor, tramo=1000):
+    import importacion_sii
+
+    total, filas = 0, []
+    for d in importacion_sii.leer_registros(ruta):
+        if (d.get("detFormaPagoLeyenda") or "").strip().lower() == "contado":
+            continue
+        filas.append(importacion_sii.fila_sii(d, proveedor, RUT_BASE))
+        if len(filas) >= tramo:   # importar() ingiere y suelta cada tramo
+            total, filas = total + len(filas), []
+    return total + len(filas)
+
+
+def medir(nombre, funcion, ruta, proveedor, registros):
+    inicio = time.perf_counter()
+    filas = funcion(ruta, proveedor)
+    duracion = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcion(ruta, proveedor)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {nombre:<28} {duracion:7.2f}s  {registros / duracion:>9,.0f} reg/s  "
+          f"pico {pico / 1024 ** 2:8.1f} MiB  ({filas:,} filas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importación del detalle SII: json.load vs streaming")
+    parser.add_argument("--registros", type=int, default=200_000)
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp(prefix="treds_sii_")
+    configurar_entorno(f"sqlite:///{os.path.join(carpeta, 'sii.db')}")
+    import importacion_sii
+
+    arreglo, lineas = generar(carpeta, args.registros)
+    proveedor = SimpleNamespace(id=1, rut=RUT_PROVEEDOR, nombre="Proveedor Bench")
+    print(f"▶ {args.registros:,} registros  (JSON {os.path.getsize(arreglo) / 1024 ** 2:,.1f} MiB, "
+          f"JSONL {os.path.getsize(lineas) / 1024 ** 2:,.1f} MiB)")
+    medir("legado (json.load)", legado, arreglo, proveedor, args.registros)
+    ijson = importacion_sii.ijson
+    importacion_sii.ijson = None
+    medir("streaming raw_decode", streaming, arreglo, proveedor, args.registros)
+    importacion_sii.ijson = ijson
+    if ijson is not None:
+        medir(f"streaming ijson ({ijson.backend})", streaming, arreglo, proveedor, args.registros)
+    medir("streaming JSON Lines", streaming, lineas, proveedor, args.registros)
+
+    from database import Base, SessionLocal, engine
+    from models import Proveedor
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        sembrar_basico(db, 0)
+        # El emisor se valida contra el RUT sin guion, como lo guarda el alta del SII
+        proveedor = db.query(Proveedor).one()
+        proveedor.rut = RUT_PROVEEDOR.replace("-", "")
+        db.commit()
+        inicio = time.perf_counter()
+        resumen = importacion_sii.importar(db, arreglo, proveedor)
+        duracion = time.perf_counter() - inicio
+    print(f"   importar() a SQLite          {duracion:7.2f}s  {args.registros / duracion:>9,.0f} reg/s  "
+          f"nuevas={resumen.nuevas:,} contado={resumen.descartadas:,} errores={resumen.errores:,}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
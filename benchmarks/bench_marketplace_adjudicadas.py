@@ -0,0 +1,172 @@
+# benchmarks/bench_marketplace_adjudicadas.py
+# Consultas "mías" / "otras" del marketplace con N facturas (1M por defecto):
+#   legado  → esquema antiguo (columna VARCHAR con el id como texto, sin FK):
+#             financiador_adjudicado == str(id) y JOIN por CAST(... AS INTEGER)
+#   tipado  → esquema actual (FK entera indexada):
+#             financiador_adjudicado == id y joinedload(FacturaDB.financiador)
+#
+#   python -m benchmarks.bench_marketplace_adjudicadas --facturas 1000000 --financiadores 5000
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks._comun import RUT_PAGADOR, RUT_PROVEEDOR
+
+from sqlalchemy import Integer, MetaData, String, cast, event, insert, select
+from sqlalchemy.orm import sessionmaker, joinedload, contains_eager
+
+from database import Base, crear_engine
+from models import FacturaDB, Financiador, Fondo, Proveedor
+
+LOTE = 20_000
+
+
+def crear_esquema(engine, legado):
+    if not legado:
+        Base.metadata.create_all(bind=engine)
+        return
+    # Misma tabla, pero con financiador_adjudicado como antes de la FK entera
+    metadata = MetaData()
+    for tabla in Base.metadata.sorted_tables:
+        if tabla.name != FacturaDB.__tablename__:
+            tabla.to_metadata(metadata)
+    facturas = FacturaDB.__table__.to_metadata(metadata)
+    columna = facturas.c.financiador_adjudicado
+    columna.type = String()
+    columna.foreign_keys.clear()
+    facturas.foreign_keys.difference_update({fk for fk in facturas.foreign_keys if fk.parent is columna})
+    facturas.constraints.difference_update(
+        {c for c in facturas.constraints if getattr(c, "column_keys", None) == ["financiador_adjudicado"]}
+    )
+    metadata.create_all(bind=engine)
+
+
+def poblar(engine, legado, n_facturas, n_financiadores, proporcion_adjudicadas):
+    crear_esquema(engine, legado)
+    rnd = random.Random(42)
+    hoy = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Fondo), [{"id": 1, "nombre": "Fondo", "activo": True}])
+        conn.execute(insert(Financiador), [
+            {"id": i, "nombre": f"Financiador {i}", "usuario": f"fin{i}", "clave_hash": "x", "fondo_id": 1}
+            for i in range(1, n_financiadores + 1)
+        ])
+        conn.execute(insert(Proveedor), [{"id": 1, "nombre": "Proveedor", "rut": RUT_PROVEEDOR,
+                                          "usuario": "prov", "clave_hash": "x"}])
+        filas = []
+        for folio in range(1, n_facturas + 1):
+            adjudicada = rnd.random() < proporcion_adjudicadas
+            filas.append({
+                "rut_emisor": RUT_PROVEEDOR, "rut_receptor": RUT_PAGADOR, "tipo_dte": "33", "folio": folio,
+                "monto": rnd.randint(100_000, 50_000_000),
+                "estado_dte": "Confirming adjudicado" if adjudicada else "Confirming solicitado",
+                "fecha_emision": hoy, "fecha_vencimiento": hoy + timedelta(days=rnd.randint(30, 120)),
+                "financiador_adjudicado": adjudicado(rnd.randint(1, n_financiadores), legado) if adjudicada else None,
+                "proveedor_id": 1,
+            })
+            if len(filas) == LOTE:
+                conn.execute(insert(FacturaDB), filas)
+                filas = []
+        if filas:
+            conn.execute(insert(FacturaDB), filas)
+        conn.exec_driver_sql("ANALYZE")
+
+
+def adjudicado(financiador_id, legado):
+    return str(financiador_id) if legado else financiador_id
+
+
+def legado(db, financiador_id):
+    mias = db.scalars(
+        select(FacturaDB)
+        .outerjoin(Financiador, Financiador.id == cast(FacturaDB.financiador_adjudicado, Integer))
+        .options(contains_eager(FacturaDB.financiador))
+        .where(FacturaDB.financiador_adjudicado == str(financiador_id),
+               FacturaDB.estado_dte == "Confirming adjudicado")
+    ).unique().all()
+    otras = db.scalars(
+        select(FacturaDB)
+        .outerjoin(Financiador, Financiador.id == cast(FacturaDB.financiador_adjudicado, Integer))
+        .options(contains_eager(FacturaDB.financiador))
+        .where(FacturaDB.estado_dte == "Confirming adjudicado",
+               FacturaDB.financiador_adjudicado != str(financiador_id))
+    ).unique().all()
+    return len(mias), len(otras)
+
+
+def tipado(db, financiador_id):
+    mias = db.scalars(
+        select(FacturaDB)
+        .options(joinedload(FacturaDB.financiador))
+        .where(FacturaDB.financiador_adjudicado == financiador_id,
+               FacturaDB.estado_dte == "Confirming adjudicado")
+    ).unique().all()
+    otras = db.scalars(
+        select(FacturaDB)
+        .options(joinedload(FacturaDB.financiador))
+        .where(FacturaDB.estado_dte == "Confirming adjudicado",
+               FacturaDB.financiador_adjudicado != financiador_id)
+    ).unique().all()
+    return len(mias), len(otras)
+
+
+def medir(Sesion, funcion, financiadores, repeticiones):
+    tiempos = []
+    for i in range(repeticiones):
+        with Sesion() as db:
+            inicio = time.perf_counter()
+            conteos = funcion(db, financiadores[i % len(financiadores)])
+            tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), conteos
+
+
+def planes(conn, Sesion, funcion, financiador_id):
+    """EXPLAIN QUERY PLAN de las dos sentencias (mías, otras) que emite `funcion`."""
+    capturas = []
+
+    def capturar(_conn, _cursor, statement, parameters, _context, _executemany):
+        capturas.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", capturar)
+    try:
+        with Sesion(bind=conn) as db:
+            funcion(db, financiador_id)
+    finally:
+        event.remove(conn, "before_cursor_execute", capturar)
+    return [fila[-1] for statement, parameters in capturas
+            for fila in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mías/otras del marketplace: FK tipada vs comparación por texto")
+    parser.add_argument("--facturas", type=int, default=1_000_000)
+    parser.add_argument("--financiadores", type=int, default=5000)
+    parser.add_argument("--adjudicadas", type=float, default=0.1, help="proporción de facturas adjudicadas")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="treds_bench_")
+    financiadores = random.Random(7).sample(range(1, args.financiadores + 1), args.repeticiones)
+    for nombre, funcion, es_legado in (("legado (texto + CAST)", legado, True),
+                                       ("tipado (FK entera)", tipado, False)):
+        ruta = os.path.join(directorio, f"{funcion.__name__}.db")
+        engine = crear_engine(f"sqlite:///{ruta}", modo_produccion=True)
+        inicio = time.perf_counter()
+        poblar(engine, es_legado, args.facturas, args.financiadores, args.adjudicadas)
+        print(f"Poblado {args.facturas:,} facturas ({funcion.__name__}) en {time.perf_counter() - inicio:.1f}s")
+
+        Sesion = sessionmaker(bind=engine)
+        mediana, (n_mias, n_otras) = medir(Sesion, funcion, financiadores, args.repeticiones)
+        print(f"▶ {nombre:<22} mediana={mediana * 1000:9.1f}ms  mías={n_mias:,}  otras={n_otras:,}")
+        with engine.connect() as conn:
+            for linea in planes(conn, Sesion, funcion, financiadores[0]):
+                print(f"   {linea}")
+        engine.dispose()
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_parseo_dte.py
+# 1) Extracción por documento: un .find(".//Campo") por campo (como antes) vs leer_dte
+#    con xml.etree y con lxml, en DTE simples y en DTE "firmados" (con ~4 KB de firma
+#    después del encabezado).
+# 2) Parseo de un ZIP grande: en el mismo proceso vs el pool de parseo_dte con 1, 2, 4
+#    y 8 procesos. El pool se calienta antes de medir (arranque de los hijos "spawn"
+#    fuera del tiempo), igual que en el servidor, donde se crea una vez y se reutiliza.
+#
+#   python -m benchmarks.bench_parseo_dte --documentos 20000 --workers 1,2,4,8
+import argparse
+import multiprocessing
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from benchmarks._comun import xml_factura
+
+import parseo_dte
+from parseo_dte import parsear_por_tramos, parsear_tramo
+
+
+FIRMA = b"<Signature>" + b"<SignatureValue>abc</SignatureValue>" * 100 + b"</Signature>"
+
+
+def find_por_campo(contenido):
+    """La extracción que hacía routers/proveedor.py antes de parseo_dte."""
+    root = ET.fromstring(contenido)
+    return (
+        int(root.find(".//Folio").text), root.find(".//RUTEmisor").text, root.find(".//RUTRecep").text,
+        root.find(".//TipoDTE").text, int(root.find(".//MntTotal").text), root.find(".//RznSoc").text,
+        root.find(".//RznSocRecep").text,
+        datetime.strptime(root.find(".//FchEmis").text, "%Y-%m-%d").date(),
+        datetime.strptime(root.find(".//FchVenc").text, "%Y-%m-%d").date(),
+    )
+
+
+def comparar_extraccion(documentos):
+    firmados = [(nombre, contenido.replace(b"</DTE>", FIRMA + b"</DTE>")) for nombre, contenido in documentos]
+    lxml = parseo_dte._lxml
+    variantes = [("find por campo", find_por_campo, None), ("leer_dte (xml.etree)", parseo_dte.leer_dte, None)]
+    if lxml is not None:
+        variantes.append(("leer_dte (lxml)", parseo_dte.leer_dte, lxml))
+    for tipo, docs in (("simples", documentos), ("firmados", firmados)):
+        print(f"▶ extracción, {len(docs):,} DTE {tipo} ({len(docs[0][1]):,} bytes c/u)")
+        for nombre, funcion, backend in variantes:
+            parseo_dte._lxml = backend
+            inicio = time.perf_counter()
+            for _, contenido in docs:
+                funcion(contenido)
+            duracion = time.perf_counter() - inicio
+            print(f"   {nombre:<22} {duracion:8.2f}s  {len(docs) / duracion:>9,.0f} docs/s")
+    parseo_dte._lxml = lxml
+
+
+def medir(nombre, funcion, documentos, base=None):
+    inicio = time.perf_counter()
+    resultados = funcion()
+    duracion = time.perf_counter() - inicio
+    errores = sum(1 for _, _, error in resultados if error)
+    aceleracion = f"  x{base / duracion:4.2f}" if base else ""
+    print(f"   {nombre:<22} {duracion:8.2f}s  {len(documentos) / duracion:>9,.0f} docs/s{aceleracion}  errores={errores}")
+    return duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parseo de DTE: secuencial vs pool de procesos")
+    parser.add_argument("--documentos", type=int, default=20_000)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--tramo", type=int, default=parseo_dte.DTE_TRAMO)
+    args = parser.parse_args()
+
+    documentos = [(f"dte_{folio}.xml", xml_factura(folio)) for folio in range(1, args.documentos + 1)]
+    comparar_extraccion(documentos)
+
+    print(f"▶ pool, {args.documentos:,} documentos, tramos de {args.tramo}, {os.cpu_count()} CPU")
+
+    base = medir("mismo proceso", lambda: parsear_tramo(documentos), documentos)
+    for workers in (int(w) for w in args.workers.split(",")):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            list(pool.map(parsear_tramo, [[documentos[0]]] * workers))  # calentar los hijos
+            tramos = lambda: parsear_por_tramos(documentos, pool=pool, tamano=args.tramo, workers=workers)
+            medir(f"pool {workers} procesos", lambda: [r for tramo in tramos() for r in tramo], documentos, base)
+
+
+if __name__ == "__main__":
+    main()
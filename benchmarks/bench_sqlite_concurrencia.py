@@ -0,0 +1,111 @@
+# benchmarks/bench_sqlite_concurrencia.py
+# N lectores consultando el marketplace + 1 escritor cargando facturas en bloque
+# (commit por factura, como la ingesta ZIP). Compara el modo SQLite por defecto
+# contra SQLITE_MODO_PRODUCCION (WAL + pragmas) y reporta p50/p99 de lectura.
+#
+#   python -m benchmarks.bench_sqlite_concurrencia --lectores 8 --segundos 10
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks._comun import percentiles, formatear_ms, sembrar_basico, RUT_PROVEEDOR, RUT_PAGADOR
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, crear_engine, CheckpointWAL
+from models import FacturaDB
+
+
+def correr(modo_produccion, lectores, segundos, facturas_iniciales):
+    directorio = tempfile.mkdtemp(prefix="treds_bench_")
+    url = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    engine = crear_engine(url, modo_produccion=modo_produccion)
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(bind=engine, autoflush=False)
+    with Sesion() as db:
+        ids = sembrar_basico(db, n_facturas=facturas_iniciales)
+
+    checkpoint = None
+    if modo_produccion:
+        checkpoint = CheckpointWAL(engine, intervalo=1)
+        checkpoint.start()
+
+    fin = time.perf_counter() + segundos
+    latencias, bloqueos = [], [0]
+    insertadas = [0]
+    lock = threading.Lock()
+
+    def lector():
+        propias = []
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            try:
+                with Sesion() as db:
+                    db.query(FacturaDB).filter(
+                        FacturaDB.estado_dte == "Confirming solicitado",
+                        FacturaDB.financiador_adjudicado.is_(None),
+                    ).all()
+                propias.append(time.perf_counter() - inicio)
+            except OperationalError:
+                with lock:
+                    bloqueos[0] += 1
+        with lock:
+            latencias.extend(propias)
+
+    def escritor():
+        folio = 500000
+        hoy = date.today()
+        while time.perf_counter() < fin:
+            try:
+                with Sesion() as db:
+                    for _ in range(200):
+                        folio += 1
+                        db.add(FacturaDB(
+                            rut_emisor=RUT_PROVEEDOR, rut_receptor=RUT_PAGADOR, tipo_dte="33",
+                            folio=folio, monto=folio, estado_dte="Cargada",
+                            fecha_emision=hoy, fecha_vencimiento=hoy + timedelta(days=60),
+                            proveedor_id=ids["proveedor_id"],
+                        ))
+                        db.commit()
+                        insertadas[0] += 1
+            except OperationalError:
+                with lock:
+                    bloqueos[0] += 1
+
+    hilos = [threading.Thread(target=lector) for _ in range(lectores)] + [threading.Thread(target=escritor)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    if checkpoint:
+        checkpoint.detener()
+    engine.dispose()
+    return percentiles(latencias), insertadas[0] / segundos, bloqueos[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lectores concurrentes vs escritor masivo en SQLite")
+    parser.add_argument("--lectores", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--facturas", type=int, default=5000)
+    args = parser.parse_args()
+
+    resultados = {}
+    for modo in (False, True):
+        etiqueta = "WAL (producción)" if modo else "por defecto"
+        stats, escrituras, bloqueos = correr(modo, args.lectores, args.segundos, args.facturas)
+        resultados[modo] = stats
+        print(f"▶ SQLite {etiqueta:<17} lecturas {formatear_ms(stats)}  "
+              f"escritor={escrituras:7.1f} facturas/s  'database is locked'={bloqueos}")
+
+    if resultados[True]["p99"]:
+        print(f"\np99 de lectura: {resultados[False]['p99'] / resultados[True]['p99']:.1f}x mejor con WAL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# benchmarks/carga.py
+# Prueba de carga de punta a punta contra un servidor local (uvicorn), usando los
+# usuarios que dejó benchmarks/generador.py. Cada usuario virtual es un hilo con su
+# propia sesión HTTP que recorre el flujo real leyendo el HTML que devuelve la app:
+#   financiador → login, marketplace, registrar oferta
+#   proveedor   → login, mis facturas, ver ofertas, adjudicar oferta
+#   pagador     → login, mis facturas, confirmar factura
+# Al final reporta throughput y percentiles de latencia por operación.
+#
+#   python -m benchmarks.generador --url sqlite:///./carga_treds.db --facturas 100000
+#   python -m benchmarks.carga --levantar --db-url sqlite:///./carga_treds.db \
+#       --manifiesto carga_treds.usuarios.json --usuarios 32 --segundos 60
+#
+#   # o contra un servidor ya levantado
+#   python -m benchmarks.carga --base-url http://127.0.0.1:8000 --manifiesto carga_treds.usuarios.json
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks._comun import RAIZ, formatear_ms, percentiles
+
+RE_OFERTAR = re.compile(r'/financiador/ofertar/(\d+)')
+RE_VER_OFERTAS = re.compile(r'/proveedor/ofertas-folio/(\d+)')
+RE_ACEPTAR = re.compile(r'/proveedor/aceptar-oferta/(\d+)')
+RE_CONFIRMAR = re.compile(r'/pagador/confirmar-factura/(\d+)')
+MAX_CANDIDATOS = 200  # no hace falta recorrer todo el HTML de un marketplace con 100k filas
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def registrar(self, operacion, segundos, ok):
+        with self.lock:
+            if ok:
+                self.latencias[operacion].append(segundos)
+            else:
+                self.errores[operacion] += 1
+
+
+def candidatos(patron, texto):
+    encontrados = []
+    for coincidencia in patron.finditer(texto):
+        encontrados.append(int(coincidencia.group(1)))
+        if len(encontrados) >= MAX_CANDIDATOS:
+            break
+    return encontrados
+
+
+class UsuarioVirtual(threading.Thread):
+    def __init__(self, base_url, rol, usuario, clave, resultados, hasta, pausa, semilla):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.rol = rol
+        self.usuario = usuario
+        self.clave = clave
+        self.resultados = resultados
+        self.hasta = hasta
+        self.pausa = pausa
+        self.rnd = random.Random(semilla)
+        self.http = requests.Session()
+
+    def pedir(self, operacion, metodo, ruta, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            respuesta = self.http.request(metodo, self.base_url + ruta, allow_redirects=False, timeout=120, **kwargs)
+            ok = respuesta.status_code < 400
+        except requests.RequestException:
+            respuesta, ok = None, False
+        self.resultados.registrar(operacion, time.perf_counter() - inicio, ok)
+        return respuesta if ok else None
+
+    def run(self):
+        respuesta = self.pedir("login", "POST", f"/{self.rol}/login",
+                               data={"usuario": self.usuario, "clave": self.clave})
+        if respuesta is None or "session" not in self.http.cookies:
+            return
+        paso = getattr(self, f"paso_{self.rol}")
+        while time.monotonic() < self.hasta:
+            paso()
+            if self.pausa:
+                time.sleep(self.rnd.uniform(0, 2 * self.pausa))
+
+    def paso_financiador(self):
+        respuesta = self.pedir("marketplace", "GET", "/financiador/marketplace")
+        folios = candidatos(RE_OFERTAR, respuesta.text) if respuesta is not None else []
+        if folios:
+            self.pedir("registrar_oferta", "POST", f"/financiador/registrar-oferta/{self.rnd.choice(folios)}", data={
+                "tasa_interes": round(self.rnd.uniform(0.7, 2.2), 2),
+                "comision_flat": self.rnd.choice((0, 15000, 25000)),
+                "dias_anticipacion": self.rnd.choice((30, 45, 60)),
+            })
+
+    def paso_proveedor(self):
+        respuesta = self.pedir("facturas_proveedor", "GET", "/proveedor/facturas")
+        folios = candidatos(RE_VER_OFERTAS, respuesta.text) if respuesta is not None else []
+        if not folios:
+            return
+        respuesta = self.pedir("ver_ofertas", "GET", f"/proveedor/ofertas-folio/{self.rnd.choice(folios)}")
+        ofertas = candidatos(RE_ACEPTAR, respuesta.text) if respuesta is not None else []
+        if ofertas:
+            self.pedir("adjudicar", "POST", f"/proveedor/aceptar-oferta/{ofertas[0]}")
+
+    def paso_pagador(self):
+        respuesta = self.pedir("facturas_pagador", "GET", "/pagador/facturas")
+        folios = candidatos(RE_CONFIRMAR, respuesta.text) if respuesta is not None else []
+        if folios:
+            self.pedir("confirmar", "POST", f"/pagador/confirmar-factura/{self.rnd.choice(folios)}")
+
+
+def levantar_servidor(args):
+    entorno = dict(os.environ, DATABASE_URL=args.db_url)
+    comando = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.puerto),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno)
+    base_url = f"http://127.0.0.1:{args.puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return proceso, base_url
+        except requests.RequestException:
+            pass
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+        time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("El servidor no respondió en 60 s")
+
+
+def repartir(args, manifiesto):
+    """Asigna a cada usuario virtual un rol (según --mezcla) y un usuario distinto de ese rol."""
+    pesos = {}
+    for parte in args.mezcla.split(","):
+        rol, peso = parte.split("=")
+        pesos[rol.strip()] = float(peso)
+    total = sum(pesos.values())
+    asignados, acumulado = [], 0.0
+    for rol, peso in pesos.items():
+        acumulado += peso
+        hasta = round(args.usuarios * acumulado / total)
+        for i in range(hasta - len(asignados)):
+            usuarios = manifiesto[rol]
+            asignados.append((rol, usuarios[i % len(usuarios)]))
+    return asignados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga end-to-end contra un servidor local")
+    parser.add_argument("--manifiesto", required=True, help="JSON generado por benchmarks.generador")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--levantar", action="store_true", help="levanta uvicorn con --db-url durante la prueba")
+    parser.add_argument("--db-url", help="DATABASE_URL para --levantar")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--usuarios", type=int, default=16, help="usuarios virtuales concurrentes")
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--mezcla", default="financiador=0.5,proveedor=0.25,pagador=0.25")
+    parser.add_argument("--pausa", type=float, default=0.0, help="tiempo de reflexión medio entre pasos (s)")
+    parser.add_argument("--semilla", type=int, default=7)
+    parser.add_argument("--json", help="guarda el resumen en este archivo")
+    args = parser.parse_args()
+    if args.levantar and not args.db_url:
+        parser.error("--levantar requiere --db-url")
+
+    with open(args.manifiesto, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+
+    proceso = None
+    base_url = args.base_url
+    if args.levantar:
+        proceso, base_url = levantar_servidor(args)
+
+    resultados = Resultados()
+    try:
+        hasta = time.monotonic() + args.segundos
+        hilos = [
+            UsuarioVirtual(base_url, rol, usuario, manifiesto["clave"], resultados, hasta, args.pausa, args.semilla + i)
+            for i, (rol, usuario) in enumerate(repartir(args, manifiesto))
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+    roles = defaultdict(int)
+    for hilo in hilos:
+        roles[hilo.rol] += 1
+    print(f"\n▶ {len(hilos)} usuarios virtuales ({dict(roles)}) durante {duracion:.1f}s contra {base_url}")
+    resumen = {}
+    for operacion in sorted(set(resultados.latencias) | set(resultados.errores)):
+        stats = percentiles(resultados.latencias[operacion])
+        errores = resultados.errores[operacion]
+        rps = stats["n"] / duracion
+        print(f"   {operacion:<20} {formatear_ms(stats)}  {rps:8.1f} req/s  errores={errores}")
+        resumen[operacion] = {**stats, "rps": rps, "errores": errores}
+    total = sum(s["n"] for s in resumen.values())
+    print(f"   {'total':<20} {total:,} requests  {total / duracion:.1f} req/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"duracion": duracion, "usuarios": len(hilos), "operaciones": resumen}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# benchmarks/generador.py
+# Llena el esquema de models.py con datos sintéticos de volumen realista para pruebas
+# de carga: RUTs con dígito verificador válido, montos log-normales, pagadores con
+# concentración tipo Zipf (pocos pagadores reciben la mayoría de las facturas),
+# plazos de vencimiento habituales y un abanico de ofertas por factura en Confirming.
+# Inserta por lotes con Core (executemany) y deja un manifiesto JSON con los usuarios
+# para benchmarks/carga.py. Todos los usuarios usan la clave CLAVE_BENCH.
+#
+#   python -m benchmarks.generador --url sqlite:///./carga_treds.db \
+#       --facturas 1000000 --fondos 200 --financiadores 5000 --proveedores 2000 --pagadores 500
+#
+#   # al día siguiente: renovar el costo de fondos sin regenerar todo
+#   python -m benchmarks.generador --url sqlite:///./carga_treds.db --solo-costo-fondos
+import argparse
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from benchmarks._comun import CLAVE_BENCH, configurar_entorno
+
+LOTE = 10_000
+
+# Reparto de estados de las facturas (suma 1.0)
+DISTRIBUCION_ESTADOS = (
+    ("CARGADA", 0.35),
+    ("CONFIRMACION_SOLICITADA", 0.15),
+    ("CONFIRMADA", 0.15),
+    ("RECHAZADA", 0.03),
+    ("VENCIMIENTO_RECHAZADO", 0.02),
+    ("CONFIRMING_SOLICITADO", 0.18),
+    ("CONFIRMING_ADJUDICADO", 0.12),
+)
+PLAZOS_DIAS = ((30, 0.35), (45, 0.15), (60, 0.30), (90, 0.15), (120, 0.05))
+
+
+def digito_verificador(numero: int) -> str:
+    """Dígito verificador del RUT chileno (módulo 11)."""
+    suma, factor = 0, 2
+    for digito in reversed(str(numero)):
+        suma += int(digito) * factor
+        factor = factor + 1 if factor < 7 else 2
+    resto = 11 - suma % 11
+    return {11: "0", 10: "K"}.get(resto, str(resto))
+
+
+def rut(numero: int) -> str:
+    return f"{numero}-{digito_verificador(numero)}"
+
+
+class Elector:
+    """Elección ponderada O(log n) con pesos fijos (random.choices recalcula en cada llamada)."""
+
+    def __init__(self, valores, pesos, rnd):
+        self.valores = list(valores)
+        self.acumulados = list(itertools.accumulate(pesos))
+        self.rnd = rnd
+
+    def __call__(self):
+        return self.valores[bisect.bisect(self.acumulados, self.rnd.random() * self.acumulados[-1])]
+
+
+def poisson(rnd, media):
+    # Knuth; suficiente para medias chicas como el abanico de ofertas
+    limite, k, p = math.exp(-media), 0, 1.0
+    while True:
+        p *= rnd.random()
+        if p <= limite:
+            return k
+        k += 1
+
+
+class Generador:
+    def __init__(self, args):
+        from estados import EstadoDTE
+
+        self.args = args
+        self.rnd = random.Random(args.semilla)
+        self.hoy = date.today()
+        self.estado = Elector([EstadoDTE[n] for n, _ in DISTRIBUCION_ESTADOS],
+                              [p for _, p in DISTRIBUCION_ESTADOS], self.rnd)
+        self.plazo = Elector([d for d, _ in PLAZOS_DIAS], [p for _, p in PLAZOS_DIAS], self.rnd)
+        # Zipf (s=1.1): el pagador 1 recibe muchas más facturas que el 500
+        self.pagador = Elector(range(args.pagadores), [1 / (i + 1) ** 1.1 for i in range(args.pagadores)], self.rnd)
+        self.ruts = self._ruts_unicos(args.proveedores + args.pagadores)
+
+    def _ruts_unicos(self, n):
+        numeros = self.rnd.sample(range(50_000_000, 99_999_999), n)
+        return [rut(numero) for numero in numeros]
+
+    def monto(self):
+        # Log-normal con mediana ~2,5 MM CLP, acotada a montos plausibles de factoring
+        return int(min(max(self.rnd.lognormvariate(math.log(2_500_000), 1.1), 50_000), 900_000_000))
+
+    # ── Usuarios ───────────────────────────────────────────────────────────
+    def fondos(self):
+        return [{"id": i + 1, "nombre": f"Fondo {i + 1:03d}", "descripcion": "sintético", "activo": True}
+                for i in range(self.args.fondos)]
+
+    def financiadores(self, clave_hash):
+        filas = []
+        for i in range(self.args.financiadores):
+            fondo_id = i % self.args.fondos + 1
+            filas.append({
+                "id": i + 1, "nombre": f"Financiador {i + 1:05d}", "usuario": f"fin{i + 1:05d}",
+                "clave_hash": clave_hash, "fondo_id": fondo_id,
+                "es_admin": i < self.args.fondos,  # el primero de cada fondo es admin
+                "costo_fondos_mensual": round(self.rnd.uniform(0.6, 1.4), 3), "fecha_costo_fondos": self.hoy,
+            })
+        return filas
+
+    def proveedores(self, clave_hash):
+        return [{"id": i + 1, "nombre": f"Proveedor {i + 1:05d}", "rut": self.ruts[i],
+                 "usuario": f"prov{i + 1:05d}", "clave_hash": clave_hash, "razon_social": f"Proveedor {i + 1:05d} SpA"}
+                for i in range(self.args.proveedores)]
+
+    def pagadores(self, clave_hash):
+        base = self.args.proveedores
+        return [{"id": i + 1, "nombre": f"Pagador {i + 1:04d}", "rut": self.ruts[base + i],
+                 "usuario": f"pag{i + 1:04d}", "clave_hash": clave_hash}
+                for i in range(self.args.pagadores)]
+
+    # ── Facturas y ofertas ─────────────────────────────────────────────────
+    def lotes_facturas(self):
+        """Genera (facturas, ofertas) por lotes con ids explícitos para enlazar sin RETURNING."""
+        from estados import EstadoDTE
+
+        args, rnd = self.args, self.rnd
+        id_oferta = 0
+        facturas, ofertas = [], []
+        for id_factura in range(1, args.facturas + 1):
+            proveedor = rnd.randrange(args.proveedores)
+            pagador = self.pagador()
+            estado = self.estado()
+            emision = self.hoy - timedelta(days=rnd.randrange(120))
+            vencimiento = emision + timedelta(days=self.plazo())
+            modificado = estado is EstadoDTE.CONFIRMADA and rnd.random() < 0.1
+            monto = self.monto()
+            fila = {
+                "id": id_factura,
+                "rut_emisor": self.ruts[proveedor][:-2],  # sin DV, como la ingesta del SII
+                "rut_receptor": self.ruts[args.proveedores + pagador],
+                "tipo_dte": "33",
+                "folio": id_factura,
+                "monto": monto,
+                "estado_dte": estado,
+                "razon_social_emisor": f"Proveedor {proveedor + 1:05d} SpA",
+                "razon_social_receptor": f"Pagador {pagador + 1:04d}",
+                "fecha_emision": emision,
+                "fecha_vencimiento": vencimiento + timedelta(days=15) if modificado else vencimiento,
+                "fecha_vencimiento_original": vencimiento,
+                "confirming_solicitado": estado in (EstadoDTE.CONFIRMING_SOLICITADO, EstadoDTE.CONFIRMING_ADJUDICADO),
+                "origen_confirmacion": "SII" if rnd.random() < 0.6 else "Proveedor",
+                "financiador_adjudicado": None,
+                "proveedor_id": proveedor + 1,
+                "pagador_id": pagador + 1,
+            }
+
+            if fila["confirming_solicitado"]:
+                n_ofertas = poisson(rnd, args.ofertas_media)
+                if estado is EstadoDTE.CONFIRMING_ADJUDICADO:
+                    n_ofertas = max(n_ofertas, 1)
+                elegidos = rnd.sample(range(args.financiadores), min(n_ofertas, args.financiadores))
+                ganador = rnd.randrange(len(elegidos)) if estado is EstadoDTE.CONFIRMING_ADJUDICADO else None
+                for posicion, financiador in enumerate(elegidos):
+                    id_oferta += 1
+                    tasa = round(rnd.uniform(0.7, 2.2), 2)
+                    dias = max((vencimiento - self.hoy).days, 1)
+                    comision = float(rnd.choice((0, 15_000, 25_000, 50_000)))
+                    if ganador is None:
+                        estado_oferta = "Oferta realizada"
+                    else:
+                        estado_oferta = "Adjudicada" if posicion == ganador else "No adjudicada"
+                    ofertas.append({
+                        "id": id_oferta, "factura_id": id_factura, "financiador_id": financiador + 1,
+                        "tasa_interes": tasa, "dias_anticipacion": dias, "comision_flat": comision,
+                        "monto_total": float(monto),
+                        "precio_cesion": round(monto - monto * tasa / 100 * dias / 30 - comision, 2),
+                        "estado": estado_oferta,
+                    })
+                if ganador is not None:
+                    fila["financiador_adjudicado"] = elegidos[ganador] + 1
+
+            facturas.append(fila)
+            if len(facturas) == LOTE:
+                yield facturas, ofertas
+                facturas, ofertas = [], []
+        if facturas:
+            yield facturas, ofertas
+
+
+def _ajustar_secuencias(conn):
+    # PostgreSQL: tras insertar ids explícitos, las secuencias deben quedar al final
+    if conn.dialect.name != "postgresql":
+        return
+    for tabla in ("fondos", "financiadores", "proveedores", "pagadores", "facturas", "ofertas_financiamiento"):
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), COALESCE((SELECT MAX(id) FROM {tabla}), 1))"
+        )
+
+
+def poblar(engine, args):
+    from sqlalchemy import insert
+    from database import Base
+    from models import Fondo, Financiador, Proveedor, Pagador, FacturaDB, OfertaFinanciamiento
+    from utils import pwd_context
+
+    if args.recrear:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    generador = Generador(args)
+    clave_hash = pwd_context.hash(CLAVE_BENCH)  # un solo hash bcrypt para todos
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(Fondo), generador.fondos())
+        conn.execute(insert(Financiador), generador.financiadores(clave_hash))
+        proveedores = generador.proveedores(clave_hash)
+        pagadores = generador.pagadores(clave_hash)
+        conn.execute(insert(Proveedor), proveedores)
+        conn.execute(insert(Pagador), pagadores)
+    print(f"👥 {args.fondos} fondos, {args.financiadores} financiadores, "
+          f"{args.proveedores} proveedores, {args.pagadores} pagadores")
+
+    n_facturas = n_ofertas = 0
+    for facturas, ofertas in generador.lotes_facturas():
+        with engine.begin() as conn:
+            conn.execute(insert(FacturaDB), facturas)
+            if ofertas:
+                conn.execute(insert(OfertaFinanciamiento), ofertas)
+        n_facturas += len(facturas)
+        n_ofertas += len(ofertas)
+        if n_facturas % (LOTE * 10) == 0 or n_facturas == args.facturas:
+            transcurrido = time.perf_counter() - inicio
+            print(f"   {n_facturas:>10,} facturas  {n_ofertas:>10,} ofertas  "
+                  f"({n_facturas / transcurrido:,.0f} facturas/s)")
+
+    with engine.begin() as conn:
+        _ajustar_secuencias(conn)
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("ANALYZE")
+        else:
+            conn.exec_driver_sql("ANALYZE facturas")
+            conn.exec_driver_sql("ANALYZE ofertas_financiamiento")
+
+    return {
+        "clave": CLAVE_BENCH,
+        "generado": date.today().isoformat(),
+        "facturas": n_facturas,
+        "ofertas": n_ofertas,
+        # admins primero: son los únicos que pueden renovar el costo de fondos
+        "financiador": [f"fin{i + 1:05d}" for i in range(args.financiadores)],
+        "proveedor": [p["usuario"] for p in proveedores],
+        # orden Zipf: los primeros concentran la mayoría de las facturas pendientes
+        "pagador": [p["usuario"] for p in pagadores],
+    }
+
+
+def renovar_costo_fondos(engine):
+    from sqlalchemy import update
+    from models import Financiador
+
+    with engine.begin() as conn:
+        filas = conn.execute(update(Financiador).values(fecha_costo_fondos=date.today())).rowcount
+    print(f"📅 Costo de fondos renovado para {filas} financiadores")
+
+
+def ruta_manifiesto(args):
+    if args.manifiesto:
+        return args.manifiesto
+    if args.url.startswith("sqlite:///"):
+        return os.path.splitext(args.url[len("sqlite:///"):])[0] + ".usuarios.json"
+    return "carga_usuarios.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de datos sintéticos para pruebas de carga")
+    parser.add_argument("--url", default="sqlite:///./carga_treds.db", help="DATABASE_URL destino")
+    parser.add_argument("--facturas", type=int, default=1_000_000)
+    parser.add_argument("--fondos", type=int, default=200)
+    parser.add_argument("--financiadores", type=int, default=5000)
+    parser.add_argument("--proveedores", type=int, default=2000)
+    parser.add_argument("--pagadores", type=int, default=500)
+    parser.add_argument("--ofertas-media", type=float, default=3.0, help="ofertas promedio por factura en Confirming")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--recrear", action="store_true", help="borra las tablas antes de generar")
+    parser.add_argument("--manifiesto", help="JSON con los usuarios (por defecto junto a la base SQLite)")
+    parser.add_argument("--solo-costo-fondos", action="store_true",
+                        help="solo renueva fecha_costo_fondos a hoy (el marketplace lo exige)")
+    args = parser.parse_args()
+    if args.financiadores < args.fondos:
+        parser.error("--financiadores debe ser >= --fondos (cada fondo necesita un admin)")
+
+    configurar_entorno(args.url)
+    from database import crear_engine
+
+    engine = crear_engine(args.url, modo_produccion=True)
+    if args.solo_costo_fondos:
+        renovar_costo_fondos(engine)
+        return
+
+    inicio = time.perf_counter()
+    manifiesto = poblar(engine, args)
+    with open(ruta_manifiesto(args), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False)
+    print(f"✅ {manifiesto['facturas']:,} facturas y {manifiesto['ofertas']:,} ofertas en "
+          f"{time.perf_counter() - inicio:.1f}s; usuarios en {ruta_manifiesto(args)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/subir_por_partes.py
+# Cliente de referencia de la subida por partes (subidas.py): inicia la subida, manda las
+# partes que falten leyendo el archivo por tramos (memoria acotada al tamaño de parte),
+# la completa y sigue el trabajo de ingesta hasta que termina. Si la transferencia se
+# corta, volver a correrlo con --subida <id> retoma desde las partes que faltan.
+#
+#   python -m benchmarks.subir_por_partes lote.zip --usuario prov_bench --clave bench123
+#   python -m benchmarks.subir_por_partes lote.zip --usuario prov_bench --clave bench123 --subida <id>
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import requests
+
+
+def sha256_archivo(ruta, bloque=1024 * 1024):
+    hash_ = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for datos in iter(lambda: f.read(bloque), b""):
+            hash_.update(datos)
+    return hash_.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Subida por partes reanudable de un XML/ZIP")
+    parser.add_argument("archivo")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--usuario", required=True)
+    parser.add_argument("--clave", required=True)
+    parser.add_argument("--subida", help="id de una subida anterior para retomarla")
+    args = parser.parse_args()
+
+    sesion = requests.Session()
+    r = sesion.post(f"{args.base_url}/proveedor/login", data={"usuario": args.usuario, "clave": args.clave},
+                    allow_redirects=False)
+    if r.status_code != 303:
+        sys.exit(f"Login falló ({r.status_code})")
+
+    if args.subida:
+        r = sesion.get(f"{args.base_url}/proveedor/subidas/{args.subida}")
+    else:
+        r = sesion.post(f"{args.base_url}/proveedor/subidas", data={
+            "nombre": os.path.basename(args.archivo),
+            "tamano": os.path.getsize(args.archivo),
+            "sha256": sha256_archivo(args.archivo),
+        })
+    r.raise_for_status()
+    subida = r.json()
+    print(f"▶ subida {subida['id']}: {len(subida['faltantes'])} de {subida['partes']} partes por mandar")
+
+    inicio = time.perf_counter()
+    with open(args.archivo, "rb") as f:
+        for n in subida["faltantes"]:
+            f.seek(n * subida["tamano_parte"])
+            parte = f.read(subida["tamano_parte"])
+            r = sesion.put(f"{args.base_url}/proveedor/subidas/{subida['id']}/partes/{n}", data=parte,
+                           headers={"X-Parte-Sha256": hashlib.sha256(parte).hexdigest()})
+            r.raise_for_status()
+    print(f"   partes enviadas en {time.perf_counter() - inicio:.1f}s")
+
+    r = sesion.post(f"{args.base_url}/proveedor/subidas/{subida['id']}/completar")
+    if r.status_code != 202:
+        sys.exit(f"Completar falló ({r.status_code}): {r.text}")
+    trabajo = r.json()["trabajo"]
+    while True:
+        estado = sesion.get(f"{args.base_url}/proveedor/trabajos/{trabajo}").json()
+        print(f"\r   trabajo {trabajo}: {estado['estado']}  parseadas={estado['parseadas']}/{estado['total']}  "
+              f"insertadas={estado['insertadas']}  duplicadas={estado['duplicadas']}  errores={estado['errores']}",
+              end="", flush=True)
+        if estado["estado"] in ("terminado", "fallido"):
+            print()
+            break
+        time.sleep(1)
+    for error in estado["errores_detalle"][:20]:
+        print(f"   ❌ {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/verificar_consultas.py
+# Recorre las rutas calientes con SQL_MODO_PRUEBA=true y un presupuesto de consultas
+# por ruta: si una ruta lo supera (PresupuestoConsultasExcedido) o repite una misma
+# sentencia (posible N+1), sale con código 1. Los datos tienen varias facturas y
+# ofertas por estado, así que un lazy load por fila se nota de inmediato.
+#
+#   python -m benchmarks.verificar_consultas --facturas 200
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks._comun import configurar_entorno, cookie_sesion, sembrar_basico
+
+configurar_entorno(
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='treds_consultas_'), 'consultas.db')}",
+    SQL_MODO_PRUEBA="true", SQL_N_MAS_1_UMBRAL=3,
+)
+
+from fastapi.testclient import TestClient
+
+import instrumentacion
+from database import Base, SessionLocal, engine
+from estados import EstadoDTE
+from instrumentacion import PresupuestoConsultasExcedido
+from main import app
+from models import FacturaDB, OfertaFinanciamiento
+
+# ruta (plantilla) → (URL de ejemplo, presupuesto de consultas)
+RUTAS = {
+    "/financiador/marketplace": ("/financiador/marketplace", 6),
+    "/marketplace/marketplace-general": ("/marketplace/marketplace-general", 2),
+    "/proveedor/facturas": ("/proveedor/facturas", 4),
+    "/pagador/facturas": ("/pagador/facturas", 4),
+    "/financiador/inicio": ("/financiador/inicio", 2),
+    "/financiador/usuarios": ("/financiador/usuarios", 3),
+    "/configuracion/condiciones": ("/configuracion/condiciones", 3),
+    "/financiador/ofertar/{folio}": ("/financiador/ofertar/{folio}", 3),
+    "/proveedor/ofertas-folio/{folio}": ("/proveedor/ofertas-folio/{folio}", 4),
+}
+
+USUARIOS = {"financiador": "fin_bench", "proveedor": "prov_bench", "pagador": "pag_bench"}
+
+
+class LineasSQL(logging.Handler):
+    """Guarda la última línea JSON de "treds.sql" (una por request)."""
+
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.ultima = None
+
+    def emit(self, record):
+        self.ultima = json.loads(record.getMessage())
+
+
+def sembrar(n_facturas):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        ids = sembrar_basico(db, n_facturas)
+        solicitadas = db.query(FacturaDB).filter(FacturaDB.estado_dte == EstadoDTE.CONFIRMING_SOLICITADO).all()
+        for factura in solicitadas:
+            db.add(OfertaFinanciamiento(
+                factura_id=factura.id, financiador_id=ids["financiador_id"],
+                tasa_interes=1.0, dias_anticipacion=30, comision_flat=0.0,
+                precio_cesion=factura.monto * 0.98, estado="Oferta realizada",
+            ))
+        db.commit()
+        return solicitadas[0].folio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de consultas y N+1 por ruta")
+    parser.add_argument("--facturas", type=int, default=200)
+    args = parser.parse_args()
+
+    folio = sembrar(args.facturas)
+    instrumentacion.PRESUPUESTOS.update({ruta: presupuesto for ruta, (_, presupuesto) in RUTAS.items()})
+
+    lineas = LineasSQL()
+    logger = logging.getLogger("treds.sql")
+    logger.addHandler(lineas)
+    logger.setLevel(logging.INFO)
+
+    fallas = 0
+    with TestClient(app) as cliente:
+        for rol, usuario in USUARIOS.items():
+            cookie_sesion(cliente, rol, usuario)
+
+        for ruta, (url, presupuesto) in RUTAS.items():
+            lineas.ultima = None
+            try:
+                respuesta = cliente.get(url.format(folio=folio), follow_redirects=False)
+            except PresupuestoConsultasExcedido as exc:
+                fallas += 1
+                print(f"❌ {ruta:<36} supera {presupuesto} consultas")
+                print(f"     {str(exc).splitlines()[0]}")
+                continue
+
+            linea = lineas.ultima or {}
+            if respuesta.status_code >= 500:
+                fallas += 1
+                print(f"❌ {ruta:<36} status {respuesta.status_code}")
+            elif linea.get("n_mas_1"):
+                fallas += 1
+                print(f"❌ {ruta:<36} posible N+1")
+                for repetida in linea["n_mas_1"]:
+                    print(f"     {repetida['veces']}× {repetida['sentencia']}")
+            else:
+                print(f"✅ {ruta:<36} {linea.get('consultas', '?'):>3}/{presupuesto} consultas  ({respuesta.status_code})")
+
+    if fallas:
+        print(f"\n{fallas} ruta(s) superan su presupuesto de consultas")
+        sys.exit(1)
+    print("\nTodas las rutas dentro de su presupuesto")
+
+
+if __name__ == "__main__":
+    main()
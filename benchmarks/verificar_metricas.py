@@ -0,0 +1,102 @@
+# benchmarks/verificar_metricas.py
+# Genera tráfico contra la app en proceso (TestClient, sin servidor ni Prometheus) y
+# valida /metrics: formato de texto, histogramas acumulativos con +Inf == _count, y que
+# estén las series de rutas, pool, subidas e ingesta. Sale con código 1 si algo falla.
+#
+#   python -m benchmarks.verificar_metricas
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks._comun import configurar_entorno, cookie_sesion, sembrar_basico, xml_factura
+
+configurar_entorno(f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='treds_metricas_'), 'metricas.db')}")
+
+from fastapi.testclient import TestClient
+
+from database import Base, SessionLocal, engine
+from main import app
+
+LINEA = re.compile(r'^(?P<nombre>[a-zA-Z_:][a-zA-Z0-9_:]*)(?P<etiquetas>\{.*\})? (?P<valor>[-+0-9.eE]+|\+Inf|NaN)$')
+ESPERADAS = [
+    'treds_http_requests_total{metodo="GET",router="financiador",ruta="/financiador/marketplace",status="200"}',
+    'treds_http_request_duracion_segundos_count{metodo="GET",router="proveedor",ruta="/proveedor/ofertas-folio/{folio}"}',
+    'treds_db_pool_espera_segundos_count{driver="pysqlite"}',
+    'treds_subidas_total{tipo="xml"}',
+    'treds_facturas_ingeridas_total{origen="xml",resultado="nueva"}',
+    'treds_ingesta_duracion_segundos_count{origen="xml"}',
+    'treds_ingesta_etapa_segundos_count{origen="xml",etapa="recepcion"}',
+    'treds_ingesta_etapa_segundos_count{origen="xml",etapa="parseo"}',
+    'treds_trabajos_total{tipo="subida_xml",estado="terminado"}',
+    'treds_trabajos_en_cola',
+]
+
+
+def validar(texto):
+    errores, valores = [], {}
+    buckets = defaultdict(list)
+    for numero, linea in enumerate(texto.splitlines(), 1):
+        if not linea or linea.startswith("# HELP ") or linea.startswith("# TYPE "):
+            continue
+        coincidencia = LINEA.match(linea)
+        if not coincidencia:
+            errores.append(f"línea {numero} inválida: {linea}")
+            continue
+        nombre, etiquetas, valor = coincidencia["nombre"], coincidencia["etiquetas"] or "", coincidencia["valor"]
+        valores[nombre + etiquetas] = float(valor)
+        if nombre.endswith("_bucket"):
+            serie = nombre[:-len("_bucket")] + re.sub(r',?le="[^"]*"', "", etiquetas).replace("{,", "{")
+            buckets[serie.replace("{}", "")].append(float(valor))
+
+    for serie, conteos in buckets.items():
+        if conteos != sorted(conteos):
+            errores.append(f"{serie}: buckets no acumulativos {conteos}")
+        base, _, etiquetas = serie.partition("{")
+        total = valores.get(f"{base}_count" + (f"{{{etiquetas}" if etiquetas else ""))
+        if total != conteos[-1]:
+            errores.append(f"{serie}: +Inf={conteos[-1]} distinto de _count={total}")
+
+    errores += [f"falta la serie {serie}" for serie in ESPERADAS if serie not in valores]
+    return errores, len(valores)
+
+
+def esperar_trabajo(cliente, trabajo_id, timeout=30):
+    """La subida se ingiere en segundo plano: las series de ingesta aparecen al terminar."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if cliente.get(f"/proveedor/trabajos/{trabajo_id}").json()["estado"] in ("terminado", "fallido"):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"El trabajo {trabajo_id} no terminó en {timeout}s")
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        sembrar_basico(db, 20)
+
+    with TestClient(app) as cliente:
+        for rol, usuario in (("financiador", "fin_bench"), ("proveedor", "prov_bench"), ("pagador", "pag_bench")):
+            cookie_sesion(cliente, rol, usuario)
+        for url in ("/financiador/marketplace", "/pagador/facturas", "/proveedor/ofertas-folio/100003", "/no-existe"):
+            cliente.get(url, follow_redirects=False)
+        subida = cliente.post("/proveedor/facturas", headers={"Accept": "application/json"},
+                              files={"archivo": ("metricas.xml", xml_factura(990001), "text/xml")})
+        esperar_trabajo(cliente, subida.json()["trabajo"])
+        respuesta = cliente.get("/metrics")
+
+    errores, series = validar(respuesta.text)
+    if respuesta.status_code != 200 or not respuesta.headers["content-type"].startswith("text/plain; version=0.0.4"):
+        errores.append(f"/metrics respondió {respuesta.status_code} {respuesta.headers.get('content-type')}")
+    for error in errores:
+        print(f"❌ {error}")
+    if errores:
+        sys.exit(1)
+    print(f"✅ /metrics válido: {series} series")
+
+
+if __name__ == "__main__":
+    main()
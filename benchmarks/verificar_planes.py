@@ -0,0 +1,118 @@
+# benchmarks/verificar_planes.py
+# Aplica las migraciones sobre una base SQLite temporal y revisa con
+# EXPLAIN QUERY PLAN que cada consulta caliente siga usando su índice.
+# Sale con código 1 si alguna consulta deja de usar el índice esperado,
+# para poder correrlo en CI:
+#
+#   python -m benchmarks.verificar_planes
+import os
+import sys
+import tempfile
+
+from benchmarks._comun import RAIZ, configurar_entorno
+
+configurar_entorno(f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='treds_planes_'), 'planes.db')}")
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event, select, update
+
+from database import engine
+from estados import EstadoDTE, origenes
+from models import FacturaDB, OfertaFinanciamiento, Financiador
+
+
+def consultas():
+    """(descripción, sentencia, índice esperado) — mismas expresiones que usan los routers."""
+    return [
+        ("marketplace: disponibles",
+         select(FacturaDB).where(FacturaDB.estado_dte == EstadoDTE.CONFIRMING_SOLICITADO,
+                                 FacturaDB.financiador_adjudicado.is_(None)),
+         "ix_facturas_estado_adjudicado"),
+        ("marketplace: mías",
+         select(FacturaDB).where(FacturaDB.financiador_adjudicado == 1,
+                                 FacturaDB.estado_dte == EstadoDTE.CONFIRMING_ADJUDICADO),
+         "ix_facturas_estado_adjudicado"),
+        ("marketplace: otras",
+         select(FacturaDB).where(FacturaDB.estado_dte == EstadoDTE.CONFIRMING_ADJUDICADO,
+                                 FacturaDB.financiador_adjudicado != 1),
+         "ix_facturas_estado_adjudicado"),
+        ("facturas adjudicadas a un financiador (FK)",
+         select(FacturaDB).where(FacturaDB.financiador_adjudicado == 1),
+         "ix_facturas_financiador_adjudicado"),
+        ("marketplace general",
+         select(FacturaDB).where(FacturaDB.estado_dte == EstadoDTE.CONFIRMING_SOLICITADO),
+         "ix_facturas_estado_adjudicado"),
+        ("pagador: pendientes",
+         select(FacturaDB).where(FacturaDB.rut_receptor == "76123456-7",
+                                 FacturaDB.estado_dte == EstadoDTE.CONFIRMACION_SOLICITADA),
+         "ix_facturas_receptor_estado"),
+        ("pagador: gestionadas",
+         select(FacturaDB).where(FacturaDB.rut_receptor == "76123456-7",
+                                 FacturaDB.estado_dte.in_([EstadoDTE.CONFIRMADA, EstadoDTE.CONFIRMING_ADJUDICADO])),
+         "ix_facturas_receptor_estado"),
+        ("pagador: confirmar en lote",
+         update(FacturaDB).where(FacturaDB.estado_dte.in_(origenes(EstadoDTE.CONFIRMADA)),
+                                 FacturaDB.folio.in_([9005, 9006]),
+                                 FacturaDB.rut_receptor == "76123456-7")
+         .values(estado_dte=EstadoDTE.CONFIRMADA),
+         "ix_facturas_receptor_estado"),
+        ("rutas por folio",
+         select(FacturaDB).where(FacturaDB.folio == 9005),
+         "ix_facturas_folio"),
+        ("proveedor: listado",
+         select(FacturaDB).where(FacturaDB.proveedor_id == 1),
+         "ix_facturas_proveedor_id"),
+        ("dedupe (rut_emisor, rut_receptor, folio)",
+         select(FacturaDB.id).where(FacturaDB.rut_emisor == "76262370-6",
+                                    FacturaDB.rut_receptor == "76123456-7",
+                                    FacturaDB.folio == 9005),
+         "sqlite_autoindex_facturas_1"),
+        ("ofertas por factura",
+         select(OfertaFinanciamiento).where(OfertaFinanciamiento.factura_id == 1),
+         "ix_ofertas_financiamiento_factura_id"),
+        ("ofertas del fondo",
+         select(OfertaFinanciamiento).join(OfertaFinanciamiento.financiador).where(Financiador.fondo_id == 1),
+         "ix_ofertas_financiamiento_financiador_id"),
+    ]
+
+
+def plan(conn, sentencia):
+    capturas = []
+
+    def capturar(_conn, _cursor, statement, parameters, _context, _executemany):
+        capturas.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", capturar)
+    try:
+        conn.execute(sentencia)
+    finally:
+        event.remove(conn, "before_cursor_execute", capturar)
+    statement, parameters = capturas[-1]
+    filas = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [fila[-1] for fila in filas]
+
+
+def main():
+    config = Config(os.path.join(RAIZ, "alembic.ini"))
+    command.upgrade(config, "head")
+
+    fallas = 0
+    with engine.connect() as conn:
+        for descripcion, sentencia, indice in consultas():
+            detalle = plan(conn, sentencia)
+            ok = any(indice in linea for linea in detalle)
+            fallas += not ok
+            print(f"{'✅' if ok else '❌'} {descripcion:<42} espera {indice}")
+            if not ok:
+                for linea in detalle:
+                    print(f"     {linea}")
+
+    if fallas:
+        print(f"\n{fallas} consulta(s) dejaron de usar su índice")
+        sys.exit(1)
+    print("\nTodas las consultas usan su índice")
+
+
+if __name__ == "__main__":
+    main()
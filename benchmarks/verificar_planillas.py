@@ -0,0 +1,61 @@
+# benchmarks/verificar_planillas.py
+# Importa una planilla CSV chica sobre una base SQLite temporal y revisa que cada monto
+# quede con el valor que tiene en la planilla: separador de miles ("1.250.000"), el ".0"
+# que deja Excel al guardar CSV ("1250.0") y enteros tal cual; un decimal de verdad
+# ("1250.5") tiene que ir al CSV de errores, no quedar guardado. Sale con código 1 si
+# algo no cuadra, para poder correrlo en CI:
+#
+#   python -m benchmarks.verificar_planillas
+import io
+import os
+import sys
+import tempfile
+
+from benchmarks._comun import RUT_PAGADOR, configurar_entorno, sembrar_basico
+
+configurar_entorno(
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='treds_planillas_'), 'planillas.db')}",
+    PLANILLAS_DIR=tempfile.mkdtemp(prefix="treds_planillas_errores_"),
+)
+
+import planillas
+from database import Base, SessionLocal, engine
+from models import FacturaDB, Proveedor
+
+# folio → (monto en la planilla, monto esperado en la BD o None si la fila debe fallar)
+CASOS = {
+    400001: ("1.250.000", 1250000),
+    400002: ("1250.0", 1250),
+    400003: ("1250.00", 1250),
+    400004: ("1250", 1250),
+    400005: ("1250.5", None),
+    400006: ("12.50.000", None),
+}
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    filas = ["folio;rut_receptor;monto;fecha_emision;fecha_vencimiento"]
+    filas += [f"{folio};{RUT_PAGADOR};{monto};2026-07-01;2026-09-01" for folio, (monto, _) in CASOS.items()]
+    with SessionLocal() as db:
+        sembrar_basico(db, 0)
+        proveedor = db.query(Proveedor).one()
+        resumen = planillas.importar(db, io.BytesIO("\n".join(filas).encode()), "verificar.csv", proveedor)
+        guardados = dict(db.query(FacturaDB.folio, FacturaDB.monto).filter(FacturaDB.folio.in_(CASOS)).all())
+
+    fallas = 0
+    for folio, (monto, esperado) in CASOS.items():
+        obtenido = guardados.get(folio)
+        ok = obtenido == esperado
+        fallas += not ok
+        destino = f"monto {esperado:,}" if esperado is not None else "error de fila"
+        print(f"{'✅' if ok else '❌'} {monto!r:<14} espera {destino:<18} quedó {obtenido!r}")
+
+    if fallas:
+        print(f"\n{fallas} monto(s) no se importaron como se esperaba ({resumen})")
+        sys.exit(1)
+    print("\nTodos los montos se importaron con su valor")
+
+
+if __name__ == "__main__":
+    main()
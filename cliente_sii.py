@@ -0,0 +1,181 @@
+# cliente_sii.py
+# Cliente HTTP de las APIs del Registro de Compras y Ventas (RCV) del SII, para usar en
+# proceso desde la app y la sincronización en vez de correr los scripts de selenium_scripts/.
+#
+# Una sola requests.Session con keep-alive: el pool de conexiones (SII_POOL por host) se
+# reutiliza entre consultas y entre hilos, cada request tiene timeout de conexión y de
+# lectura, y los errores transitorios (conexión, 429, 5xx) se reintentan con backoff
+# exponencial respetando Retry-After. Cada consulta queda en treds_sii_consulta_duracion_segundos.
+#
+#   cliente = obtener_cliente()
+#   documentos = cliente.detalle_venta("76262370", "6", "2025-07", cookies, token_recaptcha)
+#   for r in cliente.resumen_ventas("76262370", "6", "2025-07", cookies):
+#       print(r.tipo_doc, r.documentos)
+import http.cookiejar
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metricas import medir_sii
+
+load_dotenv()
+
+SII_TIMEOUT_CONEXION = float(os.getenv("SII_TIMEOUT_CONEXION", "5"))    # segundos
+SII_TIMEOUT_LECTURA = float(os.getenv("SII_TIMEOUT_LECTURA", "60"))     # el detalle de un mes grande tarda
+SII_REINTENTOS = int(os.getenv("SII_REINTENTOS", "3"))
+SII_BACKOFF = float(os.getenv("SII_BACKOFF", "0.5"))                    # 0.5, 1, 2, ... segundos entre intentos
+SII_POOL = int(os.getenv("SII_POOL", "10"))                             # conexiones keep-alive por host
+
+URL_BASE = "https://www4.sii.cl"
+_FACHADA = "/consdcvinternetui/services/data/facadeService"
+_NAMESPACE = "cl.sii.sdi.lob.diii.consdcv.data.api.interfaces.FacadeService"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "application/json, text/plain, */*",
+    "Content-Type": "application/json;charset=UTF-8",
+    "Origin": URL_BASE,
+    "Referer": f"{URL_BASE}/consdcvinternetui/",
+}
+
+
+class ErrorSII(RuntimeError):
+    pass
+
+
+class ResumenTipo(NamedTuple):
+    tipo_doc: int
+    documentos: int
+    monto_total: int
+    datos: dict   # registro completo del SII (rsmn*)
+
+
+def cookies_como_dict(raw_cookies: List[dict]) -> Dict[str, str]:
+    """Cookies como las guarda Selenium (lista de dicts) → {nombre: valor}."""
+    return {cookie["name"]: cookie["value"] for cookie in raw_cookies}
+
+
+def url_fachada(url_base: str, metodo: str) -> str:
+    return f"{url_base.rstrip('/')}{_FACHADA}/{metodo}"
+
+
+def payload_fachada(metodo: str, cookies: Dict[str, str], datos: dict) -> dict:
+    """Cuerpo de una consulta al facadeService; la conversación es la cookie CSESSIONID."""
+    conversation_id = cookies.get("CSESSIONID")
+    if not conversation_id:
+        raise ErrorSII("No se encontró la cookie 'CSESSIONID'. Requiere nuevo login.")
+    return {
+        "metaData": {
+            "namespace": f"{_NAMESPACE}/{metodo}",
+            "conversationId": conversation_id,
+            "transactionId": str(int(time.time() * 1000)),
+        },
+        "data": datos,
+    }
+
+
+def datos_detalle_venta(rut: str, dv: str, periodo: str, tipo_doc, token_recaptcha: str) -> dict:
+    return {
+        "rutEmisor": rut,
+        "dvEmisor": dv,
+        "ptributario": periodo.replace("-", ""),   # Ej: "202507"
+        "codTipoDoc": str(tipo_doc),
+        "operacion": "",
+        "estadoContab": "",
+        "accionRecaptcha": "RCV_DETV",
+        "tokenRecaptcha": token_recaptcha,
+    }
+
+
+def lista_data(metodo: str, respuesta: dict) -> list:
+    if not isinstance(respuesta.get("data"), list):
+        raise ErrorSII(f"{metodo}: la respuesta no trae la lista 'data': {str(respuesta)[:500]}")
+    return respuesta["data"]
+
+
+class ClienteSII:
+    """Cliente del RCV con sesión HTTP compartida. Es seguro usarlo desde varios hilos: la
+    sesión no guarda cookies propias, cada consulta manda las del RUT que consulta."""
+
+    def __init__(self, url_base: str = URL_BASE, timeout=(SII_TIMEOUT_CONEXION, SII_TIMEOUT_LECTURA),
+                 reintentos: int = SII_REINTENTOS, backoff: float = SII_BACKOFF, pool: int = SII_POOL):
+        self.url_base = url_base.rstrip("/")
+        self.timeout = timeout
+        self.sesion = requests.Session()
+        self.sesion.headers.update(HEADERS)
+        # Con varios RUT sobre la misma sesión, un Set-Cookie de uno no debe viajar en la consulta de otro
+        self.sesion.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        reintento = Retry(
+            total=reintentos, connect=reintentos, read=reintentos, status=reintentos,
+            backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,             # las consultas del RCV son POST, pero solo leen
+            respect_retry_after_header=True, raise_on_status=False,
+        )
+        adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=reintento)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+    def cerrar(self) -> None:
+        self.sesion.close()
+
+    def _consultar(self, metodo: str, operacion: str, cookies: Dict[str, str], datos: dict) -> dict:
+        payload = payload_fachada(metodo, cookies, datos)
+        with medir_sii(operacion):
+            try:
+                respuesta = self.sesion.post(url_fachada(self.url_base, metodo), json=payload, cookies=cookies,
+                                             timeout=self.timeout)
+            except requests.RequestException as e:
+                raise ErrorSII(f"{metodo}: {e.__class__.__name__}: {e}") from e
+            if respuesta.status_code != 200:
+                raise ErrorSII(f"{metodo}: el SII respondió {respuesta.status_code}: {respuesta.text[:500]}")
+            try:
+                return respuesta.json()
+            except ValueError:
+                raise ErrorSII(f"{metodo}: la respuesta no es JSON: {respuesta.text[:500]}")
+
+    def detalle_venta(self, rut: str, dv: str, periodo: str, cookies: Dict[str, str], token_recaptcha: str,
+                      tipo_doc: str = "33") -> List[dict]:
+        """getDetalleVenta: documentos de `tipo_doc` emitidos por el RUT en el periodo YYYY-MM."""
+        respuesta = self._consultar("getDetalleVenta", "detalle_venta", cookies,
+                                    datos_detalle_venta(rut, dv, periodo, tipo_doc, token_recaptcha))
+        return lista_data("getDetalleVenta", respuesta)
+
+    def resumen_ventas(self, rut: str, dv: str, periodo: str, cookies: Dict[str, str]) -> List[ResumenTipo]:
+        """getResumen: documentos y monto por tipo de DTE del registro de ventas del periodo."""
+        respuesta = self._consultar("getResumen", "resumen", cookies, {
+            "rutEmisor": rut,
+            "dvEmisor": dv,
+            "ptributario": periodo.replace("-", ""),
+            "estadoContab": "REGISTRO",
+            "operacion": "VENTA",
+            "busquedaInicial": True,
+        })
+        return [ResumenTipo(int(r.get("rsmnTipoDocInteger") or 0), int(r.get("rsmnTotDoc") or 0),
+                            int(r.get("rsmnMntTotal") or 0), r) for r in lista_data("getResumen", respuesta)]
+
+
+_cliente: Optional[ClienteSII] = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_cliente() -> ClienteSII:
+    """Cliente compartido del proceso, creado en el primer uso: así todas las consultas
+    reutilizan las mismas conexiones."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteSII()
+        return _cliente
+
+
+def cerrar_cliente() -> None:
+    global _cliente
+    with _cliente_lock:
+        if _cliente is not None:
+            _cliente.cerrar()
+            _cliente = None
@@ -0,0 +1,222 @@
+# credenciales_sii.py
+# Caché por RUT de la sesión SII (cookies) y del tokenRecaptcha, para que la sincronización no
+# haga un login con Selenium en cada pasada ni saque un token por cada periodo.
+#
+# La sesión de cada proveedor vive en su archivo Proveedor.cookies_sii_path y en memoria:
+#   • se guarda con su vencimiento: el menor entre el `expiry` de TOKEN / CSESSIONID y
+#     SII_SESION_TTL segundos desde el login (el SII corta las sesiones por su lado);
+#   • antes de usarla se valida con una consulta liviana (getResumen del mes en curso), a lo
+#     más cada SII_SESION_VALIDEZ segundos; una consulta que anduvo bien también la valida;
+#   • si le quedan menos de SII_SESION_MARGEN segundos, o no pasó la validación, se renueva
+#     con un login (Proveedor.clave_sii) en un navegador del pool de navegadores_sii.py.
+# El tokenRecaptcha se reutiliza SII_TOKEN_TTL segundos; si el SII lo rechaza, quien lo usó
+# lo invalida y pide otro.
+#
+#   credenciales = obtener_credenciales()
+#   cookies = credenciales.cookies(proveedor)        # puede actualizar proveedor.cookies_sii_path
+#   token = credenciales.token("76262370", cookies, "2025-07")
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from cliente_sii import ErrorSII, cookies_como_dict, obtener_cliente
+from metricas import SII_CREDENCIALES
+from navegadores_sii import obtener_navegadores
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sii")
+
+SII_COOKIES_DIR = os.getenv("SII_COOKIES_DIR", os.path.join("selenium_scripts", "facturas_sii", "cookies"))
+SII_SESION_TTL = int(os.getenv("SII_SESION_TTL", "3600"))           # vida de una sesión desde el login
+SII_SESION_MARGEN = int(os.getenv("SII_SESION_MARGEN", "300"))      # se renueva si le queda menos que esto
+SII_SESION_VALIDEZ = int(os.getenv("SII_SESION_VALIDEZ", "300"))    # cuánto se confía en una validación
+SII_TOKEN_TTL = int(os.getenv("SII_TOKEN_TTL", "100"))              # los tokens reCAPTCHA vencen a los 2 min
+
+_ESENCIALES = ("TOKEN", "CSESSIONID")
+
+# Origen de lo entregado (etiqueta "origen" de treds_sii_credenciales_total)
+CACHE = "cache"
+VALIDADA = "validada"
+LOGIN = "login"
+NUEVO = "nuevo"
+
+
+class Sesion:
+    def __init__(self, cookies: List[dict], obtenidas: float, vence: float):
+        self.cookies = cookies
+        self.obtenidas = obtenidas
+        self.vence = vence
+        self.validada = 0.0                 # time.time() de la última validación
+        self.token: Optional[str] = None
+        self.token_vence = 0.0
+
+
+def ruta_cookies(rut_base: str) -> str:
+    return os.path.join(SII_COOKIES_DIR, f"cookies_{rut_base}.json")
+
+
+def vencimiento(cookies: List[dict], obtenidas: float) -> float:
+    """Hasta cuándo sirve la sesión (epoch): el login más SII_SESION_TTL, o antes si TOKEN
+    o CSESSIONID vencen antes."""
+    vence = obtenidas + SII_SESION_TTL
+    for cookie in cookies:
+        if cookie.get("name") in _ESENCIALES and cookie.get("expiry"):
+            vence = min(vence, float(cookie["expiry"]))
+    return vence
+
+
+def leer_sesion(ruta: str) -> Sesion:
+    """Archivo de cookies de un proveedor: el que escribe guardar_sesion ({"obtenidas",
+    "vence", "cookies"}) o la lista tal cual de driver.get_cookies(), que se fecha por el
+    archivo."""
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    if isinstance(datos, list):
+        obtenidas = os.path.getmtime(ruta)
+        return Sesion(datos, obtenidas, vencimiento(datos, obtenidas))
+    return Sesion(datos["cookies"], datos["obtenidas"], datos["vence"])
+
+
+def guardar_sesion(ruta: str, sesion: Sesion) -> None:
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"obtenidas": sesion.obtenidas, "vence": sesion.vence, "cookies": sesion.cookies}, f, indent=2)
+    os.replace(temporal, ruta)   # otro proceso nunca lee un archivo a medio escribir
+
+
+def validar_sesion(rut_base: str, dv: str, cookies: List[dict]) -> bool:
+    """La sesión sirve si el SII contesta el resumen de ventas del mes en curso."""
+    try:
+        obtener_cliente().resumen_ventas(rut_base, dv, f"{date.today():%Y-%m}", cookies_como_dict(cookies))
+        return True
+    except ErrorSII as e:
+        logger.info("Sesión SII de %s no válida: %s", rut_base, e)
+        return False
+
+
+def login_sii(rut_base: str, rut_completo: str, clave: str) -> List[dict]:
+    with obtener_navegadores().prestar(rut_base, []) as navegador:
+        return navegador.iniciar_sesion(rut_base, rut_completo, clave)
+
+
+def obtener_token(rut_base: str, cookies: List[dict], periodo: str) -> str:
+    with obtener_navegadores().prestar(rut_base, cookies) as navegador:
+        return navegador.token_recaptcha(periodo)
+
+
+class CacheCredenciales:
+    def __init__(self, validar: Callable = validar_sesion, login: Callable = login_sii,
+                 token: Callable = obtener_token):
+        self._validar = validar
+        self._login = login
+        self._token = token
+        self._sesiones: Dict[str, Sesion] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_rut(self, rut_base: str) -> threading.Lock:
+        # Un lock por RUT: dos hilos con el mismo proveedor no hacen dos logins
+        with self._lock:
+            return self._locks.setdefault(rut_base, threading.Lock())
+
+    def cookies(self, proveedor) -> List[dict]:
+        """Cookies vigentes y validadas del proveedor, renovándolas si hace falta. Si se
+        crea el archivo, deja la ruta en proveedor.cookies_sii_path (el llamador hace commit)."""
+        rut_completo = proveedor.rut.replace(".", "").replace("-", "").upper()
+        rut_base, dv = rut_completo[:-1], rut_completo[-1]
+        ruta = proveedor.cookies_sii_path or ruta_cookies(rut_base)
+        with self._lock_rut(rut_base):
+            sesion = self._sesiones.get(rut_base)
+            if sesion is None and os.path.exists(ruta):
+                try:
+                    sesion = leer_sesion(ruta)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning("Archivo de sesión SII ilegible %s: %s", ruta, e)
+            ahora = time.time()
+            vigente = sesion is not None and sesion.vence - ahora > SII_SESION_MARGEN
+            # Sin clave no hay cómo renovarla: se prueba aunque esté por vencer
+            if sesion is not None and (vigente or not proveedor.clave_sii):
+                if vigente and ahora - sesion.validada < SII_SESION_VALIDEZ:
+                    SII_CREDENCIALES.inc(credencial="sesion", origen=CACHE)
+                    self._sesiones[rut_base] = sesion
+                    return sesion.cookies
+                if self._validar(rut_base, dv, sesion.cookies):
+                    sesion.validada = ahora
+                    SII_CREDENCIALES.inc(credencial="sesion", origen=VALIDADA)
+                    self._sesiones[rut_base] = sesion
+                    return sesion.cookies
+            # Sin sesión, por vencer o rechazada por el SII: login
+            self._sesiones.pop(rut_base, None)
+            if not proveedor.clave_sii:
+                estado = "no es válida" if sesion is not None else f"no está guardada ({ruta})"
+                raise ErrorSII(f"La sesión SII de {rut_completo} {estado} y el proveedor no tiene clave SII "
+                               "para renovarla: hay que iniciar sesión a mano")
+            cookies = self._login(rut_base, rut_completo, proveedor.clave_sii)
+            obtenidas = time.time()
+            sesion = Sesion(cookies, obtenidas, vencimiento(cookies, obtenidas))
+            sesion.validada = obtenidas
+            guardar_sesion(ruta, sesion)
+            proveedor.cookies_sii_path = ruta
+            self._sesiones[rut_base] = sesion
+            SII_CREDENCIALES.inc(credencial="sesion", origen=LOGIN)
+            logger.info("Sesión SII de %s renovada (vence %s)", rut_completo,
+                        time.strftime("%H:%M", time.localtime(sesion.vence)))
+            return cookies
+
+    def confirmar(self, rut_base: str) -> None:
+        """Una consulta con la sesión anduvo bien: vale como validación."""
+        sesion = self._sesiones.get(rut_base)
+        if sesion is not None:
+            sesion.validada = time.time()
+
+    def invalidar(self, rut_base: str) -> None:
+        """El SII rechazó la sesión: la próxima vez se valida (y si no pasa, login)."""
+        sesion = self._sesiones.get(rut_base)
+        if sesion is not None:
+            sesion.validada = 0.0
+            sesion.token = None
+
+    def token_vigente(self, rut_base: str) -> Optional[str]:
+        sesion = self._sesiones.get(rut_base)
+        if sesion is not None and sesion.token and sesion.token_vence > time.time():
+            return sesion.token
+        return None
+
+    def token(self, rut_base: str, cookies: List[dict], periodo: str) -> str:
+        """tokenRecaptcha del RUT: el último si todavía no vence, o uno nuevo."""
+        token = self.token_vigente(rut_base)
+        if token:
+            SII_CREDENCIALES.inc(credencial="token", origen=CACHE)
+            return token
+        token = self._token(rut_base, cookies, periodo)
+        SII_CREDENCIALES.inc(credencial="token", origen=NUEVO)
+        sesion = self._sesiones.get(rut_base)
+        if sesion is not None and sesion.cookies is cookies and SII_TOKEN_TTL > 0:
+            sesion.token, sesion.token_vence = token, time.time() + SII_TOKEN_TTL
+        return token
+
+    def invalidar_token(self, rut_base: str) -> None:
+        sesion = self._sesiones.get(rut_base)
+        if sesion is not None:
+            sesion.token = None
+
+
+_credenciales: Optional[CacheCredenciales] = None
+_credenciales_lock = threading.Lock()
+
+
+def obtener_credenciales() -> CacheCredenciales:
+    """Caché compartido del proceso."""
+    global _credenciales
+    with _credenciales_lock:
+        if _credenciales is None:
+            _credenciales = CacheCredenciales()
+        return _credenciales
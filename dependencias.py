@@ -0,0 +1,80 @@
+# dependencias.py
+# Dependencias compartidas por los routers: sesión de BD única por request y el
+# usuario autenticado (proveedor / pagador / financiador) cargado una sola vez.
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db, get_async_db
+from models import Proveedor, Pagador, Financiador
+
+# rol → (modelo, clave en request.session, login al que se redirige)
+ROLES = {
+    "proveedor": (Proveedor, "proveedor_id", "/proveedor/login"),
+    "pagador": (Pagador, "pagador_id", "/pagador/login"),
+    "financiador": (Financiador, "financiador_id", "/financiador/login"),
+}
+
+
+class LoginRequerido(Exception):
+    """La ruta exige un rol y no hay sesión válida; main.py la transforma en un 303 al login."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+
+def _principales(request: Request) -> dict:
+    # Memo por request: cualquier dependencia (o plantilla vía request.state) reutiliza el objeto
+    if not hasattr(request.state, "principales"):
+        request.state.principales = {}
+    return request.state.principales
+
+
+def cargar_principal(request: Request, db: Session, rol: str):
+    principales = _principales(request)
+    if rol not in principales:
+        modelo, clave, _ = ROLES[rol]
+        principal_id = request.session.get(clave)
+        principales[rol] = db.get(modelo, principal_id) if principal_id else None
+    return principales[rol]
+
+
+async def cargar_principal_async(request: Request, db: AsyncSession, rol: str):
+    principales = _principales(request)
+    if rol not in principales:
+        modelo, clave, _ = ROLES[rol]
+        principal_id = request.session.get(clave)
+        principales[rol] = await db.get(modelo, principal_id) if principal_id else None
+    return principales[rol]
+
+
+def _validar(principal, rol: str, solo_admin: bool):
+    if principal is None:
+        raise LoginRequerido(ROLES[rol][2])
+    if solo_admin and not principal.es_admin:
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    return principal
+
+
+def requiere(rol: str, solo_admin: bool = False):
+    """Dependencia que entrega el usuario logeado del rol pedido (o redirige al login)."""
+    def dependencia(request: Request, db: Session = Depends(get_db)):
+        return _validar(cargar_principal(request, db, rol), rol, solo_admin)
+    return dependencia
+
+
+def requiere_async(rol: str, solo_admin: bool = False):
+    """Versión para rutas `async def` que usan Depends(get_async_db)."""
+    async def dependencia(request: Request, db: AsyncSession = Depends(get_async_db)):
+        return _validar(await cargar_principal_async(request, db, rol), rol, solo_admin)
+    return dependencia
+
+
+proveedor_actual = requiere("proveedor")
+pagador_actual = requiere("pagador")
+financiador_actual = requiere("financiador")
+financiador_admin = requiere("financiador", solo_admin=True)
+
+proveedor_actual_async = requiere_async("proveedor")
+pagador_actual_async = requiere_async("pagador")
+financiador_actual_async = requiere_async("financiador")
@@ -0,0 +1,261 @@
+# descarga_sii.py
+# Descarga concurrente del detalle de ventas del SII: varios RUT × periodos × tipos de DTE
+# (33, 34, 46, 56, 61) a la vez con httpx.AsyncClient, en vez de un RUT, un periodo y un tipo
+# por corrida de detalle_dte.py.
+#
+#   • A lo más SII_DESCARGA_CONCURRENCIA consultas en vuelo en total (un semáforo global).
+#   • A lo más SII_DESCARGA_RPS consultas por segundo a cada host: el SII corta a quien lo
+#     satura, y no importa cuántos RUT haya en la cola.
+#   • Errores de conexión, 429 y 5xx se reintentan SII_DESCARGA_REINTENTOS veces con backoff
+#     exponencial y jitter completo (y al menos lo que diga Retry-After), para que las
+#     consultas que fallaron juntas no vuelvan a llegar juntas.
+#   • Cada respuesta se escribe apenas llega en detalle_{rut}_{periodo}.jsonl (un documento por
+#     línea, lo que importacion_sii lee en streaming). El archivo aparece completo, con todos
+#     los tipos, o no aparece: mientras tanto es un .jsonl.tmp. Al importarlo solo se cargan
+#     las facturas (importacion_sii.TIPOS_FACTURA); las notas de crédito y débito se omiten.
+#
+# Los tokenRecaptcha salen del caché por RUT de credenciales_sii (un navegador del pool si hace
+# falta uno nuevo), en un hilo aparte para no bloquear el loop.
+#
+#   python -m descarga_sii --proveedor 12 --periodo 2025-06 --periodo 2025-07
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+import importacion_sii
+from cliente_sii import (HEADERS, SII_TIMEOUT_CONEXION, SII_TIMEOUT_LECTURA, URL_BASE, ErrorSII,
+                         cookies_como_dict, datos_detalle_venta, lista_data, payload_fachada, url_fachada)
+from metricas import medir_sii
+
+try:
+    import httpx   # opcional: solo lo necesita esta descarga
+except ImportError:
+    httpx = None
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sii")
+
+SII_DESCARGA_CONCURRENCIA = int(os.getenv("SII_DESCARGA_CONCURRENCIA", "16"))   # consultas en vuelo en total
+SII_DESCARGA_RPS = float(os.getenv("SII_DESCARGA_RPS", "8"))                     # consultas por segundo por host
+SII_DESCARGA_REINTENTOS = int(os.getenv("SII_DESCARGA_REINTENTOS", "4"))
+SII_DESCARGA_BACKOFF = float(os.getenv("SII_DESCARGA_BACKOFF", "0.5"))           # tope del 1er reintento; se duplica
+
+TIPOS_DTE = ("33", "34", "46", "56", "61")   # factura, exenta, de compra, nota de débito, nota de crédito
+_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+class _Reintento(Exception):
+    """Intento fallido que se reintenta; dentro de medir_sii para que cuente como error."""
+
+
+class Entrada(NamedTuple):
+    rut: str            # sin DV
+    dv: str
+    periodo: str        # YYYY-MM
+    cookies: List[dict]  # como las guarda Selenium
+
+
+class ResultadoDescarga(NamedTuple):
+    rut: str
+    periodo: str
+    ruta: Optional[str]           # None si algún tipo falló
+    documentos: int
+    por_tipo: Dict[str, int]
+    error: Optional[str]
+
+
+def token_credenciales(entrada: Entrada) -> str:
+    from credenciales_sii import obtener_credenciales   # diferido: trae el pool de navegadores
+
+    return obtener_credenciales().token(entrada.rut, entrada.cookies, entrada.periodo)
+
+
+class LimiteHost:
+    """Ritmo máximo de consultas por host: cada una toma el siguiente turno libre, separados
+    1/rps segundos, y espera hasta que le toque."""
+
+    def __init__(self, rps: float):
+        self.intervalo = 1 / rps if rps > 0 else 0.0
+        self._turnos: Dict[str, float] = {}
+
+    async def esperar(self, url: str) -> None:
+        if not self.intervalo:
+            return
+        host = urlsplit(url).netloc
+        ahora = time.monotonic()
+        turno = max(ahora, self._turnos.get(host, 0.0))
+        self._turnos[host] = turno + self.intervalo   # sin await entre leer y escribir: no hace falta lock
+        if turno > ahora:
+            await asyncio.sleep(turno - ahora)
+
+
+def _espera_reintento(intento: int, backoff: float, respuesta=None) -> float:
+    espera = random.uniform(0, backoff * 2 ** intento)
+    retry_after = respuesta.headers.get("Retry-After") if respuesta is not None else None
+    if retry_after:
+        try:
+            espera = max(espera, float(retry_after))
+        except ValueError:
+            try:
+                espera = max(espera, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return espera
+
+
+class DescargaSII:
+    def __init__(self, carpeta: str = importacion_sii.SII_DETALLE_DIR, tipos: Sequence[str] = TIPOS_DTE,
+                 url_base: str = URL_BASE, concurrencia: int = SII_DESCARGA_CONCURRENCIA,
+                 rps: float = SII_DESCARGA_RPS, reintentos: int = SII_DESCARGA_REINTENTOS,
+                 backoff: float = SII_DESCARGA_BACKOFF, token: Callable[[Entrada], str] = token_credenciales):
+        if httpx is None:
+            raise ErrorSII("httpx no está instalado (pip install httpx)")
+        self.carpeta = carpeta
+        self.tipos = tuple(tipos)
+        self.url_base = url_base
+        self.concurrencia = max(1, concurrencia)
+        self.limite = LimiteHost(rps)
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.token = token
+        self._locks_token: Dict[str, asyncio.Lock] = {}
+
+    async def _consultar(self, cliente, semaforo: asyncio.Semaphore, entrada: Entrada, tipo: str,
+                         token: str) -> List[dict]:
+        cookies = cookies_como_dict(entrada.cookies)
+        url = url_fachada(self.url_base, "getDetalleVenta")
+        payload = payload_fachada("getDetalleVenta", cookies, datos_detalle_venta(
+            entrada.rut, entrada.dv, entrada.periodo, tipo, token))
+        cabecera = {"Cookie": "; ".join(f"{nombre}={valor}" for nombre, valor in cookies.items())}
+        for intento in range(self.reintentos + 1):
+            respuesta = None
+            try:
+                async with semaforo:
+                    await self.limite.esperar(url)
+                    with medir_sii("detalle_venta"):
+                        try:
+                            respuesta = await cliente.post(url, json=payload, headers=cabecera)
+                        except httpx.TransportError as e:
+                            if intento == self.reintentos:
+                                raise ErrorSII(f"getDetalleVenta {tipo}: {e.__class__.__name__}: {e}") from e
+                            raise _Reintento() from e
+                        if respuesta.status_code == 200:
+                            try:
+                                return lista_data("getDetalleVenta", respuesta.json())
+                            except ValueError:
+                                raise ErrorSII(f"getDetalleVenta {tipo}: la respuesta no es JSON: "
+                                               f"{respuesta.text[:500]}")
+                        if respuesta.status_code not in _REINTENTABLES or intento == self.reintentos:
+                            raise ErrorSII(f"getDetalleVenta {tipo}: el SII respondió {respuesta.status_code}: "
+                                           f"{respuesta.text[:500]}")
+                        raise _Reintento()
+            except _Reintento:
+                # El backoff se espera fuera del semáforo: no ocupa un cupo de concurrencia
+                await asyncio.sleep(_espera_reintento(intento, self.backoff, respuesta))
+
+    async def _periodo(self, cliente, semaforo: asyncio.Semaphore, periodos: asyncio.Semaphore,
+                       entrada: Entrada) -> ResultadoDescarga:
+        """Todos los tipos de un RUT y periodo, escritos a medida que llegan."""
+        async with periodos:
+            return await self._periodo_tipos(cliente, semaforo, entrada)
+
+    async def _periodo_tipos(self, cliente, semaforo: asyncio.Semaphore, entrada: Entrada) -> ResultadoDescarga:
+        final = os.path.join(self.carpeta, f"detalle_{entrada.rut}_{entrada.periodo}.jsonl")
+        temporal = final + ".tmp"
+        por_tipo: Dict[str, int] = {}
+        try:
+            # Un token a la vez por RUT: el primero llena el caché de credenciales_sii y los
+            # demás periodos del RUT lo reutilizan en vez de pedir cada uno un navegador
+            async with self._locks_token.setdefault(entrada.rut, asyncio.Lock()):
+                token = await asyncio.to_thread(self.token, entrada)
+            with open(temporal, "w", encoding="utf-8") as archivo:
+
+                async def tipo_doc(tipo: str) -> None:
+                    documentos = await self._consultar(cliente, semaforo, entrada, tipo, token)
+                    # Un solo write por respuesta; el loop no cambia de tarea a la mitad
+                    archivo.write("".join(json.dumps(d, ensure_ascii=False) + "\n" for d in documentos))
+                    por_tipo[tipo] = len(documentos)
+
+                tareas = [asyncio.ensure_future(tipo_doc(tipo)) for tipo in self.tipos]
+                try:
+                    await asyncio.gather(*tareas)
+                finally:
+                    # Si un tipo falló, los demás no siguen consultando ni escriben en un archivo cerrado
+                    for tarea in tareas:
+                        tarea.cancel()
+                    await asyncio.gather(*tareas, return_exceptions=True)
+            os.replace(temporal, final)
+            return ResultadoDescarga(entrada.rut, entrada.periodo, final, sum(por_tipo.values()), por_tipo, None)
+        except Exception as e:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            logger.warning("Descarga SII %s %s falló: %s", entrada.rut, entrada.periodo, e)
+            return ResultadoDescarga(entrada.rut, entrada.periodo, None, sum(por_tipo.values()), por_tipo,
+                                     f"{e.__class__.__name__}: {e}"[:500])
+
+    async def descargar(self, entradas: Iterable[Entrada]) -> List[ResultadoDescarga]:
+        """Un resultado por entrada (RUT y periodo), en el mismo orden."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        # Periodos abiertos a la vez (y .tmp abiertos): con varios tipos cada uno ya alcanzan para
+        # llenar el semáforo, sin tener un archivo por cada periodo de la cola
+        periodos = asyncio.Semaphore(self.concurrencia)
+        limites = httpx.Limits(max_connections=self.concurrencia, max_keepalive_connections=self.concurrencia)
+        timeout = httpx.Timeout(SII_TIMEOUT_LECTURA, connect=SII_TIMEOUT_CONEXION)
+        async with httpx.AsyncClient(headers=HEADERS, limits=limites, timeout=timeout) as cliente:
+            # Cada consulta lleva las cookies de su RUT; el cliente no debe guardar las que recibe
+            cliente.cookies.jar.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            return await asyncio.gather(*(self._periodo(cliente, semaforo, periodos, entrada)
+                                          for entrada in entradas))
+
+
+def descargar(entradas: Iterable[Entrada], **opciones) -> List[ResultadoDescarga]:
+    """Versión bloqueante, para scripts e hilos (fuera de un loop de asyncio)."""
+    return asyncio.run(DescargaSII(**opciones).descargar(list(entradas)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga el detalle de ventas del SII de varios proveedores, "
+                                                 "periodos y tipos de DTE a la vez")
+    parser.add_argument("--proveedor", type=int, action="append", required=True, help="id de proveedor")
+    parser.add_argument("--periodo", action="append", required=True, help="YYYY-MM (se puede repetir)")
+    parser.add_argument("--tipo", action="append", help=f"tipo de DTE (por defecto {', '.join(TIPOS_DTE)})")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from credenciales_sii import obtener_credenciales
+    from database import SessionLocal
+    from models import Proveedor
+    from navegadores_sii import cerrar_navegadores
+
+    entradas = []
+    try:
+        with SessionLocal() as db:
+            for proveedor in db.query(Proveedor).filter(Proveedor.id.in_(args.proveedor)):
+                rut_completo = proveedor.rut.replace(".", "").replace("-", "").upper()
+                cookies = obtener_credenciales().cookies(proveedor)
+                entradas += [Entrada(rut_completo[:-1], rut_completo[-1], periodo, cookies) for periodo in args.periodo]
+            db.commit()   # cookies_sii_path, si hubo un login nuevo
+        inicio = time.perf_counter()
+        resultados = descargar(entradas, tipos=args.tipo or TIPOS_DTE)
+    finally:
+        cerrar_navegadores()
+    for r in resultados:
+        print(f"{'✅' if r.ruta else '❌'} {r.rut} {r.periodo}: {r.documentos} documentos {r.por_tipo} "
+              f"{r.ruta or r.error}")
+    print(f"⏱️ {len(resultados)} periodos en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# estados.py
+# Máquina de estados de las facturas (estado_dte).
+# El estado se guarda en la BD como un SMALLINT (EstadoDTE.codigo); en Python y en las
+# plantillas sigue siendo el texto de siempre ("Confirming solicitado", ...), así que
+# comparaciones como `factura.estado_dte == "Cargada"` siguen funcionando.
+from enum import Enum
+from sqlalchemy import SmallInteger, update
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+
+
+class EstadoDTE(str, Enum):
+    # (texto visible, código en BD) — los códigos NO se reutilizan ni se renumeran
+    CARGADA = ("Cargada", 1)
+    CONFIRMACION_SOLICITADA = ("Confirmación solicitada al pagador", 2)
+    CONFIRMADA = ("Confirmada por pagador", 3)
+    RECHAZADA = ("Rechazada por pagador", 4)
+    VENCIMIENTO_RECHAZADO = ("Vencimiento rechazado por proveedor", 5)
+    ENVIADO_A_CONFIRMING = ("Enviado a confirming", 6)
+    CONFIRMING_SOLICITADO = ("Confirming solicitado", 7)
+    CONFIRMING_ADJUDICADO = ("Confirming adjudicado", 8)
+
+    def __new__(cls, etiqueta: str, codigo: int):
+        obj = str.__new__(cls, etiqueta)
+        obj._value_ = etiqueta
+        obj.codigo = codigo
+        return obj
+
+    def __str__(self) -> str:
+        return self.value
+
+    @classmethod
+    def desde_codigo(cls, codigo: int) -> "EstadoDTE":
+        return _POR_CODIGO[codigo]
+
+
+_POR_CODIGO = {estado.codigo: estado for estado in EstadoDTE}
+
+
+class EstadoDTEColumna(TypeDecorator):
+    """Columna SMALLINT que entrega/recibe EstadoDTE (también acepta el texto del estado)."""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return EstadoDTE(value).codigo
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return EstadoDTE.desde_codigo(value)
+
+
+# ─── Transiciones permitidas ────────────────────────────────────────────────
+# origen → destinos. Un estado sin entrada aquí es terminal.
+TRANSICIONES = {
+    EstadoDTE.CARGADA: {EstadoDTE.CONFIRMACION_SOLICITADA},
+    EstadoDTE.CONFIRMACION_SOLICITADA: {EstadoDTE.CONFIRMADA, EstadoDTE.RECHAZADA},
+    EstadoDTE.CONFIRMADA: {EstadoDTE.CONFIRMING_SOLICITADO, EstadoDTE.VENCIMIENTO_RECHAZADO},
+    # El proveedor puede volver a pedir confirmación tras un rechazo
+    EstadoDTE.RECHAZADA: {EstadoDTE.CONFIRMACION_SOLICITADA},
+    EstadoDTE.VENCIMIENTO_RECHAZADO: {EstadoDTE.CONFIRMACION_SOLICITADA},
+    EstadoDTE.ENVIADO_A_CONFIRMING: {EstadoDTE.CONFIRMING_SOLICITADO},
+    EstadoDTE.CONFIRMING_SOLICITADO: {EstadoDTE.CONFIRMING_ADJUDICADO},
+}
+
+
+class TransicionInvalida(ValueError):
+    def __init__(self, origen, destino):
+        self.origen = origen
+        self.destino = destino
+        super().__init__(f"Transición no permitida: {origen} → {destino}")
+
+
+def origenes(destino) -> list:
+    """Estados desde los que se puede llegar a `destino` (ordenados por código)."""
+    destino = EstadoDTE(destino)
+    return [origen for origen, destinos in TRANSICIONES.items() if destino in destinos]
+
+
+def puede_transicionar(origen, destino) -> bool:
+    if origen is None:
+        return False
+    return EstadoDTE(destino) in TRANSICIONES.get(EstadoDTE(origen), ())
+
+
+def transicionar(factura, destino) -> None:
+    """Cambia el estado de una factura cargada en la sesión (o lanza TransicionInvalida)."""
+    if not puede_transicionar(factura.estado_dte, destino):
+        raise TransicionInvalida(factura.estado_dte, destino)
+    factura.estado_dte = EstadoDTE(destino)
+
+
+def transicionar_lote(db: Session, destino, *condiciones) -> int:
+    """
+    Aplica la transición a todas las facturas que cumplan `condiciones` con un solo
+    UPDATE ... WHERE <condiciones> AND estado_dte IN (orígenes válidos); las que están
+    en un estado que no lo permite se saltan. Devuelve cuántas cambiaron.
+    No hace commit ni refresca objetos ya cargados en la sesión.
+
+        transicionar_lote(db, EstadoDTE.CONFIRMADA,
+                          FacturaDB.folio.in_(folios), FacturaDB.rut_receptor == pagador.rut)
+    """
+    from models import FacturaDB  # models importa este módulo
+
+    if not condiciones:
+        raise ValueError("transicionar_lote necesita al menos una condición (no actualiza la tabla completa)")
+    resultado = db.execute(
+        update(FacturaDB)
+        .where(FacturaDB.estado_dte.in_(origenes(destino)), *condiciones)
+        .values(estado_dte=EstadoDTE(destino))
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
@@ -0,0 +1,247 @@
+# importacion_sii.py
+# Importación del detalle de ventas que deja el scraper del SII (detalle_{rut}_{periodo}.json)
+# sin cargar el archivo entero: los registros se leen de a uno y se ingieren por tramos de
+# INGESTA_TRAMO con ingesta.ingerir, así la memoria no crece con el tamaño del periodo.
+#
+# El archivo puede ser el arreglo JSON que guarda detalle_dte.py o JSON Lines (un registro
+# por línea, .jsonl). El arreglo se lee con ijson si está instalado y si no con
+# json.JSONDecoder.raw_decode sobre bloques de _BLOQUE bytes.
+#
+# Solo se importan facturas (TIPOS_FACTURA): el .jsonl de descarga_sii.py trae también
+# notas de crédito y de débito, que se cuentan en `otros_tipos` y se omiten.
+#
+#   resumen = importar(db, "selenium_scripts/facturas_sii/data/detalle_76262370_2025-07.json", proveedor)
+#   resumen.nuevas, resumen.errores   # errores: primeros SII_MAX_DETALLE mensajes
+import functools
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Iterator, List, NamedTuple, TextIO
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from estados import EstadoDTE
+from ingesta import (DUPLICADA, ERROR, INGESTA_TRAMO, LECTURA, NUEVA, RECHAZADA, VALIDACION, Etapas,
+                     ingerir)
+from metricas import FACTURAS_INGERIDAS, INGESTA_DURACION
+
+try:
+    import ijson   # opcional: parser incremental en C para el arreglo JSON
+except ImportError:
+    ijson = None
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sii")
+
+SII_DETALLE_DIR = os.getenv("SII_DETALLE_DIR", os.path.join("selenium_scripts", "facturas_sii", "data"))
+SII_MAX_DETALLE = int(os.getenv("SII_MAX_DETALLE", "1000"))   # mensajes de error/descartes que se guardan
+SII_LOG_MUESTRA = int(os.getenv("SII_LOG_MUESTRA", "1000"))   # se loguea 1 de cada N registros con error
+TIPOS_FACTURA = frozenset({"33", "34", "46"})   # factura, exenta, de compra: las únicas financiables
+_BLOQUE = 1024 * 1024
+_FIN = object()
+
+
+class Resumen(NamedTuple):
+    registros: int
+    nuevas: int
+    duplicadas: int
+    rechazadas: int
+    errores: int
+    descartadas: int                 # forma de pago contado: no se cargan
+    detalle_errores: List[str]       # a lo más SII_MAX_DETALLE
+    detalle_descartadas: List[dict]  # a lo más SII_MAX_DETALLE: {"folio", "rut_receptor"}
+    otros_tipos: int = 0             # notas de crédito/débito y demás DTE que no son facturas
+
+
+# ─── Lectura ────────────────────────────────────────────────────────────────
+def ruta_detalle(rut_base: str, periodo: str) -> str:
+    """Archivo del detalle para el RUT sin DV y el periodo YYYY-MM. El scraper (detalle_dte.py)
+    deja detalle_{rut}_{periodo}.json y descarga_sii.py el .jsonl con el mismo nombre; si
+    están los dos se usa el modificado más recientemente, que es la última descarga. Si no
+    hay ninguno, la ruta del .json (el llamador avisa que no existe)."""
+    ruta = os.path.join(SII_DETALLE_DIR, f"detalle_{rut_base}_{periodo}.json")
+    candidatos = []
+    for candidato in (ruta, ruta + "l"):
+        try:
+            candidatos.append((os.path.getmtime(candidato), candidato))
+        except OSError:
+            continue
+    return max(candidatos)[1] if candidatos else ruta
+
+
+def _arreglo_raw_decode(archivo: TextIO) -> Iterator[object]:
+    """Elementos de un arreglo JSON leyendo el archivo por bloques. Un elemento solo se
+    acepta si después viene "," o "]": así un número cortado por el bloque no se lee a medias."""
+    decodificador = json.JSONDecoder()
+    texto = archivo.read(_BLOQUE).lstrip()
+    if not texto.startswith("["):
+        raise ValueError("el detalle del SII debe ser un arreglo JSON")
+    pos, fin_archivo = 1, False
+    while True:
+        while pos < len(texto) and texto[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(texto) and texto[pos] == "]":
+            return
+        try:
+            elemento, siguiente = decodificador.raw_decode(texto, pos)
+            while siguiente < len(texto) and texto[siguiente] in " \t\r\n":
+                siguiente += 1
+            completo = siguiente < len(texto)
+        except json.JSONDecodeError:
+            completo = False
+        if completo:
+            yield elemento
+            pos = siguiente
+            continue
+        if fin_archivo:
+            raise ValueError("el arreglo JSON del detalle está incompleto")
+        bloque = archivo.read(_BLOQUE)
+        fin_archivo = not bloque
+        texto = texto[pos:] + bloque
+        pos = 0
+
+
+def _lineas_json(archivo: TextIO) -> Iterator[object]:
+    for linea in archivo:
+        if linea.strip():
+            yield json.loads(linea)
+
+
+def leer_registros(ruta: str) -> Iterator[object]:
+    """Registros del archivo de detalle, de a uno; el formato se decide por el primer
+    carácter: "[" arreglo JSON, "{" JSON Lines."""
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        inicio = ""
+        while not inicio:
+            caracter = archivo.read(1)
+            if not caracter:
+                return
+            inicio = caracter.strip()
+        archivo.seek(0)
+        if inicio == "{":
+            yield from _lineas_json(archivo)
+        elif ijson is not None:
+            with open(ruta, "rb") as binario:
+                try:
+                    yield from ijson.items(binario, "item", use_float=True)
+                except ijson.JSONError as e:   # IncompleteJSONError no es ValueError
+                    raise ValueError(f"el arreglo JSON del detalle está mal formado: {e}") from e
+        else:
+            yield from _arreglo_raw_decode(archivo)
+
+
+# ─── Validación ─────────────────────────────────────────────────────────────
+@functools.lru_cache(maxsize=4096)
+def _fecha(texto: str) -> date:
+    # Un periodo tiene a lo más ~31 fechas distintas: se parsea cada una una sola vez
+    return datetime.strptime(texto, "%d/%m/%Y").date()
+
+
+def fila_sii(d: dict, proveedor, rut_base: str) -> dict:
+    """Registro del detalle → dict con las columnas de FacturaDB. Lanza si le falta algo."""
+    emision = _fecha(d["detFchDoc"])
+    # detFecRecepcion trae hora ("28/07/2025 11:51:18"): solo importa el día
+    recepcion = d.get("detFecRecepcion")
+    return dict(
+        rut_emisor=rut_base,                               # ← rut base sin DV, ya validado
+        rut_receptor=f"{d['detRutDoc']}{d['detDvDoc']}",   # ← pagador con DV
+        tipo_dte=str(d["detTipoDoc"]),
+        folio=int(d["detNroDoc"]),
+        monto=int(d["detMntTotal"]),
+        razon_social_emisor=proveedor.nombre,
+        razon_social_receptor=d.get("detRznSoc", "Desconocido"),
+        fecha_emision=emision,
+        fecha_vencimiento=_fecha(recepcion.split(" ", 1)[0]) if recepcion else emision,
+        fecha_vencimiento_original=emision,
+        estado_dte=EstadoDTE.CARGADA,
+        confirming_solicitado=False,
+        origen_confirmacion="SII",
+        proveedor_id=proveedor.id,
+    )
+
+
+# ─── Importación ────────────────────────────────────────────────────────────
+def importar(db: Session, ruta: str, proveedor, tramo: int = INGESTA_TRAMO) -> Resumen:
+    """Lee, valida e ingiere el detalle por tramos. Los errores por registro se cuentan
+    todos pero solo se guardan (y loguean por muestreo) los primeros."""
+    inicio = time.perf_counter()
+    etapas = Etapas()
+    rut_base = proveedor.rut.replace(".", "").replace("-", "")[:-1]   # sin dígito verificador
+    emisor_valido = rut_base == proveedor.rut[:-1]
+    conteo = {NUEVA: 0, DUPLICADA: 0, RECHAZADA: 0, ERROR: 0}
+    registros = descartadas = invalidos = otros_tipos = 0
+    detalle_errores: List[str] = []
+    detalle_descartadas: List[dict] = []
+
+    def error(mensaje: str, resultado: str) -> None:
+        nonlocal invalidos
+        conteo[resultado] += 1
+        invalidos += resultado == ERROR
+        if len(detalle_errores) < SII_MAX_DETALLE:
+            detalle_errores.append(mensaje)
+        fallidos = conteo[RECHAZADA] + conteo[ERROR]
+        if fallidos == 1 or fallidos % SII_LOG_MUESTRA == 0:
+            logger.warning("Importación SII %s: %d registros con problemas; último: %s", ruta, fallidos, mensaje)
+
+    def ingerir_tramo(filas: List[dict]) -> None:
+        for r in ingerir(db, filas, origen="sii", tramo=tramo, etapas=etapas):
+            conteo[r.resultado] += 1
+            if r.resultado != NUEVA and len(detalle_errores) < SII_MAX_DETALLE:
+                detalle_errores.append(r.detalle)
+
+    try:
+        filas: List[dict] = []
+        lector = leer_registros(ruta)
+        while True:
+            with etapas.medir(LECTURA):
+                d = next(lector, _FIN)
+            if d is _FIN:
+                break
+            registros += 1
+            with etapas.medir(VALIDACION):
+                if not isinstance(d, dict):
+                    error(f"Entrada inválida ignorada: {d}", ERROR)
+                    continue
+                # Notas de crédito (61) / débito (56): no son facturas que se puedan financiar
+                if "detTipoDoc" in d and str(d["detTipoDoc"]) not in TIPOS_FACTURA:
+                    otros_tipos += 1
+                    continue
+                # 💣 Filtro: excluir facturas con forma de pago "Contado"
+                if (d.get("detFormaPagoLeyenda") or "").strip().lower() == "contado":
+                    descartadas += 1
+                    if len(detalle_descartadas) < SII_MAX_DETALLE:
+                        detalle_descartadas.append({"folio": d.get("detNroDoc"),
+                                                    "rut_receptor": f"{d.get('detRutDoc')}{d.get('detDvDoc')}"})
+                    continue
+                # Validación: solo subir si el proveedor logeado es el emisor
+                if not emisor_valido:
+                    error(f"⚠️ RUT emisor {rut_base} no coincide con proveedor logeado ({proveedor.rut})", RECHAZADA)
+                    continue
+                try:
+                    filas.append(fila_sii(d, proveedor, rut_base))
+                except Exception as e:
+                    error(f"Error en folio {d.get('detNroDoc', 'desconocido')}: {e}", ERROR)
+                    continue
+            if len(filas) >= tramo:
+                ingerir_tramo(filas)
+                filas = []
+        if filas:
+            ingerir_tramo(filas)
+    finally:
+        # NUEVA / DUPLICADA y los errores de BD ya los cuenta ingerir
+        if conteo[RECHAZADA]:
+            FACTURAS_INGERIDAS.inc(conteo[RECHAZADA], origen="sii", resultado=RECHAZADA)
+        if invalidos:
+            FACTURAS_INGERIDAS.inc(invalidos, origen="sii", resultado=ERROR)
+        INGESTA_DURACION.observar(time.perf_counter() - inicio, origen="sii")
+        etapas.publicar("sii")
+
+    logger.info("Importación SII %s: %d registros, %d nuevas, %d duplicadas, %d rechazadas, %d con error, "
+                "%d al contado omitidas, %d de otros tipos omitidos", ruta, registros, conteo[NUEVA], conteo[DUPLICADA],
+                conteo[RECHAZADA], conteo[ERROR], descartadas, otros_tipos)
+    return Resumen(registros, conteo[NUEVA], conteo[DUPLICADA], conteo[RECHAZADA], conteo[ERROR], descartadas,
+                   detalle_errores, detalle_descartadas, otros_tipos)
@@ -0,0 +1,429 @@
+# ingesta.py
+# Ingesta de facturas por lotes, común a la subida de XML y a la importación del SII.
+# Las claves (rut_emisor, rut_receptor, folio) de cada tramo se resuelven contra la BD
+# con UNA consulta, y las nuevas se insertan con INSERT ... ON CONFLICT DO NOTHING
+# RETURNING en una transacción por tramo. Si otro proceso insertó la misma factura entre
+# la consulta y el insert, el conflicto la deja como duplicada en vez de abortar el lote.
+#
+#   resultados = ingerir(db, filas, origen="xml")   # filas: dicts con las columnas de FacturaDB
+#   nuevas = [r for r in resultados if r.resultado == NUEVA]
+#
+# procesar_subida_xml es el trabajo en segundo plano (trabajos.py) de POST /proveedor/facturas:
+# parsea el XML/ZIP subido por tramos e ingiere cada tramo, reportando el avance.
+#
+# Etapas acumula el tiempo de cada etapa (lectura, parseo, validación, deduplicación,
+# inserción, commit) y al final lo publica en treds_ingesta_etapa_segundos: una subida
+# lenta muestra ahí si se le fue el tiempo parseando o esperando a la BD.
+import hashlib
+import logging
+import os
+import time
+import zipfile
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from estados import EstadoDTE
+from metricas import FACTURAS_INGERIDAS, INGESTA_DURACION, INGESTA_ETAPA
+from models import ArchivoIngerido, FacturaDB
+from parseo_dte import DTE_TRAMO, parsear_por_tramos
+from trabajos import Trabajo
+
+load_dotenv()
+
+logger = logging.getLogger("treds.ingesta")
+
+INGESTA_TRAMO = int(os.getenv("INGESTA_TRAMO", "1000"))   # filas por consulta de duplicados y por commit
+XML_MAX_BYTES = int(os.getenv("XML_MAX_BYTES", str(10 * 1024 * 1024)))  # por XML, ya descomprimido
+
+# Resultados por fila (también son la etiqueta "resultado" de treds_facturas_ingeridas_total)
+NUEVA = "nueva"
+DUPLICADA = "duplicada"
+RECHAZADA = "rechazada"
+ERROR = "error"
+
+_CLAVE = (FacturaDB.rut_emisor, FacturaDB.rut_receptor, FacturaDB.folio)
+_MAX_PARES_POR_CONSULTA = 200
+
+
+class ResultadoFila(NamedTuple):
+    indice: int                 # posición de la fila en el lote recibido
+    folio: Optional[int]
+    resultado: str              # NUEVA / DUPLICADA / ERROR
+    detalle: str = ""
+    factura_id: Optional[int] = None
+
+
+# Etapas de la ingesta, en orden (etiqueta "etapa" de treds_ingesta_etapa_segundos)
+RECEPCION = "recepcion"           # copia de la subida al almacén (en el request)
+LECTURA = "lectura"               # abrir el ZIP, descomprimir y hashear cada XML
+PARSEO = "parseo"                 # espera por los tramos del pool de parseo
+VALIDACION = "validacion"         # consistencia con el proveedor y armado de filas
+DEDUPLICACION = "deduplicacion"   # consultas de claves y hashes ya existentes
+INSERCION = "insercion"           # INSERT ... ON CONFLICT
+COMMIT = "commit"
+
+
+class Etapas:
+    """Segundos acumulados por etapa durante una ingesta.
+
+    `segundos` puede ser un dict ajeno (el de un Trabajo) para que el avance muestre
+    el desglose mientras la ingesta sigue corriendo. Una etapa medida dentro de otra (la
+    lectura que hace el generador mientras se espera el parseo) se descuenta de la de
+    afuera: cada segundo cuenta en una sola etapa.
+    """
+
+    def __init__(self, segundos: Optional[Dict[str, float]] = None):
+        self.segundos = segundos if segundos is not None else {}
+        self._anidadas: List[float] = []   # segundos de etapas internas, por nivel abierto
+
+    @contextmanager
+    def medir(self, etapa: str):
+        inicio = time.perf_counter()
+        self._anidadas.append(0.0)
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            propia = duracion - self._anidadas.pop()
+            if self._anidadas:
+                self._anidadas[-1] += duracion
+            self.segundos[etapa] = self.segundos.get(etapa, 0.0) + propia
+
+    def publicar(self, origen: str) -> None:
+        for etapa, segundos in self.segundos.items():
+            INGESTA_ETAPA.observar(segundos, origen=origen, etapa=etapa)
+        logger.info("Ingesta %s por etapa: %s", origen,
+                    ", ".join(f"{etapa}={segundos:.3f}s" for etapa, segundos in self.segundos.items()))
+
+
+def clave(fila: dict) -> tuple:
+    return fila["rut_emisor"], fila["rut_receptor"], fila["folio"]
+
+
+def _sentencia_sin_conflicto(db: Session, modelo, indice: List[str]):
+    dialecto = db.get_bind().dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    else:
+        # Sin ON CONFLICT: para facturas la consulta previa cubre los duplicados y una
+        # carrera cae en el reintento fila por fila de _insertar_tramo.
+        return insert(modelo)
+    return insert_dialecto(modelo).on_conflict_do_nothing(index_elements=indice)
+
+
+def _sentencia_insert(db: Session):
+    return _sentencia_sin_conflicto(db, FacturaDB, [c.key for c in _CLAVE]).returning(FacturaDB.id, *_CLAVE)
+
+
+def _existentes(db: Session, claves: List[tuple]) -> set:
+    # Se agrupa por (emisor, receptor) con un folio IN por grupo en vez de un
+    # (a, b, c) IN (VALUES ...): SQLite resuelve el row value recorriendo el índice
+    # único completo, mientras que así cada folio es una búsqueda en ese índice.
+    # Con muchos receptores distintos se parte en varias consultas (límite de profundidad
+    # de expresiones de SQLite); un tramo típico de un proveedor cabe en una sola.
+    folios_por_par = defaultdict(list)
+    for rut_emisor, rut_receptor, folio in claves:
+        folios_por_par[(rut_emisor, rut_receptor)].append(folio)
+    pares = list(folios_por_par.items())
+    existentes = set()
+    for inicio in range(0, len(pares), _MAX_PARES_POR_CONSULTA):
+        condicion = or_(*(
+            and_(FacturaDB.rut_emisor == rut_emisor, FacturaDB.rut_receptor == rut_receptor,
+                 FacturaDB.folio.in_(folios))
+            for (rut_emisor, rut_receptor), folios in pares[inicio:inicio + _MAX_PARES_POR_CONSULTA]
+        ))
+        existentes.update(tuple(fila) for fila in db.execute(select(*_CLAVE).where(condicion)).all())
+    return existentes
+
+
+def _insertar(db: Session, filas: List[dict]) -> Dict[tuple, int]:
+    """Inserta las filas y devuelve {clave: id} de las que realmente entraron."""
+    insertadas = db.execute(_sentencia_insert(db), filas).all()
+    return {(rut_emisor, rut_receptor, folio): id_ for id_, rut_emisor, rut_receptor, folio in insertadas}
+
+
+def _insertar_tramo(db: Session, filas: List[dict], etapas: Etapas) -> Dict[tuple, object]:
+    """{clave: id} por fila insertada o {clave: excepción} si esa fila no pudo entrar.
+
+    Si el tramo completo falla (un dato inválido, una FK rota) se reintenta fila por
+    fila, para que una sola factura mala no se lleve al resto del tramo.
+    """
+    try:
+        with etapas.medir(INSERCION):
+            ids = _insertar(db, filas)
+        with etapas.medir(COMMIT):
+            db.commit()
+        return ids
+    except SQLAlchemyError:
+        db.rollback()
+        logger.warning("Tramo de %d facturas falló; reintentando fila por fila", len(filas), exc_info=True)
+
+    ids = {}
+    for fila in filas:
+        try:
+            with etapas.medir(INSERCION):
+                ids.update(_insertar(db, [fila]))
+            with etapas.medir(COMMIT):
+                db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            ids[clave(fila)] = e
+    return ids
+
+
+def ingerir(db: Session, filas: List[dict], origen: str, tramo: int = INGESTA_TRAMO,
+            etapas: Optional[Etapas] = None) -> List[ResultadoFila]:
+    """Deduplica e inserta `filas` por tramos; devuelve un ResultadoFila por fila, en orden.
+
+    Una clave repetida dentro del mismo lote cuenta como duplicada a partir de la
+    segunda aparición. Registra cada resultado en treds_facturas_ingeridas_total; los
+    tiempos de deduplicación, inserción y commit se suman a `etapas` si viene.
+    """
+    etapas = etapas or Etapas()
+    resultados: List[Optional[ResultadoFila]] = [None] * len(filas)
+    vistas = set()
+    for inicio in range(0, len(filas), tramo):
+        indices = range(inicio, min(inicio + tramo, len(filas)))
+        with etapas.medir(DEDUPLICACION):
+            existentes = _existentes(db, list({clave(filas[i]) for i in indices}))
+
+        a_insertar = []
+        for i in indices:
+            k = clave(filas[i])
+            if k in existentes or k in vistas:
+                resultados[i] = ResultadoFila(i, k[2], DUPLICADA, f"Factura duplicada folio {k[2]}")
+            else:
+                vistas.add(k)
+                a_insertar.append(i)
+        if not a_insertar:
+            continue
+
+        ids = _insertar_tramo(db, [filas[i] for i in a_insertar], etapas)
+        for i in a_insertar:
+            k = clave(filas[i])
+            id_ = ids.get(k)
+            if isinstance(id_, Exception):
+                resultados[i] = ResultadoFila(i, k[2], ERROR, f"Error en folio {k[2]}: {id_.__class__.__name__}")
+            elif id_ is None:
+                # ON CONFLICT la descartó: otro proceso la insertó después de la consulta
+                resultados[i] = ResultadoFila(i, k[2], DUPLICADA, f"Factura duplicada folio {k[2]}")
+            else:
+                resultados[i] = ResultadoFila(i, k[2], NUEVA, factura_id=id_)
+
+    for resultado in (NUEVA, DUPLICADA, ERROR):
+        cantidad = sum(1 for r in resultados if r.resultado == resultado)
+        if cantidad:
+            FACTURAS_INGERIDAS.inc(cantidad, origen=origen, resultado=resultado)
+    return resultados
+
+
+# ─── Subida de XML / ZIP en segundo plano ───────────────────────────────────
+def _xml_del_zip(zf: zipfile.ZipFile):
+    """Entrega (nombre, flujo, tamaño) por cada .xml del ZIP, descomprimiendo en memoria.
+
+    file_size viene del directorio central y el lector de zipfile no entrega más bytes
+    que ese, así que basta con revisarlo antes de parsear para acotar un ZIP bomba.
+    """
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".xml"):
+                continue
+            with zf.open(info) as flujo:
+                yield info.filename, flujo, info.file_size
+
+
+def _fila_xml(dte, proveedor_id: int) -> dict:
+    return dict(
+        rut_emisor=dte.rut_emisor,
+        rut_receptor=dte.rut_receptor,
+        tipo_dte=dte.tipo_dte,
+        folio=dte.folio,
+        monto=dte.monto,
+        razon_social_emisor=dte.razon_social_emisor,
+        razon_social_receptor=dte.razon_social_receptor,
+        fecha_emision=dte.fecha_emision,
+        fecha_vencimiento=dte.fecha_vencimiento,
+        fecha_vencimiento_original=dte.fecha_vencimiento,
+        estado_dte=EstadoDTE.CARGADA,
+        confirming_solicitado=False,
+        origen_confirmacion="Proveedor",
+        proveedor_id=proveedor_id,
+    )
+
+
+def _ingeridos(db: Session, proveedor_id: int, hashes: List[str]) -> Dict[str, datetime]:
+    """{sha256: fecha de ingesta} de los hashes que el proveedor ya ingirió."""
+    conocidos = {}
+    for inicio in range(0, len(hashes), INGESTA_TRAMO):
+        conocidos.update(db.execute(
+            select(ArchivoIngerido.sha256, ArchivoIngerido.ingerido).where(
+                ArchivoIngerido.proveedor_id == proveedor_id,
+                ArchivoIngerido.sha256.in_(hashes[inicio:inicio + INGESTA_TRAMO]),
+            )
+        ).all())
+    return conocidos
+
+
+def _registrar_ingeridos(db: Session, proveedor_id: int, archivos: List[tuple]) -> None:
+    """archivos: (sha256, nombre, tipo, tamaño). Un hash ya registrado se deja como estaba."""
+    if not archivos:
+        return
+    ahora = datetime.now()
+    filas = list({sha256: dict(proveedor_id=proveedor_id, sha256=sha256, nombre=nombre, tipo=tipo,
+                               tamano=tamano, ingerido=ahora)
+                  for sha256, nombre, tipo, tamano in archivos}.values())
+    try:
+        db.execute(_sentencia_sin_conflicto(db, ArchivoIngerido, ["proveedor_id", "sha256"]), filas)
+        db.commit()
+    except SQLAlchemyError:
+        # Solo afecta el salto de repetidos en una próxima subida: las facturas ya quedaron
+        db.rollback()
+        logger.warning("No se pudieron registrar %d hashes de archivos ingeridos", len(filas), exc_info=True)
+
+
+def procesar_subida_xml(trabajo: Trabajo, ruta: str, nombre_archivo: str, sha256: str,
+                        proveedor_id: int, rut_proveedor: str) -> None:
+    """Trabajo de POST /proveedor/facturas: `ruta` es la subida (un .xml o un .zip) ya
+    guardada en el almacén por contenido y `sha256` su hash.
+
+    Una subida que el proveedor ya ingirió completa se reconoce por el hash y no se abre;
+    de un ZIP nuevo se saltan, antes de parsear, los XML cuyo hash ya está en
+    archivos_ingeridos. Ambos casos quedan en `reconocidos` del trabajo. Los XML del ZIP
+    se descomprimen de a uno a medida que el pool pide tramos, y cada tramo parseado se
+    ingiere apenas llega: en memoria hay unos pocos tramos, no el ZIP entero.
+    El tiempo por etapa queda en `trabajo.etapas` (en vivo) y en las métricas al final.
+    """
+    inicio = time.perf_counter()
+    etapas = Etapas(trabajo.etapas)
+    tipo = "zip" if os.path.splitext(nombre_archivo)[1].lower() == ".zip" else "xml"   # UP.ZIP también
+    tipo_xml = "xml" if tipo == "xml" else "xml_zip"
+    db = SessionLocal()
+    try:
+        with etapas.medir(DEDUPLICACION):
+            previa = _ingeridos(db, proveedor_id, [sha256]).get(sha256)
+        if previa:
+            trabajo.fijar_total(0)
+            trabajo.agregar_reconocidos([f"{nombre_archivo} (ya procesado el {previa:%Y-%m-%d %H:%M})"])
+            return
+
+        archivo = open(ruta, "rb")
+        try:
+            with etapas.medir(LECTURA):
+                if tipo == "zip":
+                    try:
+                        zf = zipfile.ZipFile(archivo)
+                    except zipfile.BadZipFile:
+                        trabajo.sumar(errores=1)
+                        trabajo.agregar_errores(["El archivo ZIP está dañado o no es un ZIP válido."])
+                        return
+                    # El total sale del directorio central, sin descomprimir nada
+                    total = sum(1 for info in zf.infolist()
+                                if not info.is_dir() and info.filename.lower().endswith(".xml"))
+                    fuentes = _xml_del_zip(zf)
+                else:
+                    total = 1
+                    fuentes = iter([(nombre_archivo, archivo, os.fstat(archivo.fileno()).st_size)])
+            trabajo.fijar_total(total)
+            # (sha256, tamaño) de cada documento entregado al parseo, en el mismo orden:
+            # los resultados vuelven en ese orden y se emparejan sacando del frente
+            metadatos: Deque[Tuple[str, int]] = deque()
+
+            def sin_ingeridos(lote: List[tuple]) -> List[Tuple[str, bytes]]:
+                # ♻️ XML ya ingeridos (en otro ZIP o sueltos): se saltan sin parsear
+                with etapas.medir(DEDUPLICACION):
+                    conocidos = _ingeridos(db, proveedor_id, list({h for _, _, h, _ in lote}))
+                if conocidos:
+                    reconocidos = [nombre for nombre, _, h, _ in lote if h in conocidos]
+                    lote = [d for d in lote if d[2] not in conocidos]
+                    trabajo.sumar(omitidas=len(reconocidos))
+                    trabajo.agregar_reconocidos(reconocidos)
+                metadatos.extend((h, tamano) for _, _, h, tamano in lote)
+                return [(nombre, contenido) for nombre, contenido, _, _ in lote]
+
+            def documentos():
+                """Lee y hashea los XML de a uno; cada DTE_TRAMO consulta cuáles ya se ingirieron."""
+                lote = []
+                while True:
+                    with etapas.medir(LECTURA):
+                        fuente = next(fuentes, None)
+                        if fuente is None:
+                            break
+                        nombre, flujo, tamano = fuente
+                        if tamano > XML_MAX_BYTES:
+                            trabajo.sumar(errores=1)
+                            trabajo.agregar_errores([f"Error en {nombre}: el XML pesa {tamano:,} bytes "
+                                                     f"(máximo {XML_MAX_BYTES:,})"])
+                            FACTURAS_INGERIDAS.inc(origen="xml", resultado=ERROR)
+                            continue
+                        contenido = flujo.read()
+                        lote.append((nombre, contenido,
+                                     sha256 if tipo == "xml" else hashlib.sha256(contenido).hexdigest(), tamano))
+                    if len(lote) >= DTE_TRAMO:
+                        yield from sin_ingeridos(lote)
+                        lote = []
+                if lote:
+                    yield from sin_ingeridos(lote)
+
+            # ⚡ El parseo se reparte en el pool de procesos (parseo_dte.py); la BD queda en este hilo.
+            # "parseo" es lo que este hilo espera por cada tramo, sin contar la lectura de los
+            # XML que le va entregando al pool: con el pool ocupado en paralelo es menos que
+            # el CPU total de parseo.
+            tramos = parsear_por_tramos(documentos(), cantidad=total)
+            while True:
+                with etapas.medir(PARSEO):
+                    tramo = next(tramos, None)
+                if tramo is None:
+                    break
+                fallidos, rechazos, filas, archivos = [], [], [], []
+                with etapas.medir(VALIDACION):
+                    for nombre, dte, error in tramo:
+                        hash_xml, tamano = metadatos.popleft()
+                        if error:
+                            fallidos.append(f"Error en {nombre}: {error}")
+                        elif dte.rut_emisor != rut_proveedor:
+                            # Validación de consistencia con el proveedor logeado
+                            rechazos.append(f"Factura folio {dte.folio} descartada: RUT emisor ({dte.rut_emisor}) "
+                                            f"no coincide con proveedor logeado ({rut_proveedor})")
+                        else:
+                            filas.append(_fila_xml(dte, proveedor_id))
+                            archivos.append((hash_xml, nombre, tipo_xml, tamano))
+                if fallidos:
+                    FACTURAS_INGERIDAS.inc(len(fallidos), origen="xml", resultado=ERROR)
+                if rechazos:
+                    FACTURAS_INGERIDAS.inc(len(rechazos), origen="xml", resultado=RECHAZADA)
+
+                # Deduplicación e inserción por tramos (una consulta + un INSERT por tramo)
+                resultados = ingerir(db, filas, origen="xml", etapas=etapas)
+                por_resultado = Counter(r.resultado for r in resultados)
+                trabajo.sumar(
+                    parseadas=len(tramo),
+                    insertadas=por_resultado[NUEVA],
+                    duplicadas=por_resultado[DUPLICADA],
+                    rechazadas=len(rechazos),
+                    errores=len(fallidos) + por_resultado[ERROR],
+                )
+                trabajo.agregar_errores(fallidos + rechazos + [r.detalle for r in resultados if r.resultado != NUEVA])
+                # La factura de estos XML ya está en la BD: la próxima vez se saltan
+                with etapas.medir(INSERCION):
+                    _registrar_ingeridos(db, proveedor_id, [
+                        archivos[r.indice] for r in resultados if r.resultado in (NUEVA, DUPLICADA)
+                    ])
+        finally:
+            archivo.close()
+
+        if tipo == "zip" and trabajo.contadores["errores"] == 0:
+            _registrar_ingeridos(db, proveedor_id, [(sha256, nombre_archivo, tipo, os.path.getsize(ruta))])
+    finally:
+        db.close()
+        INGESTA_DURACION.observar(time.perf_counter() - inicio, origen="xml")
+        etapas.publicar("xml")
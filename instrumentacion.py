@@ -0,0 +1,169 @@
+# instrumentacion.py
+# Instrumentación SQL por request: cada sentencia que pasa por cualquier Engine (sync o
+# async) se cuenta y se mide con los eventos de SQLAlchemy, y el middleware lo expone en
+# el header Server-Timing y en una línea de log JSON. Una misma sentencia repetida
+# muchas veces en el mismo request se marca como posible N+1.
+# En modo prueba (SQL_MODO_PRUEBA=true), superar el presupuesto de consultas de la ruta
+# lanza PresupuestoConsultasExcedido en la consulta que lo rompe.
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sql")
+
+# ─── Configuración ──────────────────────────────────────────────────────────
+SQL_INSTRUMENTACION = os.getenv("SQL_INSTRUMENTACION", "true").lower() == "true"
+SQL_N_MAS_1_UMBRAL = int(os.getenv("SQL_N_MAS_1_UMBRAL", "5"))                # repeticiones para avisar
+SQL_PRESUPUESTO_CONSULTAS = int(os.getenv("SQL_PRESUPUESTO_CONSULTAS", "0"))  # 0 = sin límite
+SQL_MODO_PRUEBA = os.getenv("SQL_MODO_PRUEBA", "false").lower() == "true"
+
+# Presupuesto por ruta (plantilla de FastAPI, ej. "/financiador/marketplace"); pisa el global
+PRESUPUESTOS: dict = {}
+
+
+class PresupuestoConsultasExcedido(RuntimeError):
+    pass
+
+
+class EstadisticasSQL:
+    """Consultas de un request (o de un bloque `medir_consultas`)."""
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope or {}
+        self.consultas = 0
+        self.segundos = 0.0
+        self.por_sentencia: dict = {}   # sentencia → [veces, segundos]
+
+    @property
+    def ruta(self) -> Optional[str]:
+        # FastAPI deja la ruta resuelta en scope["route"] al enrutar
+        ruta = self.scope.get("route")
+        return getattr(ruta, "path", None) or self.scope.get("path")
+
+    def presupuesto(self) -> int:
+        return PRESUPUESTOS.get(self.ruta, SQL_PRESUPUESTO_CONSULTAS)
+
+    def registrar(self, sentencia: str, segundos: float) -> None:
+        self.consultas += 1
+        self.segundos += segundos
+        acumulado = self.por_sentencia.setdefault(sentencia, [0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += segundos
+
+    def repetidas(self, umbral: int = None) -> list:
+        """[(sentencia, veces)] de las sentencias idénticas ejecutadas `umbral` veces o más."""
+        umbral = umbral or SQL_N_MAS_1_UMBRAL
+        return sorted(
+            ((sentencia, veces) for sentencia, (veces, _) in self.por_sentencia.items() if veces >= umbral),
+            key=lambda par: -par[1],
+        )
+
+    def server_timing(self, total_segundos: float) -> str:
+        return (f'sql;dur={self.segundos * 1000:.2f};desc="{self.consultas} consultas", '
+                f'app;dur={total_segundos * 1000:.2f}')
+
+
+_actual: ContextVar[Optional[EstadisticasSQL]] = ContextVar("treds_sql", default=None)
+
+
+def estadisticas_actuales() -> Optional[EstadisticasSQL]:
+    return _actual.get()
+
+
+@contextmanager
+def medir_consultas(scope: Optional[dict] = None):
+    """Cuenta las consultas del bloque (scripts, benchmarks, pruebas manuales)."""
+    estadisticas = EstadisticasSQL(scope)
+    token = _actual.set(estadisticas)
+    try:
+        yield estadisticas
+    finally:
+        _actual.reset(token)
+
+
+# ─── Eventos de SQLAlchemy (todas las Engine, incluida la sync_engine del async) ─
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    estadisticas = _actual.get()
+    if estadisticas is None:
+        return
+    presupuesto = estadisticas.presupuesto()
+    if SQL_MODO_PRUEBA and presupuesto and estadisticas.consultas >= presupuesto:
+        raise PresupuestoConsultasExcedido(
+            f"{estadisticas.ruta}: más de {presupuesto} consultas; la siguiente era:\n{statement}"
+        )
+    context._treds_inicio = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    estadisticas = _actual.get()
+    inicio = getattr(context, "_treds_inicio", None)
+    if estadisticas is None or inicio is None:
+        return
+    estadisticas.registrar(statement, time.perf_counter() - inicio)
+
+
+# ─── Middleware ─────────────────────────────────────────────────────────────
+class InstrumentacionSQL:
+    """Middleware ASGI: abre las estadísticas del request, agrega Server-Timing y deja el log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_INSTRUMENTACION:
+            await self.app(scope, receive, send)
+            return
+
+        estadisticas = EstadisticasSQL(scope)
+        token = _actual.set(estadisticas)
+        inicio = time.perf_counter()
+        status = 500
+
+        async def enviar(mensaje):
+            nonlocal status
+            if mensaje["type"] == "http.response.start":
+                status = mensaje["status"]
+                MutableHeaders(scope=mensaje).append(
+                    "Server-Timing", estadisticas.server_timing(time.perf_counter() - inicio)
+                )
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            _registrar_request(scope, status, estadisticas, time.perf_counter() - inicio)
+
+
+def _registrar_request(scope, status, estadisticas: EstadisticasSQL, total_segundos: float) -> None:
+    repetidas = estadisticas.repetidas()
+    presupuesto = estadisticas.presupuesto()
+    excedido = bool(presupuesto) and estadisticas.consultas > presupuesto
+    nivel = logging.WARNING if repetidas or excedido else logging.INFO
+    if not logger.isEnabledFor(nivel):
+        return
+    logger.log(nivel, json.dumps({
+        "evento": "request_sql",
+        "metodo": scope.get("method"),
+        "ruta": estadisticas.ruta,
+        "status": status,
+        "consultas": estadisticas.consultas,
+        "sql_ms": round(estadisticas.segundos * 1000, 2),
+        "total_ms": round(total_segundos * 1000, 2),
+        "presupuesto": presupuesto or None,
+        "n_mas_1": [{"veces": veces, "sentencia": " ".join(sentencia.split())[:200]}
+                    for sentencia, veces in repetidas],
+    }, ensure_ascii=False))
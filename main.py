@@ -1,13 +1,25 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles  # ✅ Añadir esto
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 import os
 
+from database import iniciar_checkpoint_wal, detener_checkpoint_wal, cerrar_async_engine
+from dependencias import LoginRequerido
+from instrumentacion import InstrumentacionSQL
+from metricas import MetricasHTTP, REGISTRO, TIPO_CONTENIDO
+from parseo_dte import cerrar_pool
+from trabajos import iniciar_trabajadores, detener_trabajadores
+from sincronizacion_sii import iniciar_programador, detener_programador
+from cliente_sii import cerrar_cliente
+from navegadores_sii import cerrar_navegadores
+
 # Routers (importando los objetos `router` de cada archivo)
 from routers.auth import router as auth_router
 from routers.proveedor import router as proveedor_router
+from routers.facturas_proveedor import router as facturas_proveedor_router
 from routers.pagador import router as pagador_router
 from routers.financiador import router as financiador_router
 from routers.marketplace import router as marketplace_router
@@ -18,8 +30,24 @@ from routers.middle_office import router as middle_office_router
 # 🔐 Cargar variables de entorno
 load_dotenv()
 
+# ♻️ Tareas de fondo ligadas al ciclo de vida de la app
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    iniciar_checkpoint_wal()   # solo actúa con SQLITE_MODO_PRODUCCION=true
+    iniciar_trabajadores()     # cola de trabajos en segundo plano (subidas de XML/ZIP)
+    iniciar_programador()      # sincronización nocturna con el SII, solo con SII_SINC_HORA
+    yield
+    detener_programador()
+    cerrar_navegadores()       # Chrome headless del pool SII (si la sincronización abrió alguno)
+    cerrar_cliente()           # conexiones keep-alive al SII
+    detener_trabajadores()     # termina lo que esté en curso antes de cerrar la BD y el pool
+    await cerrar_async_engine()
+    detener_checkpoint_wal()
+    cerrar_pool()              # pool de parseo DTE (si alguna subida grande lo creó)
+
+
 # 🚀 Crear aplicación
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Montar archivos estáticos
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -29,9 +57,21 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 SECRET_KEY = os.getenv("SECRET_KEY", "!defaultsecret")
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 
+# 📈 Conteo/tiempo de SQL por request (Server-Timing + log "treds.sql"); envuelve la sesión
+# y los routers. El último middleware agregado queda por fuera: el orden es
+# MetricasHTTP → InstrumentacionSQL → SessionMiddleware → routers
+app.add_middleware(InstrumentacionSQL)
+
+# 📊 Requests y latencia por router / plantilla de ruta (se exponen en /metrics); va por
+# fuera de todo para que la latencia incluya también la instrumentación SQL
+app.add_middleware(MetricasHTTP)
+
 # 📦 Inclusión de routers en orden lógico
 app.include_router(auth_router, prefix="/auth")
 app.include_router(proveedor_router, prefix="/proveedor")
+# Va después de proveedor_router: GET/POST /proveedor/facturas los sigue atendiendo
+# routers/proveedor.py; de aquí se usa la importación de planillas (/facturas/importar)
+app.include_router(facturas_proveedor_router, prefix="/proveedor")
 app.include_router(pagador_router, prefix="/pagador")
 app.include_router(financiador_router, prefix="/financiador")
 app.include_router(marketplace_router, prefix="/marketplace")
@@ -39,6 +79,16 @@ app.include_router(configuracion_router, prefix="/configuracion")
 app.include_router(admin_router, prefix="/admin")
 app.include_router(middle_office_router)
 
+# 📊 Métricas en formato de texto Prometheus (no requiere servicios externos: curl /metrics)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(REGISTRO.exportar(), media_type=TIPO_CONTENIDO)
+
+# 🔐 Rutas protegidas sin sesión válida → login del rol correspondiente
+@app.exception_handler(LoginRequerido)
+async def login_requerido_handler(request: Request, exc: LoginRequerido):
+    return RedirectResponse(url=exc.url, status_code=303)
+
 # ⚠️ Manejo de errores 404 (opcional y no invasivo)
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):
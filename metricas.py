@@ -0,0 +1,298 @@
+# metricas.py
+# Registro de métricas en memoria, sin dependencias externas, expuesto en formato de
+# texto de Prometheus (0.0.4) por GET /metrics. Cualquier scraper compatible lo lee,
+# y también se puede revisar con curl.
+#
+#   from metricas import FACTURAS_INGERIDAS
+#   FACTURAS_INGERIDAS.inc(origen="xml", resultado="nueva")
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_POOL = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+BUCKETS_LENTOS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres: Iterable[str], valores: Iterable, extra: str = "") -> str:
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, valores: dict) -> tuple:
+        if set(valores) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}, recibió {tuple(valores)}")
+        return tuple(str(valores[nombre]) for nombre in self.etiquetas)
+
+    def _encabezado(self) -> list:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[tuple, float] = {}
+
+    def inc(self, valor: float = 1, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        return self._valores.get(self._clave(etiquetas), 0)
+
+    def exportar(self) -> list:
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return self._encabezado() + [
+            f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}"
+            for clave, valor in valores
+        ]
+
+
+class Medidor(_Metrica):
+    """Gauge: un valor fijado a mano, o calculado al exportar con `funcion` ({clave: valor})."""
+    tipo = "gauge"
+
+    def __init__(self, *args, funcion: Optional[Callable[[], Dict[tuple, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[tuple, float] = {}
+        self._funciones = [funcion] if funcion else []
+
+    def fijar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def inc(self, valor: float = 1, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def dec(self, valor: float = 1, **etiquetas) -> None:
+        self.inc(-valor, **etiquetas)
+
+    def agregar_funcion(self, funcion: Callable[[], Dict[tuple, float]]) -> None:
+        with self._lock:
+            self._funciones.append(funcion)
+
+    def exportar(self) -> list:
+        with self._lock:
+            valores = dict(self._valores)
+            funciones = list(self._funciones)
+        for funcion in funciones:
+            try:
+                valores.update(funcion())
+            except Exception:
+                continue  # un callback roto no debe tumbar /metrics
+        return self._encabezado() + [
+            f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}"
+            for clave, valor in sorted(valores.items())
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = BUCKETS_HTTP, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}   # clave → [conteos por bucket..., suma, total]
+
+    def observar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def conteo(self, **etiquetas) -> int:
+        serie = self._series.get(self._clave(etiquetas))
+        return serie[-1] if serie else 0
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted((clave, list(serie)) for clave, serie in self._series.items())
+        lineas = self._encabezado()
+        for clave, serie in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                etiquetas = _formatear_etiquetas(self.etiquetas, clave, f'le="{_formatear_numero(float(limite))}"')
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave, 'le="+Inf"')
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {serie[-1]}")
+            base = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{base} {_formatear_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{base} {serie[-1]}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return "\n".join(linea for metrica in metricas for linea in metrica.exportar()) + "\n"
+
+
+REGISTRO = Registro()
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ─── Métricas de la aplicación ──────────────────────────────────────────────
+HTTP_REQUESTS = REGISTRO.registrar(Contador(
+    "treds_http_requests_total", "Requests HTTP atendidos", ("metodo", "router", "ruta", "status")))
+HTTP_DURACION = REGISTRO.registrar(Histograma(
+    "treds_http_request_duracion_segundos", "Latencia de los requests HTTP", ("metodo", "router", "ruta")))
+HTTP_EN_CURSO = REGISTRO.registrar(Medidor(
+    "treds_http_requests_en_curso", "Requests HTTP en proceso"))
+
+DB_POOL_ESPERA = REGISTRO.registrar(Histograma(
+    "treds_db_pool_espera_segundos", "Espera para obtener una conexión del pool", ("driver",),
+    buckets=BUCKETS_POOL))
+DB_POOL_CONEXIONES = REGISTRO.registrar(Medidor(
+    "treds_db_pool_conexiones", "Conexiones del pool por estado", ("driver", "estado")))
+
+SUBIDAS = REGISTRO.registrar(Contador(
+    "treds_subidas_total", "Archivos subidos por los proveedores", ("tipo",)))
+SUBIDAS_BYTES = REGISTRO.registrar(Contador(
+    "treds_subidas_bytes_total", "Bytes subidos por los proveedores", ("tipo",)))
+FACTURAS_INGERIDAS = REGISTRO.registrar(Contador(
+    "treds_facturas_ingeridas_total", "Facturas procesadas en la ingesta", ("origen", "resultado")))
+INGESTA_DURACION = REGISTRO.registrar(Histograma(
+    "treds_ingesta_duracion_segundos", "Duración de cada lote de ingesta", ("origen",),
+    buckets=BUCKETS_LENTOS))
+
+INGESTA_ETAPA = REGISTRO.registrar(Histograma(
+    "treds_ingesta_etapa_segundos", "Tiempo de cada lote de ingesta por etapa (ver ingesta.Etapas)",
+    ("origen", "etapa"), buckets=BUCKETS_LENTOS))
+
+TRABAJOS = REGISTRO.registrar(Contador(
+    "treds_trabajos_total", "Trabajos en segundo plano por tipo y estado", ("tipo", "estado")))
+TRABAJOS_EN_COLA = REGISTRO.registrar(Medidor(
+    "treds_trabajos_en_cola", "Trabajos esperando un hilo trabajador"))
+
+SII_DURACION = REGISTRO.registrar(Histograma(
+    "treds_sii_consulta_duracion_segundos", "Duración de las consultas al SII", ("operacion", "resultado"),
+    buckets=BUCKETS_LENTOS))
+SII_PERIODOS = REGISTRO.registrar(Contador(
+    "treds_sii_sincronizacion_periodos_total", "Periodos procesados por la sincronización programada con el SII",
+    ("resultado",)))
+SII_CREDENCIALES = REGISTRO.registrar(Contador(
+    "treds_sii_credenciales_total", "Sesiones y tokens SII entregados, según de dónde salieron (ver credenciales_sii.py)",
+    ("credencial", "origen")))
+NAVEGADORES_SII = REGISTRO.registrar(Medidor(
+    "treds_sii_navegadores", "Chrome del pool de navegadores SII por estado (ver navegadores_sii.py)", ("estado",)))
+
+
+TIPOS_SUBIDA = ("xml", "zip", "csv", "xlsx")
+
+
+def tipo_subida(nombre: Optional[str]) -> str:
+    """Etiqueta "tipo" de treds_subidas_*: la extensión del archivo si es una de TIPOS_SUBIDA,
+    si no "otro". El nombre lo pone el cliente y cada valor distinto sería otra serie."""
+    extension = os.path.splitext(nombre or "")[1].lstrip(".").lower()
+    return extension if extension in TIPOS_SUBIDA else "otro"
+
+
+@contextmanager
+def medir_sii(operacion: str):
+    """Cronometra una consulta al SII y la registra con resultado ok / error."""
+    inicio = time.perf_counter()
+    resultado = "error"
+    try:
+        yield
+        resultado = "ok"
+    finally:
+        SII_DURACION.observar(time.perf_counter() - inicio, operacion=operacion, resultado=resultado)
+
+
+# ─── Middleware HTTP ────────────────────────────────────────────────────────
+def _router_y_ruta(scope) -> Tuple[str, str]:
+    # Se etiqueta con la plantilla ("/financiador/ofertar/{folio}") para no crear una
+    # serie por folio; lo que no pasó por una APIRoute (404, /static) queda agrupado.
+    ruta = scope.get("route")
+    if ruta is None or not hasattr(ruta, "path"):
+        return "ninguno", "sin_ruta"
+    modulo = getattr(scope.get("endpoint"), "__module__", "") or ""
+    return modulo.rsplit(".", 1)[-1] or "ninguno", ruta.path
+
+
+class MetricasHTTP:
+    """Middleware ASGI: cuenta requests y mide su latencia por router y plantilla de ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status = 500
+
+        async def enviar(mensaje):
+            nonlocal status
+            if mensaje["type"] == "http.response.start":
+                status = mensaje["status"]
+            await send(mensaje)
+
+        HTTP_EN_CURSO.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            HTTP_EN_CURSO.dec()
+            router, ruta = _router_y_ruta(scope)
+            HTTP_DURACION.observar(time.perf_counter() - inicio, metodo=scope["method"], router=router, ruta=ruta)
+            HTTP_REQUESTS.inc(metodo=scope["method"], router=router, ruta=ruta, status=status)
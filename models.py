@@ -1,9 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
-from sqlalchemy import Date, Boolean
-from sqlalchemy import cast
-from sqlalchemy.orm import foreign
+from estados import EstadoDTEColumna
+from sqlalchemy import Date, DateTime, Boolean
 
 class Proveedor(Base):
     __tablename__ = "proveedores"
@@ -90,14 +89,19 @@ class Financiador(Base):
 
 class FacturaDB(Base):
     __tablename__ = "facturas"
+    __table_args__ = (
+        UniqueConstraint("rut_emisor", "rut_receptor", "folio", name="uq_facturas_emisor_receptor_folio"),
+        Index("ix_facturas_estado_adjudicado", "estado_dte", "financiador_adjudicado"),  # marketplace
+        Index("ix_facturas_receptor_estado", "rut_receptor", "estado_dte"),              # vistas del pagador
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     rut_emisor = Column(String, index=True)
     rut_receptor = Column(String)
     tipo_dte = Column(String)
-    folio = Column(Integer)
+    folio = Column(Integer, index=True)
     monto = Column(Integer)
-    estado_dte = Column(String)
+    estado_dte = Column(EstadoDTEColumna)  # SMALLINT; ver estados.py
     razon_social_emisor = Column(String)
     razon_social_receptor = Column(String)
     fecha_emision = Column(Date)
@@ -106,9 +110,9 @@ class FacturaDB(Base):
     modificacion_aceptada_por_proveedor = Column(Boolean, nullable=True, default=None)
     confirming_solicitado = Column(Boolean, default=False)
     origen_confirmacion = Column(String, default="Desconocido")
-    financiador_adjudicado = Column(Integer, ForeignKey("financiadores.id"), nullable=True)
+    financiador_adjudicado = Column(Integer, ForeignKey("financiadores.id"), nullable=True, index=True)
     
-    proveedor_id = Column(Integer, ForeignKey("proveedores.id"))
+    proveedor_id = Column(Integer, ForeignKey("proveedores.id"), index=True)
     proveedor = relationship("Proveedor", back_populates="facturas")
 
     pagador_id = Column(Integer, ForeignKey("pagadores.id"))
@@ -116,11 +120,8 @@ class FacturaDB(Base):
 
     ofertas = relationship("OfertaFinanciamiento", back_populates="factura")
 
-    financiador = relationship(
-        "Financiador",
-        primaryjoin=Financiador.id == foreign(cast(financiador_adjudicado, Integer)), viewonly=True,
-        uselist=False,
-    )
+    # Financiador adjudicado: FK entera normal → admite joinedload/selectinload
+    financiador = relationship("Financiador", foreign_keys=[financiador_adjudicado])
 
 class OfertaFinanciamiento(Base):
     __tablename__ = "ofertas_financiamiento"
@@ -133,10 +134,47 @@ class OfertaFinanciamiento(Base):
     precio_cesion = Column(Float)
     estado = Column(String, default="Oferta realizada")
 
-    factura_id = Column(Integer, ForeignKey("facturas.id"))
-    financiador_id = Column(Integer, ForeignKey("financiadores.id"))
+    factura_id = Column(Integer, ForeignKey("facturas.id"), index=True)
+    financiador_id = Column(Integer, ForeignKey("financiadores.id"), index=True)
 
     factura = relationship("FacturaDB", back_populates="ofertas")
-    financiador = relationship("Financiador", back_populates="ofertas")    
-                           
-                              
+    financiador = relationship("Financiador", back_populates="ofertas")
+
+
+class ArchivoIngerido(Base):
+    """Hash de cada archivo ya ingerido por un proveedor: la subida completa (ZIP o XML) y
+    cada XML de un ZIP. Una subida o un XML con un hash conocido se salta sin parsearlo.
+    El contenido queda en el almacén por hash (almacen.py)."""
+    __tablename__ = "archivos_ingeridos"
+    __table_args__ = (
+        UniqueConstraint("proveedor_id", "sha256", name="uq_archivos_ingeridos_proveedor_sha256"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    proveedor_id = Column(Integer, ForeignKey("proveedores.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    nombre = Column(String, nullable=False)       # nombre con que se subió la primera vez
+    tipo = Column(String, nullable=False)         # "zip" / "xml" (subida) o "xml_zip" (XML dentro de un ZIP)
+    tamano = Column(Integer, nullable=False)
+    ingerido = Column(DateTime, nullable=False)
+
+
+class SincronizacionSII(Base):
+    """Marca de agua de la sincronización programada con el SII (sincronizacion_sii.py):
+    una fila por proveedor y periodo YYYY-MM. Un periodo `cerrado` ya no se vuelve a
+    consultar; `documentos` permite saltar la importación si el SII no trae nada nuevo."""
+    __tablename__ = "sincronizaciones_sii"
+    __table_args__ = (
+        UniqueConstraint("proveedor_id", "periodo", name="uq_sincronizaciones_sii_proveedor_periodo"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    proveedor_id = Column(Integer, ForeignKey("proveedores.id"), nullable=False)
+    rut = Column(String, nullable=False)            # RUT consultado (sin DV), como en detalle_{rut}_{periodo}.json
+    periodo = Column(String(7), nullable=False)     # "2025-07"
+    estado = Column(String, nullable=False)         # "ok" / "error"
+    documentos = Column(Integer, nullable=True)     # registros que devolvió el SII en la última consulta ok
+    nuevas = Column(Integer, nullable=False, default=0)   # facturas insertadas, acumulado
+    cerrado = Column(Boolean, nullable=False, default=False)
+    sincronizado = Column(DateTime, nullable=False)
+    error = Column(String, nullable=True)
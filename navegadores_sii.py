@@ -0,0 +1,306 @@
+# navegadores_sii.py
+# Pool de Chrome headless para obtener el tokenRecaptcha del RCV sin abrir un navegador por
+# consulta. Levantar Chrome, cargar www4.sii.cl y esperar la página costaba 10-20 s por
+# periodo; con el navegador ya abierto queda solo lo que tarda el portal en cargar la app
+# (sin imágenes ni fuentes) y responder la consulta.
+#
+#   • A lo más SII_NAVEGADORES navegadores vivos (cada Chrome son 150-300 MB): quien pide uno
+#     con todos prestados espera hasta SII_NAVEGADOR_ESPERA segundos.
+#   • Cada préstamo es para un RUT: si el navegador venía de otro, se le borran las cookies y el
+#     localStorage de sii.cl y se cargan las del RUT por CDP, sin navegar. Se prefiere uno
+#     que ya tenga las cookies del mismo RUT.
+#   • Antes de prestar uno se verifica que responda; uno colgado o caído se cierra y se
+#     reemplaza. Tras SII_NAVEGADOR_USOS préstamos se recicla (Chrome crece con el uso).
+#   • Imágenes y fuentes no se descargan.
+#
+#   with obtener_navegadores().prestar("76262370", cookies) as navegador:
+#       token = navegador.token_recaptcha("2025-07")
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from cliente_sii import URL_BASE, ErrorSII
+from metricas import NAVEGADORES_SII, medir_sii
+
+try:
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+except ImportError:
+    webdriver = None   # la app funciona sin selenium; solo la sincronización con el SII lo necesita
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sii")
+
+SII_NAVEGADORES = int(os.getenv("SII_NAVEGADORES", "2"))                   # Chrome vivos a lo más
+SII_NAVEGADOR_USOS = int(os.getenv("SII_NAVEGADOR_USOS", "50"))            # préstamos antes de reciclarlo
+SII_NAVEGADOR_ESPERA = float(os.getenv("SII_NAVEGADOR_ESPERA", "120"))     # segundos esperando uno libre
+SII_TOKEN_TIMEOUT = float(os.getenv("SII_TOKEN_TIMEOUT", "15"))            # segundos por paso en la página
+
+URL_RCV = f"{URL_BASE}/consdcvinternetui/#/index"
+URL_LOGIN = "https://zeusr.sii.cl/AUT2000/InicioAutenticacion/IngresoRutClave.html"
+_BLOQUEADAS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+               "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"]
+_BOTON_CONSULTAR = "//button[contains(., 'Consultar')]"
+
+
+def crear_driver():
+    """Chrome headless liviano: sin imágenes, extensiones ni GPU, y sin esperar recursos
+    secundarios al cargar (page_load_strategy eager)."""
+    if webdriver is None:
+        raise ErrorSII("Selenium no está instalado (pip install selenium)")
+    options = Options()
+    options.page_load_strategy = "eager"
+    for argumento in ("--headless=new", "--disable-gpu", "--disable-extensions", "--no-sandbox",
+                      "--disable-dev-shm-usage", "--blink-settings=imagesEnabled=false", "--window-size=1280,900"):
+        options.add_argument(argumento)
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    driver = webdriver.Chrome(options=options)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": _BLOQUEADAS})
+    return driver
+
+
+def _cookies_cdp(raw_cookies: List[dict]) -> List[dict]:
+    """Cookies de Selenium → parámetros de Network.setCookies; solo las de sii.cl."""
+    cookies = []
+    for cookie in raw_cookies:
+        if ".sii.cl" not in cookie.get("domain", "") or cookie["name"].startswith("AMCV"):
+            continue   # cookies de terceros: el SII no las necesita
+        cdp = {"name": cookie["name"], "value": cookie["value"], "domain": cookie["domain"],
+               "path": cookie.get("path", "/"), "secure": bool(cookie.get("secure", False)),
+               "httpOnly": bool(cookie.get("httpOnly", False))}
+        if cookie.get("expiry"):
+            cdp["expires"] = cookie["expiry"]
+        cookies.append(cdp)
+    return cookies
+
+
+def _cookies_selenium(cookies_cdp: List[dict]) -> List[dict]:
+    """Network.getAllCookies → el formato de driver.get_cookies() que guardan los scripts."""
+    cookies = []
+    for cookie in cookies_cdp:
+        selenium = {"name": cookie["name"], "value": cookie["value"], "domain": cookie["domain"],
+                    "path": cookie.get("path", "/"), "secure": cookie.get("secure", False),
+                    "httpOnly": cookie.get("httpOnly", False)}
+        if cookie.get("expires", -1) > 0:   # -1: cookie de sesión
+            selenium["expiry"] = int(cookie["expires"])
+        cookies.append(selenium)
+    return cookies
+
+
+def _huella(raw_cookies: List[dict]) -> frozenset:
+    return frozenset((cookie["name"], cookie["value"]) for cookie in raw_cookies)
+
+
+def _cookies_con_sesion(driver):
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+    return cookies if any(cookie["name"] == "CSESSIONID" for cookie in cookies) else False
+
+
+def _sesion_con_token(driver):
+    sesion = driver.execute_script("return window.localStorage.getItem('siilastsesion');")
+    return sesion if sesion and '"token":"' in sesion else False
+
+
+class Navegador:
+    """Un Chrome del pool y el RUT cuyas cookies tiene cargadas. Un error del propio
+    navegador (no de la página) lo marca `roto` para que el pool no lo vuelva a prestar."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.rut: Optional[str] = None
+        self.cookies: frozenset = frozenset()   # (nombre, valor) cargados: si el RUT renovó su sesión, difieren
+        self.usos = 0
+        self.roto = False
+
+    def sano(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def cargar_cookies(self, rut: str, raw_cookies: List[dict]) -> None:
+        try:
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            self.driver.execute_cdp_cmd("Storage.clearDataForOrigin",
+                                        {"origin": URL_BASE, "storageTypes": "local_storage,session_storage"})
+            self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": _cookies_cdp(raw_cookies)})
+        except WebDriverException as e:
+            self.roto = True
+            raise ErrorSII(f"No se pudieron cargar las cookies en el navegador: {e.msg}") from e
+        self.rut, self.cookies = rut, _huella(raw_cookies)
+
+    def iniciar_sesion(self, rut: str, rut_completo: str, clave: str) -> List[dict]:
+        """Login con RUT y clave SII; devuelve las cookies de la sesión (con CSESSIONID, que
+        el RCV entrega en la primera visita) y deja el navegador con ellas cargadas."""
+        driver = self.driver
+        espera = WebDriverWait(driver, SII_TOKEN_TIMEOUT, poll_frequency=0.1)
+        with medir_sii("login"):
+            try:
+                self.cargar_cookies(rut, [])
+                driver.get(URL_LOGIN)
+                espera.until(EC.presence_of_element_located((By.ID, "rutcntr"))).send_keys(rut_completo)
+                driver.find_element(By.ID, "clave").send_keys(clave)
+                driver.find_element(By.ID, "bt_ingresar").click()
+                espera.until(lambda d: "IngresoRutClave" not in d.current_url)
+                driver.get(URL_RCV)
+                cookies = espera.until(_cookies_con_sesion)
+            except TimeoutException as e:
+                raise ErrorSII(f"El SII no aceptó el login de {rut_completo} en {SII_TOKEN_TIMEOUT:.0f}s "
+                               "(¿clave SII incorrecta?)") from e
+            except WebDriverException as e:
+                self.roto = True
+                raise ErrorSII(f"Falló el login SII en el navegador: {e.msg}") from e
+        cookies = _cookies_selenium(cookies)
+        self.rut, self.cookies = rut, _huella(cookies)
+        return cookies
+
+    def token_recaptcha(self, periodo: str) -> str:
+        """Consulta el periodo en el RCV y devuelve el tokenRecaptcha que el portal deja en
+        localStorage. Las esperas son por condición, sin pausas fijas."""
+        driver = self.driver
+        espera = WebDriverWait(driver, SII_TOKEN_TIMEOUT, poll_frequency=0.1)
+        with medir_sii("token_recaptcha"):
+            try:
+                # Salir del RCV fuerza una carga completa de la app (ir a la misma URL con #
+                # no recarga) y el token de la consulta anterior no debe confundirse con el de esta
+                driver.get("about:blank")
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin",
+                                       {"origin": URL_BASE, "storageTypes": "local_storage"})
+                driver.get(URL_RCV)
+                anho, mes = periodo.split("-")
+                for modelo, valor in (("periodoAnho", anho), ("periodoMes", mes)):
+                    select = espera.until(EC.presence_of_element_located(
+                        (By.XPATH, f"//select[@ng-model='{modelo}']")))
+                    driver.execute_script(
+                        "arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('change'))",
+                        select, valor)
+                espera.until(EC.element_to_be_clickable((By.XPATH, _BOTON_CONSULTAR))).click()
+                sesion = espera.until(_sesion_con_token)
+            except TimeoutException as e:
+                # La página no respondió a tiempo (sesión vencida, SII lento): el navegador sirve
+                raise ErrorSII(f"TokenRecaptcha no encontrado en {SII_TOKEN_TIMEOUT:.0f}s.") from e
+            except WebDriverException as e:
+                self.roto = True
+                raise ErrorSII(f"No se pudo obtener tokenRecaptcha: {e.msg}") from e
+        token = json.loads(sesion).get("token", "")
+        if not token:
+            raise ErrorSII("TokenRecaptcha vacío.")
+        return token
+
+    def cerrar(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception:
+            pass   # ya estaba caído
+
+
+class PoolNavegadores:
+    def __init__(self, tamano: int = SII_NAVEGADORES, usos: int = SII_NAVEGADOR_USOS,
+                 espera: float = SII_NAVEGADOR_ESPERA, fabrica: Callable = crear_driver):
+        self.usos = usos
+        self.espera = espera
+        self.fabrica = fabrica
+        self._cupos = threading.BoundedSemaphore(max(1, tamano))
+        self._lock = threading.Lock()
+        self._libres: List[Navegador] = []
+        self.prestados = 0
+        self._cerrado = False
+
+    def _tomar(self, rut: str) -> Optional[Navegador]:
+        """Un libre que ya tenga las cookies del RUT, o el último devuelto."""
+        with self._lock:
+            for i in range(len(self._libres) - 1, -1, -1):
+                if self._libres[i].rut == rut:
+                    return self._libres.pop(i)
+            return self._libres.pop() if self._libres else None
+
+    def _devolver(self, navegador: Navegador, error: Optional[BaseException]) -> None:
+        navegador.usos += 1
+        # Un error que no es ErrorSII vino de afuera del navegador: no se sabe en qué quedó
+        descartar = navegador.roto or navegador.usos >= self.usos or (
+            error is not None and not isinstance(error, ErrorSII))
+        with self._lock:
+            if not descartar and not self._cerrado:
+                self._libres.append(navegador)
+                return
+        navegador.cerrar()
+
+    @contextmanager
+    def prestar(self, rut: str, raw_cookies: List[dict]):
+        """Navegador con las cookies del RUT cargadas, de uso exclusivo dentro del with."""
+        if not self._cupos.acquire(timeout=self.espera):
+            raise ErrorSII(f"No se liberó un navegador en {self.espera:.0f}s")
+        navegador = None
+        error = None
+        try:
+            navegador = self._tomar(rut)
+            if navegador is not None and not navegador.sano():
+                logger.warning("Navegador SII sin respuesta: se reemplaza")
+                navegador.cerrar()
+                navegador = None
+            if navegador is None:
+                navegador = Navegador(self.fabrica())
+            if navegador.rut != rut or navegador.cookies != _huella(raw_cookies):
+                navegador.cargar_cookies(rut, raw_cookies)
+            with self._lock:
+                self.prestados += 1
+            try:
+                yield navegador
+            finally:
+                with self._lock:
+                    self.prestados -= 1
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if navegador is not None:
+                self._devolver(navegador, error)
+            self._cupos.release()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+        for navegador in libres:
+            navegador.cerrar()
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {("libre",): len(self._libres), ("prestado",): self.prestados}
+
+
+_pool: Optional[PoolNavegadores] = None
+_pool_lock = threading.Lock()
+
+
+def obtener_navegadores() -> PoolNavegadores:
+    """Pool compartido del proceso, creado en el primer uso (sin navegadores: se abren a
+    medida que se piden)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolNavegadores()
+        return _pool
+
+
+def cerrar_navegadores() -> None:
+    """Cierra los navegadores libres; los prestados se cierran al devolverse."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+
+NAVEGADORES_SII.agregar_funcion(lambda: _pool.estado() if _pool is not None else {})
@@ -0,0 +1,266 @@
+# parseo_dte.py
+# Parseo de los XML de DTE subidos por los proveedores: leer_dte saca todos los campos
+# en una sola pasada (lxml si está instalado, si no xml.etree) y entrega un RegistroDTE;
+# escribir_dte arma el XML inverso.
+# Un ZIP grande trae miles de documentos: por sobre DTE_MIN_PARALELO se reparten en
+# tramos entre los procesos de un ProcessPoolExecutor, que devuelven tuplas planas (nada
+# de ORM ni sesiones). La escritura en la BD sigue en un solo hilo: el trabajo de
+# ingesta que consume los tramos (ingesta.procesar_subida_xml).
+#
+# Este módulo se importa en los procesos hijos (contexto "spawn"): no debe importar
+# la app, la BD ni nada pesado.
+#
+#   for tramo in parsear_por_tramos([(nombre, contenido_bytes), ...]):
+#       for nombre, registro, error in tramo: ...
+import logging
+import multiprocessing
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, NamedTuple, Optional, Sized, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from lxml import etree as _lxml   # opcional: parseo en C con filtro de etiquetas
+except ImportError:
+    _lxml = None
+
+load_dotenv()
+
+logger = logging.getLogger("treds.dte")
+
+DTE_WORKERS = int(os.getenv("DTE_WORKERS", "0"))               # 0 = os.cpu_count()
+DTE_TRAMO = int(os.getenv("DTE_TRAMO", "250"))                 # documentos por tarea del pool
+DTE_MIN_PARALELO = int(os.getenv("DTE_MIN_PARALELO", "500"))   # bajo esto se parsea en el mismo proceso
+
+
+class RegistroDTE(NamedTuple):
+    """Campos de un DTE que usa la ingesta. Tupla con slots: liviana de crear y de
+    enviar desde los procesos del pool."""
+    folio: int
+    rut_emisor: str
+    rut_receptor: str
+    tipo_dte: str
+    monto: int
+    razon_social_emisor: Optional[str]
+    razon_social_receptor: Optional[str]
+    fecha_emision: date
+    fecha_vencimiento: date
+
+
+# Etiqueta → campo, para los dos formatos que llegan: el DTE del SII (Encabezado/IdDoc,
+# Emisor, Receptor, Totales) y el formato plano de los ejemplos de uploads/ (<Factura>
+# con RUTReceptor, Monto, FechaVencimiento). Se queda la primera aparición de cada campo.
+_ETIQUETAS = {
+    "TipoDTE": "tipo_dte",
+    "Folio": "folio",
+    "FchEmis": "fecha_emision", "FechaEmision": "fecha_emision",
+    "FchVenc": "fecha_vencimiento", "FechaVencimiento": "fecha_vencimiento",
+    "RUTEmisor": "rut_emisor",
+    "RznSoc": "razon_social_emisor", "RznSocEmisor": "razon_social_emisor",
+    "RazonSocialEmisor": "razon_social_emisor",
+    "RUTRecep": "rut_receptor", "RUTReceptor": "rut_receptor",
+    "RznSocRecep": "razon_social_receptor", "RazonSocialReceptor": "razon_social_receptor",
+    "MntTotal": "monto", "Monto": "monto",
+}
+_TOTAL_CAMPOS = len(set(_ETIQUETAS.values()))
+_OBLIGATORIOS = ("folio", "rut_emisor", "rut_receptor", "monto", "fecha_emision", "fecha_vencimiento")
+_TIPO_POR_DEFECTO = "33"   # el formato plano no trae TipoDTE: son facturas electrónicas
+
+# Un DTE firmado trae la firma, el TED y el CAF DESPUÉS del encabezado: pasado este
+# tamaño se alimenta el parser por bloques y se corta apenas están todos los campos.
+_BLOQUE = 1024
+
+if _lxml is not None:
+    _FILTRO_LXML = ["{*}" + etiqueta for etiqueta in _ETIQUETAS]   # con o sin namespace del SII
+    _parsers_lxml = threading.local()                              # los parsers de lxml no son thread-safe
+
+
+def _local(etiqueta) -> Optional[str]:
+    # Quita el namespace ("{http://www.sii.cl/SiiDte}Folio"); comentarios e instrucciones
+    # de procesamiento no tienen una etiqueta de texto
+    return etiqueta.rpartition("}")[2] if isinstance(etiqueta, str) else None
+
+
+def _anotar(campos: dict, elemento) -> None:
+    campo = _ETIQUETAS.get(_local(elemento.tag))
+    if campo and campo not in campos:
+        campos[campo] = (elemento.text or "").strip()
+
+
+def _elementos_arbol(contenido: bytes):
+    if _lxml is not None:
+        parser = getattr(_parsers_lxml, "parser", None)
+        if parser is None:
+            parser = _parsers_lxml.parser = _lxml.XMLParser(resolve_entities=False, no_network=True)
+        return _lxml.fromstring(contenido, parser).iter(*_FILTRO_LXML)
+    return ET.fromstring(contenido).iter()
+
+
+def _parser_incremental():
+    if _lxml is not None:
+        return _lxml.XMLPullParser(events=("end",), tag=_FILTRO_LXML, resolve_entities=False, no_network=True)
+    return ET.XMLPullParser(events=("end",))
+
+
+def _leer_campos(contenido: bytes) -> dict:
+    """Una sola pasada por el documento; {campo: texto} con lo que encontró."""
+    campos = {}
+    if len(contenido) <= _BLOQUE:
+        for elemento in _elementos_arbol(contenido):
+            _anotar(campos, elemento)
+        return campos
+
+    parser = _parser_incremental()
+    for inicio in range(0, len(contenido), _BLOQUE):
+        parser.feed(contenido[inicio:inicio + _BLOQUE])
+        for _, elemento in parser.read_events():
+            _anotar(campos, elemento)
+        if len(campos) == _TOTAL_CAMPOS:
+            return campos   # lo que queda (firma, TED, CAF) no se parsea
+    parser.close()
+    return campos
+
+
+@lru_cache(maxsize=4096)
+def _fecha(texto: str) -> date:
+    return date.fromisoformat(texto)
+
+
+def leer_dte(contenido: bytes) -> RegistroDTE:
+    """Parsea un DTE (formato SII o plano). ValueError si falta un campo obligatorio."""
+    campos = _leer_campos(contenido)
+    faltantes = [campo for campo in _OBLIGATORIOS if not campos.get(campo)]
+    if faltantes:
+        raise ValueError(f"faltan campos en el DTE: {', '.join(faltantes)}")
+    return RegistroDTE(
+        folio=int(campos["folio"]),
+        rut_emisor=campos["rut_emisor"],
+        rut_receptor=campos["rut_receptor"],
+        tipo_dte=campos.get("tipo_dte") or _TIPO_POR_DEFECTO,
+        monto=int(campos["monto"]),
+        razon_social_emisor=campos.get("razon_social_emisor") or None,
+        razon_social_receptor=campos.get("razon_social_receptor") or None,
+        fecha_emision=_fecha(campos["fecha_emision"]),
+        fecha_vencimiento=_fecha(campos["fecha_vencimiento"]),
+    )
+
+
+def escribir_dte(registro: RegistroDTE) -> bytes:
+    """XML con el formato del SII que lee leer_dte (sin firma ni TED)."""
+    dte = ET.Element("DTE", version="1.0")
+    encabezado = ET.SubElement(ET.SubElement(dte, "Documento"), "Encabezado")
+
+    def agregar(padre, etiqueta, valor):
+        ET.SubElement(padre, etiqueta).text = str(valor) if valor is not None else ""
+
+    id_doc = ET.SubElement(encabezado, "IdDoc")
+    agregar(id_doc, "TipoDTE", registro.tipo_dte)
+    agregar(id_doc, "Folio", registro.folio)
+    agregar(id_doc, "FchEmis", registro.fecha_emision.isoformat())
+    agregar(id_doc, "FchVenc", registro.fecha_vencimiento.isoformat())
+    emisor = ET.SubElement(encabezado, "Emisor")
+    agregar(emisor, "RUTEmisor", registro.rut_emisor)
+    agregar(emisor, "RznSoc", registro.razon_social_emisor)
+    receptor = ET.SubElement(encabezado, "Receptor")
+    agregar(receptor, "RUTRecep", registro.rut_receptor)
+    agregar(receptor, "RznSocRecep", registro.razon_social_receptor)
+    agregar(ET.SubElement(encabezado, "Totales"), "MntTotal", registro.monto)
+    return ET.tostring(dte, encoding="utf-8", xml_declaration=True)
+
+
+# (nombre del documento, registro o None, mensaje de error o None)
+Resultado = Tuple[str, Optional[RegistroDTE], Optional[str]]
+
+
+def parsear_tramo(documentos: List[Tuple[str, bytes]]) -> List[Resultado]:
+    """Corre en el proceso hijo: un error en un documento no corta el tramo."""
+    resultados = []
+    for nombre, contenido in documentos:
+        try:
+            resultados.append((nombre, leer_dte(contenido), None))
+        except Exception as e:
+            resultados.append((nombre, None, f"{e.__class__.__name__}: {e}"))
+    return resultados
+
+
+# ─── Pool de procesos ───────────────────────────────────────────────────────
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0                  # procesos del pool compartido
+_pool_lock = threading.Lock()
+
+
+def obtener_pool() -> ProcessPoolExecutor:
+    """Pool compartido, creado en el primer uso. "spawn" evita heredar por fork los
+    hilos y las conexiones abiertas del servidor."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = DTE_WORKERS or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info("Pool de parseo DTE iniciado con %d procesos", _pool_workers)
+        return _pool
+
+
+def cerrar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def tramos(documentos: Iterable, tamano: Optional[int] = None) -> Iterator[list]:
+    """Listas de `tamano` documentos (DTE_TRAMO si no se indica, leído al llamar); `documentos`
+    puede ser un generador y se consume de a un tramo."""
+    tamano = tamano or DTE_TRAMO
+    iterador = iter(documentos)
+    while True:
+        tramo = list(islice(iterador, tamano))
+        if not tramo:
+            return
+        yield tramo
+
+
+def parsear_por_tramos(documentos: Iterable[Tuple[str, bytes]],
+                      pool: Optional[ProcessPoolExecutor] = None,
+                      cantidad: Optional[int] = None,
+                      tamano: Optional[int] = None,
+                      workers: Optional[int] = None) -> Iterator[List[Resultado]]:
+    """Entrega los resultados tramo a tramo y en el orden de `documentos`, para que quien
+    llama pueda ir insertando y reportando avance mientras el pool sigue parseando.
+
+    `documentos` puede ser un generador (los XML de un ZIP a medida que se descomprimen):
+    se leen tramos solo a medida que el pool los va devolviendo, con a lo más dos por
+    proceso en vuelo, así la memoria no crece con el tamaño del archivo. Bajo
+    DTE_MIN_PARALELO documentos (`cantidad`, o len(documentos) si es una lista) y sin un
+    pool explícito se parsea en este mismo hilo: no compensa mandar un lote chico a otros
+    procesos. Con un pool explícito, `workers` son sus procesos (si no se indica se toma
+    uno, y quedan a lo más dos tramos en vuelo).
+    """
+    if cantidad is None:
+        cantidad = len(documentos) if isinstance(documentos, Sized) else DTE_MIN_PARALELO
+    if pool is None and cantidad < DTE_MIN_PARALELO:
+        yield from map(parsear_tramo, tramos(documentos, tamano))
+        return
+    if pool is None:
+        pool = obtener_pool()
+        workers = _pool_workers
+    en_vuelo = 2 * (workers or 1)
+    pendientes: Deque[Future] = deque()
+    try:
+        for tramo in tramos(documentos, tamano):
+            pendientes.append(pool.submit(parsear_tramo, tramo))
+            if len(pendientes) >= en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+    finally:
+        for futuro in pendientes:   # quien llama dejó de leer (error o trabajo cortado)
+            futuro.cancel()
@@ -0,0 +1,282 @@
+# planillas.py
+# Importación masiva de facturas desde una planilla CSV o XLSX, con las mismas columnas
+# que el formulario de carga manual:
+#
+#   folio, rut_receptor, razon_social_receptor, tipo_dte, monto, fecha_emision, fecha_vencimiento
+#
+# Las filas se leen de a una (csv.reader sobre el archivo, openpyxl en modo read_only) y se
+# validan e ingieren por tramos de INGESTA_TRAMO con ingesta.ingerir: una consulta de
+# duplicados y un INSERT por tramo. Cada fila que no entra (inválida, duplicada o con
+# error de BD) va a un CSV de errores que se escribe a medida que aparecen.
+#
+#   resumen = importar(db, archivo.file, "facturas.xlsx", proveedor)
+#   resumen.errores_id  → GET /proveedor/facturas/importar/{id}/errores.csv
+import csv
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+import unicodedata
+import uuid
+import zipfile
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from estados import EstadoDTE
+from ingesta import (DUPLICADA, ERROR, INGESTA_TRAMO, LECTURA, NUEVA, RECHAZADA, VALIDACION, Etapas,
+                     ingerir)
+from metricas import FACTURAS_INGERIDAS, INGESTA_DURACION
+
+try:
+    import openpyxl   # opcional: solo para planillas .xlsx
+except ImportError:
+    openpyxl = None
+
+load_dotenv()
+
+logger = logging.getLogger("treds.planillas")
+
+PLANILLAS_DIR = os.getenv("PLANILLAS_DIR", os.path.join(tempfile.gettempdir(), "treds_planillas"))
+PLANILLA_MAX_FILAS = int(os.getenv("PLANILLA_MAX_FILAS", "200000"))
+PLANILLAS_RETENCION = int(os.getenv("PLANILLAS_RETENCION", "86400"))   # segundos que se guarda un CSV de errores
+
+COLUMNAS = ("folio", "rut_receptor", "razon_social_receptor", "tipo_dte", "monto",
+            "fecha_emision", "fecha_vencimiento")
+_OPCIONALES = {"razon_social_receptor", "tipo_dte"}
+_TIPO_POR_DEFECTO = "33"
+_RUT = re.compile(r"^\d{1,8}-[\dkK]$")
+_MILES = re.compile(r"^\d{1,3}(\.\d{3})+$")     # "1.250.000": punto como separador de miles
+_DECIMAL_CERO = re.compile(r"^(\d+)\.0+$")     # "1250.0": CSV guardado desde Excel
+_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class PlanillaInvalida(ValueError):
+    pass
+
+
+class Resumen(NamedTuple):
+    filas: int
+    insertadas: int
+    duplicadas: int
+    rechazadas: int          # filas con datos inválidos
+    errores: int             # filas que la BD no aceptó
+    errores_id: Optional[str]  # CSV con el detalle por fila (None si no hubo problemas)
+
+
+# ─── Lectura ────────────────────────────────────────────────────────────────
+def _normalizar(encabezado) -> str:
+    # "Fecha Emisión" → "fecha_emision"
+    texto = unicodedata.normalize("NFKD", str(encabezado or "")).encode("ascii", "ignore").decode()
+    return texto.strip().lower().replace(" ", "_")
+
+
+def _filas_csv(flujo: BinaryIO) -> Iterator[list]:
+    texto = io.TextIOWrapper(flujo, encoding="utf-8-sig", newline="")
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    try:
+        yield from csv.reader(texto, dialecto)
+    finally:
+        texto.detach()   # el flujo es del request: no cerrarlo junto con el wrapper
+
+
+def _filas_xlsx(flujo: BinaryIO) -> Iterator[tuple]:
+    if openpyxl is None:
+        raise PlanillaInvalida("Para importar .xlsx hay que instalar openpyxl (o subir la planilla como CSV).")
+    libro = openpyxl.load_workbook(flujo, read_only=True, data_only=True)
+    try:
+        yield from libro.worksheets[0].iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(flujo: BinaryIO, nombre: str) -> Iterator[Tuple[int, Dict[str, object]]]:
+    """(número de fila en la planilla, {columna: valor}) por cada fila con datos."""
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension == ".csv":
+        filas = _filas_csv(flujo)
+    elif extension == ".xlsx":
+        filas = _filas_xlsx(flujo)
+    else:
+        raise PlanillaInvalida("Solo se permiten planillas CSV o XLSX.")
+
+    encabezado = [_normalizar(c) for c in next(filas, [])]
+    faltantes = [c for c in COLUMNAS if c not in encabezado and c not in _OPCIONALES]
+    if faltantes:
+        raise PlanillaInvalida(f"Faltan columnas en la planilla: {', '.join(faltantes)}")
+    posiciones = {c: encabezado.index(c) for c in COLUMNAS if c in encabezado}
+    for numero, fila in enumerate(filas, start=2):
+        if not any(v not in (None, "") for v in fila):
+            continue
+        yield numero, {c: (fila[i] if i < len(fila) else None) for c, i in posiciones.items()}
+
+
+# ─── Validación ─────────────────────────────────────────────────────────────
+def _texto(valor) -> str:
+    return "" if valor is None else str(valor).strip()
+
+
+def _entero(valor, campo: str) -> int:
+    if isinstance(valor, float) and valor.is_integer():   # XLSX entrega los números como float
+        valor = int(valor)
+    if not isinstance(valor, int):
+        texto = _texto(valor)
+        decimal_cero = _DECIMAL_CERO.match(texto)
+        if _MILES.match(texto):
+            texto = texto.replace(".", "")
+        elif decimal_cero:
+            texto = decimal_cero.group(1)
+        try:
+            valor = int(texto)   # cualquier otro decimal ("1250.5", "1.25") no es un entero
+        except ValueError:
+            raise ValueError(f"{campo} no es un número entero: {_texto(valor)!r}")
+    if valor <= 0:
+        raise ValueError(f"{campo} debe ser mayor que cero")
+    return valor
+
+
+def _fecha(valor, campo: str) -> date:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = _texto(valor)
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"{campo} no es una fecha (aaaa-mm-dd o dd/mm/aaaa): {texto!r}")
+
+
+def validar(valores: Dict[str, object], proveedor) -> dict:
+    """Fila de la planilla → dict con las columnas de FacturaDB. ValueError si no sirve."""
+    rut_receptor = _texto(valores.get("rut_receptor")).replace(".", "").upper()
+    if not _RUT.match(rut_receptor):
+        raise ValueError(f"rut_receptor inválido: {rut_receptor!r} (formato 12345678-9)")
+    fecha_emision = _fecha(valores.get("fecha_emision"), "fecha_emision")
+    fecha_vencimiento = _fecha(valores.get("fecha_vencimiento"), "fecha_vencimiento")
+    if fecha_vencimiento < fecha_emision:
+        raise ValueError("fecha_vencimiento es anterior a fecha_emision")
+    return dict(
+        rut_emisor=proveedor.rut,
+        razon_social_emisor=proveedor.nombre,
+        rut_receptor=rut_receptor,
+        razon_social_receptor=_texto(valores.get("razon_social_receptor")) or None,
+        tipo_dte=_texto(valores.get("tipo_dte")).removesuffix(".0") or _TIPO_POR_DEFECTO,
+        folio=_entero(valores.get("folio"), "folio"),
+        monto=_entero(valores.get("monto"), "monto"),
+        fecha_emision=fecha_emision,
+        fecha_vencimiento=fecha_vencimiento,
+        fecha_vencimiento_original=fecha_vencimiento,
+        estado_dte=EstadoDTE.CARGADA,
+        confirming_solicitado=False,
+        origen_confirmacion="Proveedor",
+        proveedor_id=proveedor.id,
+    )
+
+
+# ─── Importación ────────────────────────────────────────────────────────────
+def ruta_errores(errores_id: str, proveedor_id: int) -> Optional[str]:
+    """Ruta del CSV de errores de una importación del proveedor, o None si no existe."""
+    if not _ID.fullmatch(errores_id):
+        return None
+    ruta = os.path.join(PLANILLAS_DIR, str(proveedor_id), f"{errores_id}.csv")
+    return ruta if os.path.exists(ruta) else None
+
+
+class _ArchivoErrores:
+    """CSV de errores por fila; el archivo se crea con el primer error."""
+
+    def __init__(self, proveedor_id: int):
+        self.id = uuid.uuid4().hex
+        self.carpeta = os.path.join(PLANILLAS_DIR, str(proveedor_id))
+        self._archivo = None
+        self._escritor = None
+
+    def _purgar(self) -> None:
+        limite = time.time() - PLANILLAS_RETENCION
+        for nombre in os.listdir(self.carpeta):
+            ruta = os.path.join(self.carpeta, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                continue
+
+    def agregar(self, numero: int, folio, motivo: str) -> None:
+        if self._escritor is None:
+            os.makedirs(self.carpeta, exist_ok=True)
+            self._purgar()
+            self._archivo = open(os.path.join(self.carpeta, f"{self.id}.csv"), "w", newline="", encoding="utf-8")
+            self._escritor = csv.writer(self._archivo)
+            self._escritor.writerow(["fila", "folio", "error"])
+        self._escritor.writerow([numero, _texto(folio), motivo])
+
+    def cerrar(self) -> Optional[str]:
+        if self._archivo is None:
+            return None
+        self._archivo.close()
+        return self.id
+
+
+def importar(db: Session, flujo: BinaryIO, nombre: str, proveedor, tramo: int = INGESTA_TRAMO) -> Resumen:
+    """Valida e ingiere la planilla por tramos. PlanillaInvalida si el archivo no se puede
+    leer (formato, columnas); los problemas de cada fila van al CSV de errores."""
+    inicio = time.perf_counter()
+    errores = _ArchivoErrores(proveedor.id)
+    conteo = {NUEVA: 0, DUPLICADA: 0, RECHAZADA: 0, ERROR: 0}
+    total = 0
+    etapas = Etapas()
+
+    def ingerir_tramo(filas: List[dict], numeros: List[int]) -> None:
+        for r in ingerir(db, filas, origen="planilla", etapas=etapas):
+            conteo[r.resultado] += 1
+            if r.resultado != NUEVA:
+                errores.agregar(numeros[r.indice], r.folio, r.detalle)
+
+    try:
+        filas, numeros = [], []
+        lector = leer_filas(flujo, nombre)
+        while True:
+            with etapas.medir(LECTURA):
+                numero, valores = next(lector, (None, None))
+            if numero is None:
+                break
+            if total == PLANILLA_MAX_FILAS:
+                errores.agregar(numero, None, f"Se alcanzó el máximo de {PLANILLA_MAX_FILAS:,} filas; "
+                                              "desde aquí no se importó nada")
+                break
+            total += 1
+            with etapas.medir(VALIDACION):
+                try:
+                    filas.append(validar(valores, proveedor))
+                    numeros.append(numero)
+                except ValueError as e:
+                    conteo[RECHAZADA] += 1
+                    errores.agregar(numero, valores.get("folio"), str(e))
+            if len(filas) >= tramo:
+                ingerir_tramo(filas, numeros)
+                filas, numeros = [], []
+        if filas:
+            ingerir_tramo(filas, numeros)
+    except (csv.Error, UnicodeDecodeError, zipfile.BadZipFile, KeyError, OSError) as e:
+        # Archivo que no es un CSV/XLSX legible (zip corrupto, codificación, etc.)
+        raise PlanillaInvalida(f"No se pudo leer la planilla: {e.__class__.__name__}: {e}")
+    finally:
+        errores_id = errores.cerrar()
+        if conteo[RECHAZADA]:
+            FACTURAS_INGERIDAS.inc(conteo[RECHAZADA], origen="planilla", resultado=RECHAZADA)
+        INGESTA_DURACION.observar(time.perf_counter() - inicio, origen="planilla")
+        etapas.publicar("planilla")
+
+    return Resumen(total, conteo[NUEVA], conteo[DUPLICADA], conteo[RECHAZADA], conteo[ERROR], errores_id)
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
-from database import SessionLocal
+from database import get_db
 from models import (
     FacturaDB,
     OfertaFinanciamiento,
@@ -15,15 +15,6 @@ from models import (
 
 router = APIRouter()
 
-# ────────────────────────────── DB dependency ──────────────────────────────
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ────────────────────────────── Hard reset endpoint ──────────────────────────────
 # ⚠️ Este endpoint borra toda la información. Proteger con un chequeo mínimo.
 
@@ -4,31 +4,23 @@ from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
-from database import SessionLocal
+from database import get_db
+from dependencias import financiador_actual
 from models import CondicionesPorPagador, Financiador
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
-# ────────────────────────────── DB Dependency ──────────────────────────────
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ─────────────────────── Ver condiciones por financiador ───────────────────────
 @router.get("/condiciones")
-def ver_condiciones(request: Request, db: Session = Depends(get_db)):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse(url="/financiador/login", status_code=303)
-
-    financiador = db.query(Financiador).get(financiador_id)
+def ver_condiciones(
+    request: Request,
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
+):
     condiciones = (
         db.query(CondicionesPorPagador)
-        .filter_by(financiador_id=financiador_id)
+        .filter_by(financiador_id=financiador.id)
         .all()
     )
 
@@ -58,21 +50,16 @@ def guardar_condicion(
     spread: float = Form(...),
     dias_anticipacion: int = Form(...),
     comisiones: float = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
 ):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse(url="/financiador/login", status_code=303)
-
-    financiador = db.query(Financiador).get(financiador_id)
-    
     nueva = CondicionesPorPagador(
         rut_pagador=rut_pagador,
         nombre_pagador=nombre_pagador,
         spread=spread,
         dias_anticipacion=dias_anticipacion,
         comisiones=comisiones,
-        financiador_id=financiador_id,
+        financiador_id=financiador.id,
         nombre_financiador=financiador.nombre
     )
     db.add(nueva)
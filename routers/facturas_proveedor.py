@@ -1,23 +1,19 @@
-from fastapi import APIRouter, Request, Form, Depends
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Request, Form, Depends, UploadFile, HTTPException
+from fastapi.responses import RedirectResponse, JSONResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from datetime import date
 
-from database import SessionLocal
+from database import get_db
+from dependencias import proveedor_actual
 from models import FacturaDB, Proveedor
+from estados import EstadoDTE
+from metricas import SUBIDAS, SUBIDAS_BYTES, tipo_subida
+import planillas
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
-# DB dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Ver formulario + facturas ya cargadas
 @router.get("/facturas")
 def ver_facturas_proveedor(request: Request, db: Session = Depends(get_db)):
@@ -42,15 +38,10 @@ def cargar_factura(
     monto: int = Form(...),
     fecha_emision: date = Form(...),
     fecha_vencimiento: date = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
 ):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse(url="/proveedor/login", status_code=303)
-
-    proveedor = db.query(Proveedor).filter(Proveedor.id == proveedor_id).first()
-    if not proveedor:
-        return RedirectResponse(url="/proveedor/login", status_code=303)
+    proveedor_id = proveedor.id
 
     # 🚩 Validar si ya existe una factura con ese folio y rut_emisor
     existe = db.query(FacturaDB).filter_by(
@@ -76,10 +67,55 @@ def cargar_factura(
         monto=monto,
         fecha_emision=fecha_emision,
         fecha_vencimiento=fecha_vencimiento,
-        estado_dte="Cargada",
+        estado_dte=EstadoDTE.CARGADA,
         proveedor_id=proveedor_id
     )
     db.add(nueva_factura)
     db.commit()
     return RedirectResponse(url="/proveedor/facturas", status_code=303)
 
+
+# 📑 Importación masiva desde planilla (CSV / XLSX), ver planillas.py
+@router.post("/facturas/importar")
+def importar_planilla(
+    request: Request,
+    archivo: UploadFile = Form(...),
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    tipo = tipo_subida(archivo.filename)
+    SUBIDAS.inc(tipo=tipo)
+    if archivo.size is not None:
+        SUBIDAS_BYTES.inc(archivo.size, tipo=tipo)
+
+    try:
+        resumen = planillas.importar(db, archivo.file, archivo.filename, proveedor)
+    except planillas.PlanillaInvalida as e:
+        if "application/json" in request.headers.get("accept", ""):
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        return templates.TemplateResponse("facturas.html", {
+            "request": request,
+            "facturas": db.query(FacturaDB).filter(FacturaDB.proveedor_id == proveedor.id).all(),
+            "proveedor_nombre": proveedor.nombre,
+            "mensaje": f"⚠️ {e}"
+        })
+
+    errores_url = f"/proveedor/facturas/importar/{resumen.errores_id}/errores.csv" if resumen.errores_id else None
+    if "application/json" in request.headers.get("accept", ""):
+        return {**resumen._asdict(), "errores_url": errores_url}
+    return templates.TemplateResponse("facturas.html", {
+        "request": request,
+        "facturas": db.query(FacturaDB).filter(FacturaDB.proveedor_id == proveedor.id).all(),
+        "proveedor_nombre": proveedor.nombre,
+        "mensaje": (f"📑 {archivo.filename}: {resumen.filas} filas, {resumen.insertadas} insertadas, "
+                    f"{resumen.duplicadas} duplicadas, {resumen.rechazadas} inválidas, {resumen.errores} con error."),
+        "errores_url": errores_url
+    })
+
+
+@router.get("/facturas/importar/{errores_id}/errores.csv")
+def descargar_errores_planilla(errores_id: str, proveedor: Proveedor = Depends(proveedor_actual)):
+    ruta = planillas.ruta_errores(errores_id, proveedor.id)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Archivo de errores no encontrado o vencido")
+    return FileResponse(ruta, media_type="text/csv", filename=f"errores_{errores_id}.csv")
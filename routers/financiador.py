@@ -3,7 +3,9 @@ from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi import Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from datetime import date, datetime          # ← date ya estaba, datetime seguía
 import os
@@ -11,27 +13,16 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from database import SessionLocal
+from database import get_db, get_async_db
+from dependencias import financiador_actual, financiador_admin, financiador_actual_async
 from models import Financiador, FacturaDB, OfertaFinanciamiento, Fondo
+from estados import EstadoDTE
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 templates_middle = Jinja2Templates(directory="templates/middle")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# ──────────────────────────────── DB dependency ────────────────────────────────
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# ──────────────────────────────── Helper ────────────────────────────────
-def _solo_admin(fin: Financiador):
-    if not fin.es_admin:
-        raise HTTPException(status_code=403, detail="Solo administradores")
-
 # ──────────────────────────────── GET: Registro Financiador ────────────────────────────────
 @router.get("/registro")
 def mostrar_formulario_registro(request: Request, db: Session = Depends(get_db)):
@@ -153,28 +144,21 @@ def login_financiador(
     return RedirectResponse("/financiador/marketplace", 303)
 
 @router.get("/inicio")
-def inicio_financiador(request: Request, db: Session = Depends(get_db)):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse(url="/financiador/login", status_code=303)
-
-    financiador = db.query(Financiador).get(financiador_id)
-    nombre = financiador.nombre if financiador else "Desconocido"
-
+def inicio_financiador(request: Request, financiador: Financiador = Depends(financiador_actual)):
     return templates.TemplateResponse("inicio_financiador.html", {
         "request": request,
-        "financiador_id": financiador_id,
-        "financiador_nombre": nombre
+        "financiador_id": financiador.id,
+        "financiador_nombre": financiador.nombre
     })
 
 # ──────────────────────────────── Marketplace ────────────────────────────────
 @router.get("/marketplace")
-def ver_marketplace(request: Request, db: Session = Depends(get_db)):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse("/financiador/login", 303)
-
-    financiador = db.query(Financiador).get(financiador_id)
+async def ver_marketplace(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    financiador: Financiador = Depends(financiador_actual_async)
+):
+    financiador_id = financiador.id
     hoy = date.today()
 
     # ── Control de costo-de-fondos ───────────────────────────────────────────
@@ -187,52 +171,46 @@ def ver_marketplace(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse("/financiador/costo-fondos", 303)
 
     # ── 1) Todavía disponibles ──────────────────────────────────────────────
-    disponibles = (
-        db.query(FacturaDB)
-        .filter(
-            FacturaDB.estado_dte == "Confirming solicitado",
+    disponibles = (await db.scalars(
+        select(FacturaDB)
+        .where(
+            FacturaDB.estado_dte == EstadoDTE.CONFIRMING_SOLICITADO,
             FacturaDB.financiador_adjudicado.is_(None),
         )
-        .all()
-    )
+    )).all()
 
     # ── 2) Ya adjudicadas por ESTE financiador ──────────────────────────────
-    mias = (
-        db.query(FacturaDB)
-        .filter(
-            FacturaDB.financiador_adjudicado == str(financiador_id),
-            FacturaDB.estado_dte == "Confirming adjudicado",
+    mias = (await db.scalars(
+        select(FacturaDB)
+        .where(
+            FacturaDB.financiador_adjudicado == financiador_id,
+            FacturaDB.estado_dte == EstadoDTE.CONFIRMING_ADJUDICADO,
         )
-        .all()
-    )
+    )).all()
 
     # ── 3) Adjudicadas por OTRO financiador ────────────────────────────────
-    otras = (
-        db.query(FacturaDB)
-        .filter(
-            FacturaDB.estado_dte == "Confirming adjudicado",
-            FacturaDB.financiador_adjudicado != str(financiador_id),
+    otras = (await db.scalars(
+        select(FacturaDB)
+        .where(
+            FacturaDB.estado_dte == EstadoDTE.CONFIRMING_ADJUDICADO,
+            FacturaDB.financiador_adjudicado != financiador_id,
         )
-        .all()
-    )
-# Mapear facturas que ya tienen oferta de este fondo (aunque sea otro usuario)
-    ofertas_ids = {
-        o.factura_id
-        for o in db.query(OfertaFinanciamiento)
-        .join(Financiador)
-        .filter(Financiador.fondo_id == financiador.fondo_id)
-        .all()
-    }
+    )).all()
+
+# Ofertas de este fondo (aunque sea otro usuario), con su factura en el mismo JOIN
+    ofertas_fondo = (await db.scalars(
+        select(OfertaFinanciamiento)
+        .join(OfertaFinanciamiento.financiador)
+        .join(OfertaFinanciamiento.factura)
+        .where(Financiador.fondo_id == financiador.fondo_id)
+        .options(contains_eager(OfertaFinanciamiento.factura))
+    )).all()
+
+# Mapear facturas que ya tienen oferta de este fondo
+    ofertas_ids = {o.factura_id for o in ofertas_fondo}
 
 # Mapear ofertas propias por folio para mostrar botón "Ver oferta"
-    ofertas_propias = {
-        o.factura.folio: o
-        for o in db.query(OfertaFinanciamiento)
-        .join(Financiador)
-        .join(FacturaDB)
-        .filter(Financiador.fondo_id == financiador.fondo_id)
-        .all()
-    }
+    ofertas_propias = {o.factura.folio: o for o in ofertas_fondo}
 
 
     return templates.TemplateResponse(
@@ -250,14 +228,11 @@ def ver_marketplace(request: Request, db: Session = Depends(get_db)):
 
 # ──────────────────────────────── Administración ────────────────────────────────
 @router.get("/usuarios")
-def listar_usuarios(request: Request, db: Session = Depends(get_db)):
-    fid = request.session.get("financiador_id")
-    if not fid:
-        return RedirectResponse("/financiador/login", 303)
-
-    admin = db.query(Financiador).get(fid)
-    _solo_admin(admin)
-
+def listar_usuarios(
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: Financiador = Depends(financiador_admin)
+):
     # ✅ Solo usuarios del mismo fondo
     usuarios = db.query(Financiador).filter_by(fondo_id=admin.fondo_id).all()
 
@@ -269,14 +244,12 @@ def listar_usuarios(request: Request, db: Session = Depends(get_db)):
 
 
 @router.post("/usuarios/toggle-admin/{user_id}")
-def toggle_admin(user_id: int, request: Request, db: Session = Depends(get_db)):
-    fid = request.session.get("financiador_id")
-    if not fid:
-        return RedirectResponse("/financiador/login", 303)
-
-    admin = db.query(Financiador).get(fid)
-    _solo_admin(admin)
-
+def toggle_admin(
+    user_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: Financiador = Depends(financiador_admin)
+):
     usuario = db.query(Financiador).get(user_id)
 
     # ⛔ Seguridad: no permitir acciones sobre usuarios de otros fondos
@@ -321,14 +294,7 @@ def crear_usuario(
 
 # ──────────────────────────────── Costo de fondos ────────────────────────────────
 @router.get("/costo-fondos")
-def form_costo_fondos(request: Request, db: Session = Depends(get_db)):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse("/financiador/login", 303)
-
-    financiador = db.query(Financiador).get(financiador_id)
-    _solo_admin(financiador)
-
+def form_costo_fondos(request: Request, financiador: Financiador = Depends(financiador_admin)):
     return templates.TemplateResponse("costo_fondos.html", {
         "request": request,
         "costo_fondos": financiador.costo_fondos_mensual,
@@ -341,16 +307,9 @@ def form_costo_fondos(request: Request, db: Session = Depends(get_db)):
 def guardar_costo_fondos(
     request: Request,
     nuevo_costo_mensual: float = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
 ):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse(url="/financiador/login", status_code=303)
-
-    financiador = db.query(Financiador).get(financiador_id)
-    if not financiador:
-        return RedirectResponse(url="/financiador/login", status_code=303)
-
     # Validación: el costo de fondos no puede ser cero o negativo
     if nuevo_costo_mensual <= 0:
         return templates.TemplateResponse("costo_fondos.html", {
@@ -372,12 +331,12 @@ def guardar_costo_fondos(
 
 # ──────────────────────────────── Ofertas ────────────────────────────────
 @router.get("/ofertar/{folio}")
-def mostrar_formulario_oferta(folio: int, request: Request, db: Session = Depends(get_db)):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse("/financiador/login", 303)
-
-    financiador = db.query(Financiador).get(financiador_id)
+def mostrar_formulario_oferta(
+    folio: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
+):
     factura = db.query(FacturaDB).filter_by(folio=folio).first()
     if not factura:
         return templates.TemplateResponse("error.html", {"request": request, "mensaje": "Factura no encontrada"})
@@ -397,17 +356,16 @@ def registrar_oferta(
     tasa_interes: float = Form(...),
     comision_flat: float = Form(...),
     dias_anticipacion: int = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
 ):
-    financiador_id = request.session.get("financiador_id")
-    if not financiador_id:
-        return RedirectResponse("/financiador/login", 303)
+    financiador_id = financiador.id
 
     factura = db.query(FacturaDB).filter_by(folio=folio).first()
     if not factura:
         return templates.TemplateResponse("error.html", {"request": request, "mensaje": "Factura no encontrada"})
-
-    financiador = db.query(Financiador).get(financiador_id)
+    if factura.estado_dte != EstadoDTE.CONFIRMING_SOLICITADO:
+        return templates.TemplateResponse("error.html", {"request": request, "mensaje": "La factura ya no recibe ofertas"})
 
     monto = factura.monto
     tasa_total = tasa_interes + financiador.costo_fondos_mensual
@@ -434,10 +392,11 @@ def actualizar_oferta(
     request: Request,
     tasa_interes: float = Form(...),
     comision_flat: float = Form(0),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
 ):
     oferta = db.query(OfertaFinanciamiento).get(oferta_id)
-    if not oferta or oferta.financiador_id != request.session.get("financiador_id"):
+    if not oferta or oferta.financiador_id != financiador.id:
         raise HTTPException(status_code=403)
 
     oferta.tasa_interes = tasa_interes
@@ -447,9 +406,14 @@ def actualizar_oferta(
     return RedirectResponse(f"/financiador/ver-oferta/{oferta_id}", 303)
 
 @router.get("/ver-oferta/{oferta_id}")
-def ver_oferta(oferta_id: int, request: Request, db: Session = Depends(get_db)):
+def ver_oferta(
+    oferta_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    financiador: Financiador = Depends(financiador_actual)
+):
     oferta = db.query(OfertaFinanciamiento).get(oferta_id)
-    if not oferta or oferta.financiador_id != request.session.get("financiador_id"):
+    if not oferta or oferta.financiador_id != financiador.id:
         raise HTTPException(status_code=403)
 
     return templates.TemplateResponse("ver_oferta.html", {
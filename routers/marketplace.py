@@ -1,30 +1,23 @@
 # routers/marketplace.py
 from fastapi import APIRouter, Request, Depends
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import SessionLocal
+from database import get_async_db
 from models import FacturaDB
+from estados import EstadoDTE
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
-# ────────────────────────────── DB dependency ──────────────────────────────
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ──────────────────────── Marketplace General Público ────────────────────────
 @router.get("/marketplace-general")
-def ver_marketplace_general(request: Request, db: Session = Depends(get_db)):
-    facturas = (
-        db.query(FacturaDB)
-        .filter(FacturaDB.estado_dte == "Confirming solicitado")
-        .all()
-    )
+async def ver_marketplace_general(request: Request, db: AsyncSession = Depends(get_async_db)):
+    facturas = (await db.scalars(
+        select(FacturaDB)
+        .where(FacturaDB.estado_dte == EstadoDTE.CONFIRMING_SOLICITADO)
+    )).all()
 
     return templates.TemplateResponse(
         "marketplace_general.html",
@@ -2,12 +2,17 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 
-from database import SessionLocal
+from database import get_db, get_async_db
+from dependencias import pagador_actual, pagador_actual_async
 from models import Pagador, FacturaDB
+from estados import EstadoDTE, puede_transicionar, transicionar, transicionar_lote
 from datetime import datetime
+from typing import List
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -15,15 +20,6 @@ templates_middle = Jinja2Templates(directory="templates/middle")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-# ───────────── DB Dependency ─────────────
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ───────────── Registro / Login ─────────────
 @router.get("/registro")
 def mostrar_formulario_registro(request: Request):
@@ -70,20 +66,13 @@ def login_pagador(
 
 # ───────────── Inicio ─────────────
 @router.get("/inicio")
-def inicio_pagador(request: Request, db: Session = Depends(get_db)):
-    pagador_id = request.session.get("pagador_id")
-    if not pagador_id:
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
-    pagador = db.query(Pagador).get(pagador_id)
-    pagador_nombre = pagador.nombre if pagador else ""
-
+def inicio_pagador(request: Request, pagador: Pagador = Depends(pagador_actual)):
     return templates.TemplateResponse(
         "inicio_pagador.html",
         {
             "request": request,
-            "pagador_id": pagador_id,
-            "pagador_nombre": pagador_nombre
+            "pagador_id": pagador.id,
+            "pagador_nombre": pagador.nombre
         }
     )
 
@@ -97,30 +86,25 @@ def logout_pagador(request: Request):
 
 # ───────────── Ver Facturas ─────────────
 @router.get("/facturas")
-def ver_facturas_pagador(request: Request, db: Session = Depends(get_db)):
-    pagador_id = request.session.get("pagador_id")
-    if not pagador_id:
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
-    pagador = db.query(Pagador).get(pagador_id)
-    if not pagador:
-        request.session.clear()
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
-    facturas_pendientes = db.query(FacturaDB).filter(
+async def ver_facturas_pagador(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    pagador: Pagador = Depends(pagador_actual_async)
+):
+    facturas_pendientes = (await db.scalars(select(FacturaDB).where(
         FacturaDB.rut_receptor == pagador.rut,
-        FacturaDB.estado_dte == "Confirmación solicitada al pagador"
-    ).all()
+        FacturaDB.estado_dte == EstadoDTE.CONFIRMACION_SOLICITADA
+    ))).all()
 
-    facturas_gestionadas = db.query(FacturaDB).filter(
+    facturas_gestionadas = (await db.scalars(select(FacturaDB).options(joinedload(FacturaDB.financiador)).where(
         FacturaDB.rut_receptor == pagador.rut,
         FacturaDB.estado_dte.in_([
-            "Confirmada por pagador",
-            "Rechazada por pagador",
-            "Enviado a confirming",
-            "Confirming adjudicado"
+            EstadoDTE.CONFIRMADA,
+            EstadoDTE.RECHAZADA,
+            EstadoDTE.ENVIADO_A_CONFIRMING,
+            EstadoDTE.CONFIRMING_ADJUDICADO
         ])
-    ).all()
+    ))).all()
 
     return templates.TemplateResponse(
         "facturas_pagador.html",
@@ -139,14 +123,11 @@ def editar_vencimiento_pagador(
     folio: int,
     request: Request,
     nueva_fecha_vencimiento: str = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    pagador: Pagador = Depends(pagador_actual)
 ):
-    pagador_id = request.session.get("pagador_id")
-    if not pagador_id:
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
     factura = db.query(FacturaDB).filter(FacturaDB.folio == folio).first()
-    if factura and factura.estado_dte == "Confirmación solicitada al pagador":
+    if factura and factura.estado_dte == EstadoDTE.CONFIRMACION_SOLICITADA:
         factura.fecha_vencimiento = datetime.strptime(nueva_fecha_vencimiento, "%Y-%m-%d").date()
         db.commit()
 
@@ -157,33 +138,45 @@ def editar_vencimiento_pagador(
 def confirmar_factura(
     folio: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    pagador: Pagador = Depends(pagador_actual)
 ):
-    pagador_id = request.session.get("pagador_id")
-    if not pagador_id:
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
     factura = db.query(FacturaDB).filter(FacturaDB.folio == folio).first()
-    if factura and factura.estado_dte != "Confirmada por pagador":
-        factura.estado_dte = "Confirmada por pagador"
+    if factura and puede_transicionar(factura.estado_dte, EstadoDTE.CONFIRMADA):
+        transicionar(factura, EstadoDTE.CONFIRMADA)
         db.commit()
 
     return RedirectResponse(url="/pagador/facturas", status_code=303)
 
 
+@router.post("/confirmar-facturas")
+def confirmar_facturas(
+    request: Request,
+    folios: List[int] = Form(...),
+    db: Session = Depends(get_db),
+    pagador: Pagador = Depends(pagador_actual)
+):
+    # Un solo UPDATE para todas las seleccionadas (solo las dirigidas a este pagador)
+    confirmadas = transicionar_lote(
+        db, EstadoDTE.CONFIRMADA,
+        FacturaDB.folio.in_(folios),
+        FacturaDB.rut_receptor == pagador.rut,
+    )
+    db.commit()
+
+    return RedirectResponse(url=f"/pagador/facturas?msg=confirmadas_{confirmadas}", status_code=303)
+
+
 @router.post("/rechazar-factura/{folio}")
 def rechazar_factura(
     folio: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    pagador: Pagador = Depends(pagador_actual)
 ):
-    pagador_id = request.session.get("pagador_id")
-    if not pagador_id:
-        return RedirectResponse(url="/pagador/login", status_code=303)
-
     factura = db.query(FacturaDB).filter(FacturaDB.folio == folio).first()
-    if factura:
-        factura.estado_dte = "Rechazada por pagador"
+    if factura and puede_transicionar(factura.estado_dte, EstadoDTE.RECHAZADA):
+        transicionar(factura, EstadoDTE.RECHAZADA)
         db.commit()
 
     return RedirectResponse(url="/pagador/facturas", status_code=303)
\ No newline at end of file
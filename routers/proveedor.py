@@ -1,29 +1,66 @@
 from fastapi import APIRouter, Request, Form, Depends, UploadFile, status
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
-from database import SessionLocal
+from database import get_db, get_async_db
+from dependencias import proveedor_actual, proveedor_actual_async
 from models import Proveedor, FacturaDB, OfertaFinanciamiento, Financiador, Pagador
+from estados import EstadoDTE, puede_transicionar, transicionar
+from metricas import SUBIDAS, SUBIDAS_BYTES, INGESTA_ETAPA, tipo_subida
+from ingesta import procesar_subida_xml, RECEPCION
+from trabajos import encolar, obtener, ColaLlena, TERMINALES
+import almacen, importacion_sii, subidas
 from datetime import datetime
-import os, zipfile, xml.etree.ElementTree as ET
+import asyncio, json, logging, os, time, zipfile
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 templates_middle = Jinja2Templates(directory="templates/middle")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger("treds.proveedor")
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+TRABAJOS_SSE_INTERVALO = 0.5   # segundos entre revisiones del avance en /trabajos/{id}/eventos
+TRABAJOS_SSE_LATIDO = 15       # segundos sin cambios antes de mandar un comentario keep-alive
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _tamano_subida(archivo: UploadFile) -> int:
+    if archivo.size is not None:
+        return archivo.size
+    archivo.file.seek(0, os.SEEK_END)
+    tamano = archivo.file.tell()
+    archivo.file.seek(0)
+    return tamano
+
+
+def _quiere_json(request: Request) -> bool:
+    return "application/json" in request.headers.get("accept", "")
+
+
+def _trabajo_aceptado(trabajo) -> JSONResponse:
+    return JSONResponse(
+        {"trabajo": trabajo.id, "estado": trabajo.estado,
+         "url": f"/proveedor/trabajos/{trabajo.id}", "eventos": f"/proveedor/trabajos/{trabajo.id}/eventos"},
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+def _guardar_subida(archivo: UploadFile, sufijo: str):
+    """Copia el spool de Starlette (que se borra al responder) al almacén por contenido,
+    calculando el sha256 en la misma pasada; devuelve (ruta, sha256)."""
+    inicio = time.perf_counter()
+    archivo.file.seek(0)
+    ruta, sha256 = almacen.copiar_a_temporal(archivo.file, sufijo)
+    ruta = almacen.guardar(ruta, sha256)
+    INGESTA_ETAPA.observar(time.perf_counter() - inicio, origen="xml", etapa=RECEPCION)
+    return ruta, sha256
 
 
 # ─────────────────────────  Registro / Login  ──────────────────────────
@@ -81,60 +118,54 @@ def logout_proveedor(request: Request):
 
 # ─────────────────────────  Inicio  ──────────────────────────
 @router.get("/inicio")
-def inicio_proveedor(request: Request, db: Session = Depends(get_db)):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse(url="/proveedor/login", status_code=303)
-
-    proveedor = db.query(Proveedor).get(proveedor_id)
-    
-    proveedor_nombre = proveedor.nombre if proveedor else "Desconocido"
-
+def inicio_proveedor(request: Request, proveedor: Proveedor = Depends(proveedor_actual)):
     return templates.TemplateResponse(
         "inicio_proveedor.html",
         {
             "request": request,
-            "proveedor_id": proveedor_id,
-            "proveedor_nombre": proveedor_nombre
+            "proveedor_id": proveedor.id,
+            "proveedor_nombre": proveedor.nombre
         }
     )
 
 
 # ─────────────────────────  Facturas  ──────────────────────────
 @router.get("/facturas")
-def ver_facturas_proveedor(request: Request, db: Session = Depends(get_db)):
-    prov_id = request.session.get("proveedor_id")
-    if not prov_id:
-        return RedirectResponse("/proveedor/login", 303)
-
-    proveedor = db.query(Proveedor).get(prov_id)
-    if not proveedor:
-        return RedirectResponse("/proveedor/login", 303)
+async def ver_facturas_proveedor(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    proveedor: Proveedor = Depends(proveedor_actual_async)
+):
+    prov_id = proveedor.id
     nombre = proveedor.nombre
 
-    # traemos facturas + ofertas en una sola consulta
-    facturas = (
-    db.query(FacturaDB)
-      .options(
-          joinedload(FacturaDB.ofertas)
-          .joinedload(OfertaFinanciamiento.financiador)
-      )
-      .filter(
-          FacturaDB.proveedor_id == prov_id,
-          FacturaDB.rut_emisor   == proveedor.rut[:-2] 
-      )      # ← aquí termina filter
-      .all() # ← aquí, sobre el Query
-)
+    # traemos facturas + ofertas + financiador adjudicado sin cargas perezosas
+    facturas = (await db.scalars(
+        select(FacturaDB)
+          .options(
+              selectinload(FacturaDB.ofertas)
+              .joinedload(OfertaFinanciamiento.financiador),
+              joinedload(FacturaDB.financiador),
+          )
+          .where(
+              FacturaDB.proveedor_id == prov_id,
+              FacturaDB.rut_emisor   == proveedor.rut[:-2]
+          )
+    )).all()
 
     # dict {factura_id: [lista de ofertas]}
     ofertas_por_factura = {f.id: f.ofertas for f in facturas}
 
+    # Recién subido un XML/ZIP: la página sigue el avance del trabajo por SSE
+    trabajo = obtener(request.query_params.get("trabajo", ""), prov_id)
+
     return templates.TemplateResponse(
         "facturas.html",
         {
             "request": request,
             "facturas": facturas,
             "ofertas_por_factura": ofertas_por_factura,
+            "trabajo": trabajo.como_dict() if trabajo else None,
             "proveedor_nombre": nombre
         }
     )
@@ -144,101 +175,168 @@ def ver_facturas_proveedor(request: Request, db: Session = Depends(get_db)):
 async def subir_factura_archivo(
     request: Request,
     archivo: UploadFile = Form(...),
-    db: Session = Depends(get_db)
+    proveedor: Proveedor = Depends(proveedor_actual)
 ):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse(url="/proveedor/login", status_code=303)
-
-    proveedor = db.query(Proveedor).get(proveedor_id)
-    proveedor_nombre = proveedor.nombre if proveedor else "Desconocido"
-
-    contenido = await archivo.read()
-    if archivo.filename.endswith(".zip"):
-        with open(f"{UPLOAD_FOLDER}/temp.zip", "wb") as f:
-            f.write(contenido)
-        with zipfile.ZipFile(f"{UPLOAD_FOLDER}/temp.zip", "r") as zf:
-            zf.extractall(UPLOAD_FOLDER)
-        archivos_xml = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".xml")]
-    elif archivo.filename.endswith(".xml"):
-        with open(os.path.join(UPLOAD_FOLDER, archivo.filename), "wb") as f:
-            f.write(contenido)
-        archivos_xml = [archivo.filename]
-    else:
+    """Deja la subida en la cola de trabajos y responde al tiro: 202 con el id del trabajo
+    si el cliente pide JSON, o redirección a /proveedor/facturas?trabajo=<id>, donde la
+    página sigue el avance por SSE."""
+    tipo = tipo_subida(archivo.filename)
+    SUBIDAS.inc(tipo=tipo)
+    SUBIDAS_BYTES.inc(_tamano_subida(archivo), tipo=tipo)
+
+    mensaje = None
+    if tipo not in ("zip", "xml"):
+        mensaje = "Solo se permiten archivos XML o ZIP."
+    elif tipo == "zip" and not await run_in_threadpool(zipfile.is_zipfile, archivo.file):
+        mensaje = "El archivo ZIP está dañado o no es un ZIP válido."
+    if mensaje:
+        if _quiere_json(request):
+            return JSONResponse({"detail": mensaje}, status_code=status.HTTP_400_BAD_REQUEST)
         return templates.TemplateResponse("facturas.html", {
             "request": request,
-            "mensaje": "Solo se permiten archivos XML o ZIP.",
-            "proveedor_nombre": proveedor_nombre
+            "mensaje": mensaje,
+            "proveedor_nombre": proveedor.nombre
         })
-  
-    errores = []
-    for nombre in archivos_xml:
-        ruta = os.path.join(UPLOAD_FOLDER, nombre)
-        try:
-            tree = ET.parse(ruta)
-            root = tree.getroot()
-            folio = int(root.find(".//Folio").text)
-            rut_emisor = root.find(".//RUTEmisor").text
-            rut_receptor = root.find(".//RUTRecep").text
-
-            # Validación de consistencia con el proveedor logeado
-            if rut_emisor != proveedor.rut:
-                errores.append(f"Factura folio {folio} descartada: RUT emisor ({rut_emisor}) no coincide con proveedor logeado ({proveedor.rut})")
-                continue
-
-            duplicada = db.query(FacturaDB).filter_by(
-                rut_emisor=rut_emisor, rut_receptor=rut_receptor, folio=folio
-            ).first()
-            if duplicada:
-                errores.append(f"Factura duplicada folio {folio}")
-                continue
-
-            factura = FacturaDB(
-                rut_emisor=rut_emisor,
-                rut_receptor=rut_receptor,
-                tipo_dte=root.find(".//TipoDTE").text,
-                folio=folio,
-                monto=int(root.find(".//MntTotal").text),
-                razon_social_emisor=root.find(".//RznSoc").text,
-                razon_social_receptor=root.find(".//RznSocRecep").text,
-                fecha_emision=datetime.strptime(root.find(".//FchEmis").text, "%Y-%m-%d").date(),
-                fecha_vencimiento=datetime.strptime(root.find(".//FchVenc").text, "%Y-%m-%d").date(),
-                fecha_vencimiento_original=datetime.strptime(root.find(".//FchVenc").text, "%Y-%m-%d").date(),
-                estado_dte="Cargada",
-                confirming_solicitado=False,
-                origen_confirmacion="Proveedor",
-                proveedor_id=proveedor_id
-            )
-            db.add(factura)
-            db.commit()
-        except Exception as e:
-            errores.append(f"Error en {nombre}: {e}")
 
-    facturas = db.query(FacturaDB).filter(FacturaDB.proveedor_id == proveedor_id).all()
-    return templates.TemplateResponse(
-        "facturas.html",
-        {
-            "request": request,
-            "facturas": facturas,
-            "errores": errores or None,
-            "proveedor_nombre": proveedor_nombre
-        }
-    )
+    ruta, sha256 = await run_in_threadpool(_guardar_subida, archivo, f".{tipo}")
+    try:
+        trabajo = encolar("subida_xml", proveedor.id, archivo.filename, procesar_subida_xml,
+                          ruta, archivo.filename, sha256, proveedor.id, proveedor.rut)
+    except ColaLlena as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    if _quiere_json(request):
+        return _trabajo_aceptado(trabajo)
+    return RedirectResponse(f"/proveedor/facturas?trabajo={trabajo.id}", status_code=status.HTTP_303_SEE_OTHER)
+
+
+# ─── Subida por partes (ZIP muy grandes, reanudable; ver subidas.py) ───────
+def _cargar_subida(subida_id: str, proveedor: Proveedor):
+    try:
+        return subidas.cargar(subida_id, proveedor.id)
+    except subidas.SubidaNoEncontrada:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+
+
+@router.post("/subidas")
+def iniciar_subida(
+    nombre: str = Form(...),
+    tamano: int = Form(...),
+    sha256: str = Form(...),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    try:
+        subida = subidas.crear(proveedor.id, nombre, tamano, sha256)
+    except subidas.SubidaInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(subida.como_dict(), status_code=status.HTTP_201_CREATED)
+
+
+@router.get("/subidas/{subida_id}")
+def estado_subida(subida_id: str, proveedor: Proveedor = Depends(proveedor_actual)):
+    return _cargar_subida(subida_id, proveedor).como_dict()
+
+
+@router.put("/subidas/{subida_id}/partes/{n}")
+async def subir_parte(
+    subida_id: str,
+    n: int,
+    request: Request,
+    proveedor: Proveedor = Depends(proveedor_actual_async)
+):
+    """El cuerpo son los bytes crudos de la parte; se escriben a disco mientras llegan.
+    X-Parte-Sha256 (opcional) verifica la parte sola, para reintentarla sin rehacer todo."""
+    subida = await run_in_threadpool(_cargar_subida, subida_id, proveedor)
+    try:
+        await subidas.guardar_parte(subida, n, request.stream(), request.headers.get("x-parte-sha256"))
+    except subidas.SubidaInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"parte": n, "faltantes": (await run_in_threadpool(subida.como_dict))["faltantes"]}
+
+
+@router.post("/subidas/{subida_id}/completar")
+async def completar_subida(subida_id: str, proveedor: Proveedor = Depends(proveedor_actual_async)):
+    """Verifica el sha256 del archivo completo y lo encola en la misma ingesta de
+    POST /proveedor/facturas; responde 202 con el id del trabajo."""
+    subida = await run_in_threadpool(_cargar_subida, subida_id, proveedor)
+    inicio = time.perf_counter()
+    try:
+        ruta = await run_in_threadpool(subidas.completar, subida)
+    except subidas.SubidaInvalida as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    INGESTA_ETAPA.observar(time.perf_counter() - inicio, origen="xml", etapa=RECEPCION)
+
+    tipo = tipo_subida(subida.nombre)
+    SUBIDAS.inc(tipo=tipo)
+    SUBIDAS_BYTES.inc(subida.tamano, tipo=tipo)
+    try:
+        trabajo = encolar("subida_xml", proveedor.id, subida.nombre, procesar_subida_xml,
+                          ruta, subida.nombre, subida.sha256, proveedor.id, proveedor.rut)
+    except ColaLlena as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return _trabajo_aceptado(trabajo)
+
+
+@router.get("/trabajos/{trabajo_id}")
+def ver_trabajo(trabajo_id: str, proveedor: Proveedor = Depends(proveedor_actual)):
+    """Avance de un trabajo de ingesta: estado, contadores y, al final, los errores por archivo."""
+    trabajo = obtener(trabajo_id, proveedor.id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo.como_dict()
+
+
+@router.get("/trabajos/{trabajo_id}/eventos")
+async def eventos_trabajo(
+    trabajo_id: str,
+    request: Request,
+    proveedor: Proveedor = Depends(proveedor_actual_async)
+):
+    """Server-Sent Events con el avance del trabajo; un evento por cambio y el último
+    ("fin") cuando termina."""
+    trabajo = obtener(trabajo_id, proveedor.id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def eventos():
+        version = -1
+        ultimo_envio = time.monotonic()
+        while True:
+            if trabajo.version != version:
+                datos = trabajo.como_dict()
+                version = datos["version"]
+                evento = "fin" if datos["estado"] in TERMINALES else "avance"
+                yield f"event: {evento}\ndata: {json.dumps(datos)}\n\n"
+                ultimo_envio = time.monotonic()
+                if evento == "fin":
+                    return
+            elif time.monotonic() - ultimo_envio > TRABAJOS_SSE_LATIDO:
+                yield ": latido\n\n"
+                ultimo_envio = time.monotonic()
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(TRABAJOS_SSE_INTERVALO)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.get("/solicitar_confirmacion/folio/{folio}")
-def solicitar_confirmacion_factura_folio(folio: int, request: Request, db: Session = Depends(get_db)):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse("/proveedor/login", 303)
+def solicitar_confirmacion_factura_folio(
+    folio: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    proveedor_id = proveedor.id
 
     factura = (
         db.query(FacturaDB)
         .filter(FacturaDB.folio == folio, FacturaDB.proveedor_id == proveedor_id)
         .first()
     )
-    if factura:
-        factura.estado_dte = "Confirmación solicitada al pagador"
+    if factura and puede_transicionar(factura.estado_dte, EstadoDTE.CONFIRMACION_SOLICITADA):
+        transicionar(factura, EstadoDTE.CONFIRMACION_SOLICITADA)
         factura.confirming_solicitado = True
         factura.origen_confirmacion = "Proveedor"
         db.commit()
@@ -251,7 +349,6 @@ def solicitar_confirmacion_factura_folio(folio: int, request: Request, db: Sessi
     )
 
     ofertas_por_factura = {f.id: f.ofertas for f in facturas}
-    proveedor = db.query(Proveedor).get(proveedor_id)
 
     return templates.TemplateResponse("facturas.html", {
         "request": request,
@@ -262,15 +359,20 @@ def solicitar_confirmacion_factura_folio(folio: int, request: Request, db: Sessi
     })
 
 @router.post("/solicitar_confirming/folio/{folio}")
-def solicitar_confirming_folio(folio: int, request: Request, db: Session = Depends(get_db)):
-    proveedor_id = request.session.get("proveedor_id")
+def solicitar_confirming_folio(
+    folio: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    proveedor_id = proveedor.id
     factura = (
         db.query(FacturaDB)
         .filter(FacturaDB.folio == folio, FacturaDB.proveedor_id == proveedor_id)
         .first()
     )
-    if factura and factura.estado_dte == "Confirmada por pagador":
-        factura.estado_dte = "Confirming solicitado"
+    if factura and puede_transicionar(factura.estado_dte, EstadoDTE.CONFIRMING_SOLICITADO):
+        transicionar(factura, EstadoDTE.CONFIRMING_SOLICITADO)
         factura.confirming_solicitado = True
         db.commit()
 
@@ -278,15 +380,20 @@ def solicitar_confirming_folio(folio: int, request: Request, db: Session = Depen
 
 
 @router.post("/rechazar_vencimiento/folio/{folio}")
-def rechazar_vencimiento_folio(folio: int, request: Request, db: Session = Depends(get_db)):
-    proveedor_id = request.session.get("proveedor_id")
+def rechazar_vencimiento_folio(
+    folio: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    proveedor_id = proveedor.id
     factura = (
         db.query(FacturaDB)
         .filter(FacturaDB.folio == folio, FacturaDB.proveedor_id == proveedor_id)
         .first()
     )
-    if factura and factura.estado_dte == "Confirmada por pagador":
-        factura.estado_dte = "Vencimiento rechazado por proveedor"
+    if factura and puede_transicionar(factura.estado_dte, EstadoDTE.VENCIMIENTO_RECHAZADO):
+        transicionar(factura, EstadoDTE.VENCIMIENTO_RECHAZADO)
         db.commit()
 
     return RedirectResponse("/proveedor/facturas", 303)
@@ -296,17 +403,16 @@ def rechazar_vencimiento_folio(folio: int, request: Request, db: Session = Depen
 def ver_ofertas_factura(
     factura_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
 ):
-    prov_id = request.session.get("proveedor_id")
-    if not prov_id:
-        return RedirectResponse("/proveedor/login", 303)
+    prov_id = proveedor.id
 
     factura = db.query(FacturaDB).get(factura_id)
     if not factura or factura.proveedor_id != prov_id:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
 
-    if factura.estado_dte != "Confirming solicitado":
+    if factura.estado_dte != EstadoDTE.CONFIRMING_SOLICITADO:
         raise HTTPException(status_code=400, detail="La factura ya fue adjudicada o aún no solicitada")
 
     # 🔧 Mejora: Trae el financiador y su fondo directamente
@@ -332,10 +438,13 @@ def ver_ofertas_factura(
 
 
 @router.post("/aceptar-oferta/{oferta_id}")
-def aceptar_oferta(oferta_id: int, request: Request, db: Session = Depends(get_db)):
-    prov_id = request.session.get("proveedor_id")
-    if not prov_id:
-        return RedirectResponse("/proveedor/login", 303)
+def aceptar_oferta(
+    oferta_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    prov_id = proveedor.id
 
     oferta = db.query(OfertaFinanciamiento).get(oferta_id)
     if not oferta:
@@ -344,6 +453,8 @@ def aceptar_oferta(oferta_id: int, request: Request, db: Session = Depends(get_d
     factura = oferta.factura
     if factura.proveedor_id != prov_id:
         raise HTTPException(status_code=403, detail="No autorizado")
+    if not puede_transicionar(factura.estado_dte, EstadoDTE.CONFIRMING_ADJUDICADO):
+        raise HTTPException(status_code=400, detail="La factura ya fue adjudicada o aún no solicitada")
 
     oferta.estado = "Adjudicada"
 
@@ -355,34 +466,31 @@ def aceptar_oferta(oferta_id: int, request: Request, db: Session = Depends(get_d
     )
 
     factura.financiador_adjudicado = oferta.financiador_id
-    factura.estado_dte = "Confirming adjudicado"
+    transicionar(factura, EstadoDTE.CONFIRMING_ADJUDICADO)
     db.commit()
 
     return RedirectResponse("/proveedor/facturas?msg=oferta_ok", 303)
 
 @router.get("/importar_sii_facturas")
 @router.post("/importar_sii_facturas")
-def importar_facturas_sii(request: Request, db: Session = Depends(get_db)):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse("/proveedor/login", 303)
-
-    proveedor = db.query(Proveedor).get(proveedor_id)
-    if not proveedor:
-        return RedirectResponse("/proveedor/login", 303)
+def importar_facturas_sii(
+    request: Request,
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
+):
+    proveedor_id = proveedor.id
 
     # RUT completo y base
     rut_completo = proveedor.rut.replace(".", "").replace("-", "")  # Ej: 762623706
     rut_base = rut_completo[:-1]  # Ej: 76262370 (sin dígito verificador)
 
-    periodo = datetime.now().strftime("%Y-%m")
-    json_path = f"selenium_scripts/facturas_sii/data/detalle_{rut_base}_{periodo}.json"
+    # El scraper o la sincronización nocturna (sincronizacion_sii.py) dejan el detalle en disco
+    json_path = importacion_sii.ruta_detalle(rut_base, datetime.now().strftime("%Y-%m"))
 
-    print(f"🧪 Importando desde JSON: {json_path}")
-    print(f"Proveedor logeado: {proveedor.nombre} (RUT original: {proveedor.rut})")
+    logger.info("Importando detalle SII %s para %s (RUT %s)", json_path, proveedor.nombre, proveedor.rut)
 
     if not os.path.exists(json_path):
-        print("❌ No existe el archivo JSON esperado")
+        logger.warning("No existe el detalle SII esperado: %s", json_path)
         return templates.TemplateResponse("facturas.html", {
             "request": request,
             "errores": [f"No se encontró el archivo {json_path}"],
@@ -390,90 +498,37 @@ def importar_facturas_sii(request: Request, db: Session = Depends(get_db)):
             "proveedor_nombre": proveedor.nombre
         })
 
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        facturas_data = json.load(f)
-
-    print(f"📄 JSON cargado correctamente. Total facturas encontradas: {len(facturas_data)}")
-
-    errores = []
-    nuevas_facturas = []
-    facturas_descartadas = []
-
-    for d in facturas_data:
-        if not isinstance(d, dict):
-            errores.append(f"Entrada inválida ignorada: {d}")
-            continue
-
-        # 💣 Filtro: excluir facturas con forma de pago "Contado"
-        if d.get("detFormaPagoLeyenda", "").strip().lower() == "contado":
-            continue  # se omite la carga de esta factura
-
-        try:
-            folio = int(d["detNroDoc"])
-            rut_emisor = rut_base  # ← obligatorio: rut base sin DV, ya validado
-            rut_receptor = f"{d['detRutDoc']}{d['detDvDoc']}"  # ← pagador con DV
-
-            # Validación: solo subir si el proveedor logeado es el emisor
-            if rut_base != proveedor.rut[:-1]:
-                errores.append(f"⚠️ RUT emisor {rut_base} no coincide con proveedor logeado ({proveedor.rut})")
-                continue
-
-            duplicada = db.query(FacturaDB).filter_by(
-                rut_emisor=rut_emisor, rut_receptor=rut_receptor, folio=folio
-            ).first()
-            if duplicada:
-                errores.append(f"Factura duplicada folio {folio}")
-                continue
-
-            factura = FacturaDB(
-                rut_emisor=rut_emisor,
-                rut_receptor=rut_receptor,
-                tipo_dte=str(d["detTipoDoc"]),
-                folio=folio,
-                monto=int(d["detMntTotal"]),
-                razon_social_emisor=proveedor.nombre,
-                razon_social_receptor=d.get("detRznSoc", "Desconocido"),
-                fecha_emision=datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
-                fecha_vencimiento=datetime.strptime(d["detFecRecepcion"], "%d/%m/%Y %H:%M:%S").date()
-                    if d.get("detFecRecepcion") else datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
-                fecha_vencimiento_original=datetime.strptime(d["detFchDoc"], "%d/%m/%Y").date(),
-                estado_dte="Cargada",
-                confirming_solicitado=False,
-                origen_confirmacion="SII",
-                proveedor_id=proveedor_id
-            )
-            db.add(factura)
-            nuevas_facturas.append(factura)
-
-        except Exception as e:
-            errores.append(f"Error en folio {d.get('detNroDoc', 'desconocido')}: {e}")
-            print(f"❗ Error en folio {d.get('detNroDoc')}: {e}")
-
-    db.commit()
+    try:
+        resumen = importacion_sii.importar(db, json_path, proveedor)
+    except ValueError as e:   # JSON mal formado o cortado
+        logger.warning("Detalle SII ilegible %s: %s", json_path, e)
+        resumen = None
+        errores = [f"No se pudo leer {json_path}: {e}"]
+    else:
+        errores = resumen.detalle_errores
+        if resumen.errores + resumen.rechazadas + resumen.duplicadas > len(errores):
+            errores.append(f"… y {resumen.errores + resumen.rechazadas + resumen.duplicadas - len(errores):,} más")
 
     facturas = db.query(FacturaDB).filter(FacturaDB.proveedor_id == proveedor_id).all()
 
-    print(f"✅ Facturas nuevas agregadas: {len(nuevas_facturas)}")
-    print(f"📊 Total facturas en DB para este proveedor: {len(facturas)}")
-
     return templates.TemplateResponse("facturas.html", {
         "request": request,
         "facturas": facturas,
         "errores": errores or None,
         "proveedor_nombre": proveedor.nombre,
-        "facturas_descartadas": facturas_descartadas if facturas_descartadas else None
-    })   
+        "facturas_descartadas": resumen.detalle_descartadas if resumen and resumen.descartadas else None,
+        "descartadas_total": resumen.descartadas if resumen else 0,
+    })
+
 
 @router.get("/ofertas-folio/{folio}")
 def ver_ofertas_factura_por_folio(
     folio: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    proveedor: Proveedor = Depends(proveedor_actual)
 ):
-    proveedor_id = request.session.get("proveedor_id")
-    if not proveedor_id:
-        return RedirectResponse("/proveedor/login", 303)
+    proveedor_id = proveedor.id
 
     # Buscar la factura por folio Y proveedor logeado
     factura = (
@@ -485,7 +540,7 @@ def ver_ofertas_factura_por_folio(
     if not factura:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
 
-    if factura.estado_dte != "Confirming solicitado":
+    if factura.estado_dte != EstadoDTE.CONFIRMING_SOLICITADO:
         raise HTTPException(status_code=400, detail="La factura no está habilitada para ver ofertas")
 
     ofertas = (
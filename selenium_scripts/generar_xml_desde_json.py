@@ -1,9 +1,20 @@
 import os
+import sys
 import json
 import zipfile
-from xml.etree.ElementTree import Element, SubElement, ElementTree
 from datetime import datetime
 
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+# La BD de la app (treds.db en la raíz), aunque el script se corra desde selenium_scripts/
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(RAIZ, 'treds.db')}")
+
+from sqlalchemy import func
+
+from database import SessionLocal
+from models import Proveedor
+from parseo_dte import RegistroDTE, escribir_dte, leer_dte
+
 # Parámetros base
 RUT = "76262370"
 PERIODO = "2025-07"
@@ -11,6 +22,61 @@ json_path = f"facturas_sii/data/detalle_{RUT}_{PERIODO}.json"
 output_folder = f"descargadas_sii_{RUT}"
 zip_name = f"facturas_sii_{RUT}.zip"
 
+
+def fecha(texto):
+    # El detalle del SII trae dd/mm/aaaa (a veces con hora); el formato antiguo, ISO
+    texto = texto.split(" ")[0]
+    formato = "%d/%m/%Y" if "/" in texto else "%Y-%m-%d"
+    return datetime.strptime(texto, formato).date()
+
+
+def proveedor_emisor(rut):
+    """El proveedor del RUT (sin DV) en la BD: la subida compara RUTEmisor con Proveedor.rut
+    tal cual está guardado, con o sin puntos y guion."""
+    with SessionLocal() as db:
+        normalizado = func.replace(func.replace(Proveedor.rut, ".", ""), "-", "")
+        proveedor = db.query(Proveedor).filter(normalizado.like(f"{rut}_")).first()   # _ = el DV
+    if proveedor is None:
+        raise SystemExit(f"No hay un proveedor con RUT {rut} en la BD: los XML no se podrían subir")
+    return proveedor
+
+
+def registros(data):
+    if isinstance(data, list):
+        # Formato actual: lista de "det*" como la que lee /proveedor/importar_sii_facturas
+        proveedor = proveedor_emisor(RUT)
+        for d in data:
+            emision = fecha(d["detFchDoc"])
+            # Como importacion_sii.fila_sii: vence el día de recepción (detFecRecepcion trae hora)
+            recepcion = d.get("detFecRecepcion")
+            yield RegistroDTE(
+                folio=int(d["detNroDoc"]),
+                rut_emisor=proveedor.rut,
+                rut_receptor=f'{d["detRutDoc"]}-{d["detDvDoc"]}',
+                tipo_dte=str(d.get("detTipoDoc", 33)),
+                monto=int(d["detMntTotal"]),
+                razon_social_emisor=proveedor.nombre,
+                razon_social_receptor=d.get("detRznSoc", "Desconocido"),
+                fecha_emision=emision,
+                fecha_vencimiento=fecha(recepcion) if recepcion else emision,
+            )
+        return
+
+    for factura in data.get("dataResp", {}).get("detalles", []):
+        emision = fecha(factura.get("fechaEmisionA", "2025-07-01"))
+        yield RegistroDTE(
+            folio=int(factura["folio"]),
+            rut_emisor=factura["rutEmisor"],
+            rut_receptor=f'{factura["rutReceptor"]}-{factura["dvReceptor"]}',
+            tipo_dte="33",
+            monto=int(factura["mntTotal"]),
+            razon_social_emisor=factura.get("rznSocEmisor", "Desconocido"),
+            razon_social_receptor=factura.get("rznSocRecep", "Desconocido"),
+            fecha_emision=emision,
+            fecha_vencimiento=emision,
+        )
+
+
 # Crear carpeta si no existe
 os.makedirs(output_folder, exist_ok=True)
 
@@ -18,40 +84,21 @@ os.makedirs(output_folder, exist_ok=True)
 with open(json_path, "r", encoding="utf-8") as f:
     data = json.load(f)
 
-facturas = data.get("dataResp", {}).get("detalles", [])
-
-for factura in facturas:
-    folio = str(factura["folio"])
-    fecha = factura.get("fechaEmisionA", "2025-07-01")
-    monto = str(factura["mntTotal"])
-    rut_emisor = factura["rutEmisor"]
-    rut_receptor = f'{factura["rutReceptor"]}-{factura["dvReceptor"]}'
-    rzn_emisor = factura.get("rznSocEmisor", "Desconocido")
-    rzn_receptor = factura.get("rznSocRecep", "Desconocido")
-
-    # Generar XML básico
-    dte = Element("DTE")
-    documento = SubElement(dte, "Documento")
-    SubElement(documento, "TipoDTE").text = "33"
-    SubElement(documento, "Folio").text = folio
-    SubElement(documento, "FchEmis").text = fecha
-    SubElement(documento, "FchVenc").text = fecha
-    SubElement(documento, "RUTEmisor").text = rut_emisor
-    SubElement(documento, "RUTRecep").text = rut_receptor
-    SubElement(documento, "RznSoc").text = rzn_emisor
-    SubElement(documento, "RznSocRecep").text = rzn_receptor
-    SubElement(documento, "MntTotal").text = monto
-
-    # Guardar XML
-    xml_path = os.path.join(output_folder, f"factura_{folio}.xml")
-    tree = ElementTree(dte)
-    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-
-# Crear ZIP
-with zipfile.ZipFile(zip_name, "w") as zipf:
-    for filename in os.listdir(output_folder):
-        if filename.endswith(".xml"):
-            zipf.write(os.path.join(output_folder, filename), arcname=filename)
-
-print(f"✅ Se generaron {len(facturas)} archivos XML en {output_folder}")
-print(f"📦 ZIP creado: {zip_name}")
\ No newline at end of file
+# Generar XML con el mismo módulo que los lee al subirlos (parseo_dte)
+generados = []
+for registro in registros(data):
+    contenido = escribir_dte(registro)
+    if leer_dte(contenido) != registro:
+        raise ValueError(f"El XML del folio {registro.folio} no se lee igual")
+    nombre = f"factura_{registro.folio}.xml"
+    with open(os.path.join(output_folder, nombre), "wb") as f:
+        f.write(contenido)
+    generados.append(nombre)
+
+# Crear ZIP solo con los XML de esta corrida
+with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zipf:
+    for nombre in generados:
+        zipf.write(os.path.join(output_folder, nombre), arcname=nombre)
+
+print(f"✅ Se generaron {len(generados)} archivos XML en {output_folder}")
+print(f"📦 ZIP creado: {zip_name}")
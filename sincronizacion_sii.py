@@ -0,0 +1,241 @@
+# sincronizacion_sii.py
+# Sincronización programada con el SII: para cada proveedor con sesión SII guardada
+# (Proveedor.cookies_sii_path, renovada con credenciales_sii) descarga el detalle de ventas de cada periodo pendiente y lo
+# importa con importacion_sii, sin que nadie corra selenium_scripts/detalle_dte.py a mano.
+#
+# La marca de agua es una fila de sincronizaciones_sii por proveedor y periodo
+# (models.SincronizacionSII):
+#   • un periodo ya cerrado (sincronizado bien después de SII_SINC_GRACIA_DIAS del mes
+#     siguiente) no se vuelve a consultar;
+#   • si el SII devuelve la misma cantidad de documentos que la última vez, no se importa;
+#   • lo que sí se importa pasa por ingesta.ingerir, que deja afuera las facturas que ya están.
+# Un proveedor sin marcas parte SII_SINC_MESES periodos atrás.
+#
+# Los proveedores se reparten en SII_SINC_CONCURRENCIA hilos; cada uno recorre sus periodos
+# en orden y se detiene en el primer error (sesión vencida, SII caído), que queda en la marca.
+#
+#   SII_SINC_HORA=02:30                      → corre cada noche dentro del servidor (main.py)
+#   python -m sincronizacion_sii             → una pasada ahora (cron, o a mano)
+#   python -m sincronizacion_sii --proveedor 12 --proveedor 40
+import argparse
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+import importacion_sii
+from cliente_sii import ErrorSII
+from credenciales_sii import obtener_credenciales
+from database import SessionLocal
+from metricas import SII_PERIODOS
+from models import Proveedor, SincronizacionSII
+from navegadores_sii import cerrar_navegadores
+
+load_dotenv()
+
+logger = logging.getLogger("treds.sii")
+
+SII_SINC_HORA = os.getenv("SII_SINC_HORA", "")                       # "HH:MM"; vacío = sin programación
+SII_SINC_CONCURRENCIA = int(os.getenv("SII_SINC_CONCURRENCIA", "4"))   # proveedores a la vez
+SII_SINC_MESES = int(os.getenv("SII_SINC_MESES", "12"))                # periodos hacia atrás la primera vez
+SII_SINC_GRACIA_DIAS = int(os.getenv("SII_SINC_GRACIA_DIAS", "10"))    # días del mes siguiente antes de cerrar
+
+OK = "ok"   # estado de la marca (o ERROR)
+
+# Resultado por periodo (etiqueta "resultado" de treds_sii_sincronizacion_periodos_total)
+IMPORTADO = "importado"
+SIN_CAMBIOS = "sin_cambios"
+ERROR = "error"
+
+# (rut, dv, periodo, cookies, carpeta) → (ruta del detalle, documentos)
+Descarga = Callable[[str, str, str, list, str], Tuple[str, int]]
+
+
+# ─── Periodos ───────────────────────────────────────────────────────────────
+def _mes_siguiente(periodo: str) -> str:
+    anho, mes = map(int, periodo.split("-"))
+    return f"{anho + mes // 12}-{mes % 12 + 1:02d}"
+
+
+def _meses_atras(fecha: date, meses: int) -> str:
+    indice = fecha.year * 12 + fecha.month - 1 - meses
+    return f"{indice // 12}-{indice % 12 + 1:02d}"
+
+
+def cerrado(periodo: str, momento: datetime) -> bool:
+    """Un periodo está cerrado si se sincronizó pasados los días de gracia del mes siguiente:
+    para entonces ya no deberían aparecer documentos nuevos."""
+    siguiente = datetime.strptime(_mes_siguiente(periodo), "%Y-%m")
+    return momento >= siguiente + timedelta(days=SII_SINC_GRACIA_DIAS)
+
+
+def periodos_pendientes(marcas: Dict[str, SincronizacionSII], hoy: date) -> List[str]:
+    """Periodos a consultar, del más antiguo al actual, saltando los cerrados."""
+    actual = f"{hoy:%Y-%m}"
+    periodo = min(marcas) if marcas else _meses_atras(hoy, SII_SINC_MESES - 1)
+    pendientes = []
+    while periodo <= actual:
+        if not (periodo in marcas and marcas[periodo].cerrado):
+            pendientes.append(periodo)
+        periodo = _mes_siguiente(periodo)
+    return pendientes
+
+
+# ─── Sincronización ─────────────────────────────────────────────────────────
+def descargar_sii(rut: str, dv: str, periodo: str, cookies: list, carpeta: str) -> Tuple[str, int]:
+    # Import diferido: detalle_dte solo hace falta si la sincronización corre. El token sale del
+    # pool de navegadores y la consulta HTTP del cliente compartido; ambos quedan medidos ahí.
+    from selenium_scripts import detalle_dte
+
+    return detalle_dte.descargar_detalle(rut, dv, periodo, cookies, carpeta=carpeta)
+
+
+def sincronizar_proveedor(proveedor_id: int, hoy: date, descargar: Descarga = descargar_sii,
+                          parar: Optional[threading.Event] = None) -> Counter:
+    """Recorre los periodos pendientes del proveedor y actualiza su marca de cada uno."""
+    conteo = Counter()
+    db = SessionLocal()
+    try:
+        proveedor = db.get(Proveedor, proveedor_id)
+        rut_completo = proveedor.rut.replace(".", "").replace("-", "").upper()
+        rut, dv = rut_completo[:-1], rut_completo[-1]
+        credenciales = obtener_credenciales()
+        marcas = {m.periodo: m for m in db.scalars(
+            select(SincronizacionSII).where(SincronizacionSII.proveedor_id == proveedor_id))}
+        for periodo in periodos_pendientes(marcas, hoy):
+            if parar is not None and parar.is_set():
+                break
+            marca = marcas.get(periodo) or SincronizacionSII(proveedor_id=proveedor_id, rut=rut, periodo=periodo,
+                                                             nuevas=0)
+            momento = datetime.now()
+            try:
+                # Por periodo: si la sesión está por vencer se renueva antes de seguir
+                cookies = credenciales.cookies(proveedor)
+                ruta, documentos = descargar(rut, dv, periodo, cookies, importacion_sii.SII_DETALLE_DIR)
+                if marca.estado == OK and marca.documentos == documentos:
+                    resultado = SIN_CAMBIOS
+                else:
+                    marca.nuevas = (marca.nuevas or 0) + importacion_sii.importar(db, ruta, proveedor).nuevas
+                    resultado = IMPORTADO
+                marca.estado, marca.documentos, marca.error = OK, documentos, None
+                marca.cerrado = cerrado(periodo, momento)
+            except Exception as e:
+                db.rollback()
+                if isinstance(e, ErrorSII):
+                    credenciales.invalidar(rut)   # la próxima vez se valida antes de usarla
+                marca.estado, marca.error = ERROR, f"{e.__class__.__name__}: {e}"[:500]
+                resultado = ERROR
+            marca.sincronizado = momento
+            db.add(marca)
+            db.commit()
+            SII_PERIODOS.inc(resultado=resultado)
+            conteo[resultado] += 1
+            if resultado == ERROR:
+                # Sesión vencida o SII caído: los periodos siguientes fallarían igual
+                logger.warning("Sincronización SII: proveedor %s periodo %s falló: %s", proveedor_id, periodo,
+                               marca.error)
+                break
+    finally:
+        db.close()
+    return conteo
+
+
+def sincronizar_todos(proveedor_ids: Optional[Iterable[int]] = None, hoy: Optional[date] = None,
+                      descargar: Descarga = descargar_sii, parar: Optional[threading.Event] = None) -> Counter:
+    """Una pasada por todos los proveedores con sesión SII (o los indicados)."""
+    hoy = hoy or date.today()
+    consulta = select(Proveedor.id).where(Proveedor.cookies_sii_path.isnot(None), Proveedor.cookies_sii_path != "")
+    if proveedor_ids is not None:
+        consulta = consulta.where(Proveedor.id.in_(list(proveedor_ids)))
+    with SessionLocal() as db:
+        ids = db.scalars(consulta.order_by(Proveedor.id)).all()
+
+    def uno(proveedor_id: int) -> Counter:
+        try:
+            return sincronizar_proveedor(proveedor_id, hoy, descargar, parar)
+        except Exception:
+            logger.exception("Sincronización SII: falló el proveedor %s", proveedor_id)
+            SII_PERIODOS.inc(resultado=ERROR)
+            return Counter({ERROR: 1})
+
+    total = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, SII_SINC_CONCURRENCIA), thread_name_prefix="sii-sinc") as pool:
+        for conteo in pool.map(uno, ids):
+            total.update(conteo)
+    logger.info("Sincronización SII: %d proveedores; periodos importados=%d, sin cambios=%d, con error=%d",
+                len(ids), total[IMPORTADO], total[SIN_CAMBIOS], total[ERROR])
+    return total
+
+
+# ─── Programación diaria ────────────────────────────────────────────────────
+class ProgramadorSII(threading.Thread):
+    """Corre sincronizar_todos una vez al día a la hora `hora` ("HH:MM", hora local)."""
+
+    def __init__(self, hora: str = SII_SINC_HORA):
+        super().__init__(name="sii-programador", daemon=True)
+        self.hora = datetime.strptime(hora, "%H:%M").time()
+        self._detener = threading.Event()
+
+    def proxima(self, ahora: datetime) -> datetime:
+        siguiente = datetime.combine(ahora.date(), self.hora)
+        return siguiente if siguiente > ahora else siguiente + timedelta(days=1)
+
+    def run(self):
+        while True:
+            ahora = datetime.now()
+            if self._detener.wait((self.proxima(ahora) - ahora).total_seconds()):
+                return
+            try:
+                sincronizar_todos(parar=self._detener)
+            except Exception:
+                logger.exception("Falló la sincronización programada con el SII")
+            finally:
+                cerrar_navegadores()   # hasta la próxima pasada no se usan: se libera su memoria
+
+    def detener(self):
+        # Los proveedores en curso terminan el periodo que están importando y no siguen
+        self._detener.set()
+        self.join(timeout=30)
+
+
+_programador: Optional[ProgramadorSII] = None
+
+
+def iniciar_programador():
+    """Con SII_SINC_HORA definido. Con varios procesos (uvicorn --workers), definirlo en uno
+    solo o usar `python -m sincronizacion_sii` desde cron."""
+    global _programador
+    if not SII_SINC_HORA or _programador:
+        return
+    _programador = ProgramadorSII()
+    _programador.start()
+    logger.info("Sincronización SII programada todos los días a las %s", SII_SINC_HORA)
+
+
+def detener_programador():
+    global _programador
+    if _programador:
+        _programador.detener()
+        _programador = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza con el SII los periodos pendientes de cada proveedor")
+    parser.add_argument("--proveedor", type=int, action="append", help="id de proveedor (se puede repetir)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        total = sincronizar_todos(args.proveedor)
+    finally:
+        cerrar_navegadores()
+    print(f"✅ Periodos importados: {total[IMPORTADO]}  sin cambios: {total[SIN_CAMBIOS]}  con error: {total[ERROR]}")
+
+
+if __name__ == "__main__":
+    main()
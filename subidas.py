@@ -0,0 +1,219 @@
+# subidas.py
+# Subidas por partes, reanudables, para ZIP muy grandes: el archivo nunca pasa entero por
+# memoria, cada parte se escribe a disco a medida que llega.
+#
+#   POST /proveedor/subidas                    nombre, tamano, sha256 → id y tamaño de parte
+#   PUT  /proveedor/subidas/{id}/partes/{n}    cuerpo = bytes de la parte n (desde 0)
+#   GET  /proveedor/subidas/{id}               partes recibidas y faltantes (para reanudar)
+#   POST /proveedor/subidas/{id}/completar     verifica el sha256 y encola la ingesta
+#
+# Cada subida es una carpeta en SUBIDAS_DIR: subida.json con los metadatos, "datos" con el
+# archivo (cada parte se escribe en su offset, no hay que armar nada al final) y una marca
+# parte_<n> por cada parte recibida completa. El estado vive en disco: una transferencia
+# cortada, o un reinicio del servidor, se retoma pidiendo el estado y mandando lo que falta.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, List, Optional
+
+from dotenv import load_dotenv
+
+import almacen
+
+load_dotenv()
+
+logger = logging.getLogger("treds.subidas")
+
+SUBIDAS_DIR = os.getenv("SUBIDAS_DIR", os.path.join("uploads", "partes"))
+SUBIDA_MAX_BYTES = int(os.getenv("SUBIDA_MAX_BYTES", str(2 * 1024 ** 3)))       # 2 GiB por archivo
+SUBIDA_PARTE_BYTES = int(os.getenv("SUBIDA_PARTE_BYTES", str(8 * 1024 ** 2)))   # 8 MiB por parte
+SUBIDAS_RETENCION = int(os.getenv("SUBIDAS_RETENCION", "86400"))               # segundos sin completar
+_BUFFER = 1024 * 1024   # bytes acumulados antes de cada escritura a disco
+_ID = re.compile(r"[0-9a-f]{32}")
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+class SubidaInvalida(ValueError):
+    pass
+
+
+class SubidaNoEncontrada(LookupError):
+    pass
+
+
+class Subida:
+    """Una subida en curso, leída de su carpeta en SUBIDAS_DIR."""
+
+    def __init__(self, id: str, proveedor_id: int, nombre: str, tamano: int, sha256: str,
+                 tamano_parte: int, creado: float):
+        self.id = id
+        self.proveedor_id = proveedor_id
+        self.nombre = nombre
+        self.tamano = tamano
+        self.sha256 = sha256
+        self.tamano_parte = tamano_parte
+        self.creado = creado
+
+    @property
+    def carpeta(self) -> str:
+        return os.path.join(SUBIDAS_DIR, self.id)
+
+    @property
+    def datos(self) -> str:
+        return os.path.join(self.carpeta, "datos")
+
+    @property
+    def partes(self) -> int:
+        return max(1, -(-self.tamano // self.tamano_parte))
+
+    def tamano_de(self, n: int) -> int:
+        return min(self.tamano_parte, self.tamano - n * self.tamano_parte)
+
+    def recibidas(self) -> List[int]:
+        return sorted(int(nombre[len("parte_"):]) for nombre in os.listdir(self.carpeta)
+                      if nombre.startswith("parte_"))
+
+    def como_dict(self) -> dict:
+        recibidas = self.recibidas()
+        faltantes = sorted(set(range(self.partes)) - set(recibidas))
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "tamano": self.tamano,
+            "tamano_parte": self.tamano_parte,
+            "partes": self.partes,
+            "recibidas": recibidas,
+            "faltantes": faltantes,
+            "bytes_recibidos": sum(self.tamano_de(n) for n in recibidas),
+        }
+
+
+def _purgar() -> None:
+    limite = time.time() - SUBIDAS_RETENCION
+    for nombre in os.listdir(SUBIDAS_DIR):
+        carpeta = os.path.join(SUBIDAS_DIR, nombre)
+        try:
+            if os.path.getmtime(carpeta) < limite:
+                shutil.rmtree(carpeta)
+                logger.info("Subida %s vencida sin completar; se borra", nombre)
+        except OSError:
+            continue
+
+
+def crear(proveedor_id: int, nombre: str, tamano: int, sha256: str) -> Subida:
+    """Valida los metadatos, reserva el archivo completo (disperso) y deja la subida lista
+    para recibir partes."""
+    sha256 = sha256.strip().lower()
+    if not nombre.lower().endswith((".zip", ".xml")):
+        raise SubidaInvalida("Solo se permiten archivos XML o ZIP.")
+    if not 0 < tamano <= SUBIDA_MAX_BYTES:
+        raise SubidaInvalida(f"El tamaño debe estar entre 1 y {SUBIDA_MAX_BYTES:,} bytes")
+    if not _SHA256.fullmatch(sha256):
+        raise SubidaInvalida("sha256 debe ser el hash hexadecimal del archivo completo")
+
+    os.makedirs(SUBIDAS_DIR, exist_ok=True)
+    _purgar()
+    subida = Subida(uuid.uuid4().hex, proveedor_id, os.path.basename(nombre), tamano, sha256,
+                    SUBIDA_PARTE_BYTES, time.time())
+    os.makedirs(subida.carpeta)
+    with open(subida.datos, "wb") as datos:
+        datos.truncate(tamano)
+    with open(os.path.join(subida.carpeta, "subida.json"), "w", encoding="utf-8") as f:
+        json.dump({clave: getattr(subida, clave) for clave in
+                   ("id", "proveedor_id", "nombre", "tamano", "sha256", "tamano_parte", "creado")}, f)
+    return subida
+
+
+def cargar(subida_id: str, proveedor_id: int) -> Subida:
+    """La subida del proveedor; SubidaNoEncontrada si no existe, venció o es de otro."""
+    if not _ID.fullmatch(subida_id):
+        raise SubidaNoEncontrada(subida_id)
+    try:
+        with open(os.path.join(SUBIDAS_DIR, subida_id, "subida.json"), encoding="utf-8") as f:
+            subida = Subida(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        raise SubidaNoEncontrada(subida_id)
+    if subida.proveedor_id != proveedor_id:
+        raise SubidaNoEncontrada(subida_id)
+    return subida
+
+
+async def guardar_parte(subida: Subida, n: int, cuerpo: AsyncIterator[bytes],
+                        sha256_parte: Optional[str] = None) -> None:
+    """Escribe la parte `n` en su offset a medida que llega el cuerpo (nunca más de _BUFFER
+    en memoria) y la marca como recibida solo si llegó completa y, si viene, con el hash
+    correcto. Reenviar una parte la sobrescribe. Todo el acceso a disco va en hilos: esto
+    corre en el loop."""
+    if not 0 <= n < subida.partes:
+        raise SubidaInvalida(f"La parte debe estar entre 0 y {subida.partes - 1}")
+    marca = os.path.join(subida.carpeta, f"parte_{n}")
+    # Se va a sobrescribir: deja de contar hasta que llegue completa
+    await asyncio.to_thread(_quitar_marca, marca)
+    esperado = subida.tamano_de(n)
+    hash_parte = hashlib.sha256()
+    recibidos = 0
+    pendiente = bytearray()
+    datos = await asyncio.to_thread(_abrir_en, subida.datos, n * subida.tamano_parte)
+    try:
+        async for bloque in cuerpo:
+            recibidos += len(bloque)
+            if recibidos > esperado:
+                raise SubidaInvalida(f"La parte {n} debe pesar {esperado:,} bytes")
+            hash_parte.update(bloque)
+            pendiente += bloque
+            if len(pendiente) >= _BUFFER:
+                await asyncio.to_thread(datos.write, pendiente)
+                pendiente = bytearray()
+        if pendiente:
+            await asyncio.to_thread(datos.write, pendiente)
+    finally:
+        await asyncio.to_thread(datos.close)
+    if recibidos != esperado:
+        raise SubidaInvalida(f"La parte {n} llegó con {recibidos:,} de {esperado:,} bytes")
+    if sha256_parte and hash_parte.hexdigest() != sha256_parte.strip().lower():
+        raise SubidaInvalida(f"El sha256 de la parte {n} no coincide")
+    await asyncio.to_thread(_escribir_marca, marca, hash_parte.hexdigest())
+
+
+def _quitar_marca(marca: str) -> None:
+    if os.path.exists(marca):
+        os.remove(marca)
+
+
+def _abrir_en(ruta: str, offset: int):
+    datos = open(ruta, "r+b")
+    datos.seek(offset)
+    return datos
+
+
+def _escribir_marca(marca: str, hash_parte: str) -> None:
+    with open(marca, "w") as f:
+        f.write(hash_parte)
+
+
+def completar(subida: Subida) -> str:
+    """Verifica que estén todas las partes y el sha256 del archivo completo; lo mueve al
+    almacén por contenido (almacen.py) y devuelve esa ruta.
+
+    Si el hash no coincide no hay forma de saber qué parte vino mal: la subida se descarta
+    y hay que empezar otra. Para reintentar solo una parte, mandar X-Parte-Sha256 al subirla.
+    """
+    faltantes = subida.como_dict()["faltantes"]
+    if faltantes:
+        raise SubidaInvalida(f"Faltan {len(faltantes)} partes: {faltantes[:20]}")
+    if almacen.sha256_archivo(subida.datos) != subida.sha256:
+        descartar(subida)
+        raise SubidaInvalida("El sha256 del archivo armado no coincide; la subida se descartó")
+    ruta = almacen.guardar(subida.datos, subida.sha256)
+    descartar(subida)
+    return ruta
+
+
+def descartar(subida: Subida) -> None:
+    shutil.rmtree(subida.carpeta, ignore_errors=True)
@@ -0,0 +1,236 @@
+# trabajos.py
+# Trabajos en segundo plano dentro del mismo proceso: la ruta encola y responde al tiro
+# con el id del trabajo; uno o más hilos trabajadores los ejecutan en orden. El avance
+# (contadores y errores por archivo) se consulta por GET /proveedor/trabajos/{id} o por
+# SSE en /proveedor/trabajos/{id}/eventos.
+#
+#   trabajo = encolar("subida_xml", proveedor.id, "lote.zip", procesar_subida_xml, ruta, ...)
+#   # en la función: trabajo.sumar(parseadas=250); trabajo.agregar_errores([...])
+#
+# Los trabajos viven en memoria: un reinicio pierde los que estaban en cola. Con varios
+# workers de uvicorn, cada uno tiene su propia cola y su propio registro.
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from metricas import TRABAJOS, TRABAJOS_EN_COLA
+
+load_dotenv()
+
+logger = logging.getLogger("treds.trabajos")
+
+TRABAJOS_HILOS = int(os.getenv("TRABAJOS_HILOS", "1"))                # 1 = un solo escritor en la BD
+TRABAJOS_COLA_MAX = int(os.getenv("TRABAJOS_COLA_MAX", "100"))
+TRABAJOS_RETENCION = int(os.getenv("TRABAJOS_RETENCION", "3600"))     # segundos que se guarda un trabajo terminado
+TRABAJOS_MAX_ERRORES = 1000                                            # mensajes (y reconocidos) guardados por trabajo
+
+EN_COLA = "en_cola"
+PROCESANDO = "procesando"
+TERMINADO = "terminado"
+FALLIDO = "fallido"
+TERMINALES = (TERMINADO, FALLIDO)
+
+
+class ColaLlena(RuntimeError):
+    pass
+
+
+class Trabajo:
+    """Estado y avance de un trabajo; se actualiza desde el hilo trabajador."""
+
+    def __init__(self, tipo: str, proveedor_id: int, descripcion: str):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.proveedor_id = proveedor_id
+        self.descripcion = descripcion
+        self.estado = EN_COLA
+        self.total: Optional[int] = None
+        self.contadores = {"parseadas": 0, "insertadas": 0, "duplicadas": 0, "rechazadas": 0, "errores": 0,
+                           "omitidas": 0}
+        self.errores: List[str] = []
+        self.reconocidos: List[str] = []   # archivos que ya se habían procesado y se saltaron
+        self.etapas: Dict[str, float] = {}  # segundos por etapa (ingesta.Etapas los va sumando)
+        self.creado = time.time()
+        self.iniciado: Optional[float] = None
+        self.terminado: Optional[float] = None
+        self.version = 0   # sube con cada cambio; el SSE solo emite cuando cambia
+        self._lock = threading.Lock()
+
+    def _cambio(self, **campos) -> None:
+        with self._lock:
+            for nombre, valor in campos.items():
+                setattr(self, nombre, valor)
+            self.version += 1
+
+    def sumar(self, **contadores) -> None:
+        with self._lock:
+            for nombre, valor in contadores.items():
+                self.contadores[nombre] += valor
+            self.version += 1
+
+    def agregar_errores(self, mensajes: List[str]) -> None:
+        if not mensajes:
+            return
+        with self._lock:
+            espacio = TRABAJOS_MAX_ERRORES - len(self.errores)
+            self.errores.extend(mensajes[:max(espacio, 0)])
+            self.version += 1
+
+    def agregar_reconocidos(self, nombres: List[str]) -> None:
+        if not nombres:
+            return
+        with self._lock:
+            espacio = TRABAJOS_MAX_ERRORES - len(self.reconocidos)
+            self.reconocidos.extend(nombres[:max(espacio, 0)])
+            self.version += 1
+
+    def fijar_total(self, total: int) -> None:
+        self._cambio(total=total)
+
+    @property
+    def finalizado(self) -> bool:
+        return self.estado in TERMINALES
+
+    def como_dict(self) -> dict:
+        with self._lock:
+            fin = self.terminado or time.time()
+            return {
+                "id": self.id,
+                "tipo": self.tipo,
+                "descripcion": self.descripcion,
+                "estado": self.estado,
+                "total": self.total,
+                **self.contadores,
+                "errores_detalle": list(self.errores),
+                "reconocidos": list(self.reconocidos),
+                "segundos": round(fin - self.iniciado, 3) if self.iniciado else 0.0,
+                "etapas": {etapa: round(segundos, 3) for etapa, segundos in list(self.etapas.items())},
+                "version": self.version,
+            }
+
+
+# ─── Registro y cola ────────────────────────────────────────────────────────
+_trabajos: Dict[str, Trabajo] = {}
+_trabajos_lock = threading.Lock()
+_cola: "queue.Queue" = queue.Queue(maxsize=TRABAJOS_COLA_MAX)
+_hilos: List[threading.Thread] = []
+_hilos_lock = threading.Lock()
+_FIN = object()
+
+TRABAJOS_EN_COLA.agregar_funcion(lambda: {(): _cola.qsize()})
+
+
+def _purgar() -> None:
+    limite = time.time() - TRABAJOS_RETENCION
+    with _trabajos_lock:
+        for id_, trabajo in list(_trabajos.items()):
+            if trabajo.finalizado and trabajo.terminado < limite:
+                del _trabajos[id_]
+
+
+def obtener(trabajo_id: str, proveedor_id: Optional[int] = None) -> Optional[Trabajo]:
+    """El trabajo, o None si no existe, expiró o es de otro proveedor."""
+    with _trabajos_lock:
+        trabajo = _trabajos.get(trabajo_id)
+    if trabajo is None or (proveedor_id is not None and trabajo.proveedor_id != proveedor_id):
+        return None
+    return trabajo
+
+
+def encolar(tipo: str, proveedor_id: int, descripcion: str, funcion: Callable, *args) -> Trabajo:
+    """Registra el trabajo y lo deja en la cola: `funcion(trabajo, *args)` corre en un hilo
+    trabajador. ColaLlena si ya hay TRABAJOS_COLA_MAX esperando."""
+    iniciar_trabajadores()
+    _purgar()
+    trabajo = Trabajo(tipo, proveedor_id, descripcion)
+    with _trabajos_lock:
+        _trabajos[trabajo.id] = trabajo
+    try:
+        _cola.put_nowait((trabajo, funcion, args))
+    except queue.Full:
+        with _trabajos_lock:
+            del _trabajos[trabajo.id]
+        raise ColaLlena(f"Hay {TRABAJOS_COLA_MAX} trabajos en cola; intenta de nuevo en unos minutos")
+    TRABAJOS.inc(tipo=tipo, estado=EN_COLA)
+    return trabajo
+
+
+def _ejecutar(trabajo: Trabajo, funcion: Callable, args: tuple) -> None:
+    trabajo._cambio(estado=PROCESANDO, iniciado=time.time())
+    try:
+        funcion(trabajo, *args)
+        estado = TERMINADO
+    except Exception as e:
+        logger.exception("Trabajo %s (%s) falló", trabajo.id, trabajo.tipo)
+        trabajo.agregar_errores([f"El trabajo se interrumpió: {e.__class__.__name__}: {e}"])
+        estado = FALLIDO
+    trabajo._cambio(estado=estado, terminado=time.time())
+    TRABAJOS.inc(tipo=trabajo.tipo, estado=estado)
+
+
+def _trabajador() -> None:
+    while True:
+        item = _cola.get()
+        try:
+            if item is _FIN:
+                return
+            _ejecutar(*item)
+        finally:
+            _cola.task_done()
+
+
+def iniciar_trabajadores() -> None:
+    with _hilos_lock:
+        if _hilos:
+            return
+        for i in range(TRABAJOS_HILOS):
+            hilo = threading.Thread(target=_trabajador, name=f"trabajos-{i}", daemon=True)
+            hilo.start()
+            _hilos.append(hilo)
+
+
+def _descartar_pendientes() -> None:
+    """Vacía la cola marcando como fallidos los trabajos que no alcanzaron a empezar."""
+    fines = 0
+    while True:
+        try:
+            item = _cola.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            if item is _FIN:
+                fines += 1
+                continue
+            trabajo = item[0]
+            trabajo.agregar_errores(["El servidor se detuvo antes de procesar el trabajo; súbelo de nuevo"])
+            trabajo._cambio(estado=FALLIDO, terminado=time.time())
+            TRABAJOS.inc(tipo=trabajo.tipo, estado=FALLIDO)
+        finally:
+            _cola.task_done()
+    for _ in range(fines):
+        _cola.put_nowait(_FIN)
+
+
+def detener_trabajadores(timeout: float = 30) -> None:
+    """Los hilos terminan lo que ya estaba en la cola y se detienen (espera hasta `timeout`
+    por cada uno). Si la cola sigue llena después de `timeout`, los trabajos pendientes
+    se marcan fallidos para que el aviso de fin entre."""
+    with _hilos_lock:
+        for _ in _hilos:
+            while True:
+                try:
+                    _cola.put(_FIN, timeout=timeout)
+                    break
+                except queue.Full:
+                    logger.warning("Cola de trabajos llena al detener: %d pendientes se marcan fallidos",
+                                   _cola.qsize())
+                    _descartar_pendientes()
+        for hilo in _hilos:
+            hilo.join(timeout=timeout)
+        _hilos.clear()